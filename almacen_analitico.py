@@ -0,0 +1,349 @@
+# ============================================================================
+# almacen_analitico.py - Copia analítica local (DuckDB) del historial completo
+# usuarios_tiktok, reportes_contratos y resumen_contratos se copian a un
+# archivo DuckDB de forma incremental por fecha_datos / periodo: cada
+# sincronización vuelve a leer el último corte local (pudo re-subirse) y todo
+# lo posterior, y salta las tablas cuya versión (capa_datos.obtener_version_tabla)
+# no cambió. Las preguntas entre periodos y contratos (top agencias en 6
+# meses, tendencia de cumplimiento) corren en SQL local en milisegundos en
+# lugar de paginar PostgREST.
+#
+# Requiere duckdb (opcional; sin él el panel admin solo muestra un aviso):
+#   pip install duckdb
+#
+# Uso:
+#   python almacen_analitico.py                       # sincroniza (incremental)
+#   python almacen_analitico.py --completo            # reconstruye desde cero
+#   python almacen_analitico.py --sql "select count(*) from usuarios_tiktok"
+#   ALMACEN_ANALITICO=/datos/analitico.duckdb streamlit run app.py
+#
+# DuckDB admite un solo proceso escritor por archivo: con la app corriendo,
+# sincronizar desde el panel admin (o apuntar la CLI a otro archivo).
+# ============================================================================
+
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+
+try:
+    import duckdb
+except ImportError:  # dependencia opcional
+    duckdb = None
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+ALMACEN_RUTA = os.getenv("ALMACEN_ANALITICO", os.path.join(RAIZ, ".almacen", "analitico.duckdb"))
+LOTE_LECTURA = 1000   # filas por página de PostgREST
+
+# Tablas copiadas -> columna de corte (la misma de capa_datos.COLUMNA_FECHA_TABLA)
+TABLAS_ALMACEN = {
+    'usuarios_tiktok': 'fecha_datos',
+    'reportes_contratos': 'periodo',
+    'resumen_contratos': 'periodo',
+}
+
+# Desempate único tras la columna de corte: sin él, la paginación por offset
+# puede repetir o saltar filas del mismo corte entre páginas
+DESEMPATE_ALMACEN = {
+    'usuarios_tiktok': 'id',
+    'reportes_contratos': 'id',
+    'resumen_contratos': 'contrato',   # una fila por (contrato, periodo)
+}
+
+def disponible():
+    """True si duckdb está instalado"""
+    return duckdb is not None
+
+# ============================================================================
+# PREPARACIÓN DE LOTES
+# ============================================================================
+
+def preparar_lote(filas, columna_fecha):
+    """
+    Filas de PostgREST -> DataFrame con tipos estables entre lotes: la columna
+    de corte como fecha, enteros como DOUBLE (un lote con solo enteros no fija
+    el tipo de una columna con decimales), JSON como texto y columnas sin
+    valores como texto.
+    """
+    df = pd.DataFrame(filas)
+    for columna in df.columns:
+        serie = df[columna]
+        if columna == columna_fecha:
+            df[columna] = pd.to_datetime(serie, errors='coerce').dt.date
+        elif pd.api.types.is_bool_dtype(serie):
+            continue
+        elif pd.api.types.is_integer_dtype(serie):
+            df[columna] = serie.astype('float64')
+        elif serie.dtype == object:
+            no_nulos = serie.dropna()
+            if no_nulos.empty:
+                df[columna] = serie.astype('string')
+            elif no_nulos.map(lambda v: isinstance(v, (dict, list))).any():
+                df[columna] = serie.map(lambda v: json.dumps(v, ensure_ascii=False) if isinstance(v, (dict, list)) else v)
+            elif no_nulos.map(lambda v: isinstance(v, (int, float))).all():
+                df[columna] = pd.to_numeric(serie, errors='coerce').astype('float64')
+    return df
+
+# ============================================================================
+# ALMACÉN
+# ============================================================================
+
+class AlmacenAnalitico:
+    """
+    Archivo DuckDB con una conexión por proceso; cada hilo usa su propio
+    cursor. Una sola sincronización a la vez; las lecturas ven la última
+    sincronización confirmada (cada tabla se reemplaza en una transacción).
+    """
+
+    def __init__(self, ruta=ALMACEN_RUTA):
+        if duckdb is None:
+            raise RuntimeError('Falta duckdb: pip install duckdb')
+        os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+        self.ruta = ruta
+        self.conexion = duckdb.connect(ruta)
+        self.lock_sync = threading.Lock()
+        self.conexion.execute("""
+            create table if not exists sincronizaciones (
+                tabla        varchar primary key,
+                marca        date,
+                version      varchar,
+                filas        bigint,
+                leidas       bigint,
+                segundos     double,
+                sincronizado timestamp
+            )
+        """)
+
+    # ---------------------------------------------------------------- lectura
+
+    def consultar(self, sql, parametros=None):
+        """SQL sobre la copia local -> DataFrame (cursor propio: seguro entre hilos)"""
+        cursor = self.conexion.cursor()
+        try:
+            return cursor.execute(sql, parametros or []).df()
+        finally:
+            cursor.close()
+
+    def tablas_presentes(self):
+        """Tablas de TABLAS_ALMACEN que ya tienen copia local"""
+        existentes = set(self.consultar("select table_name from information_schema.tables")['table_name'])
+        return [t for t in TABLAS_ALMACEN if t in existentes]
+
+    def estado(self):
+        """Una fila por tabla: marca (último corte), filas, última sincronización"""
+        return self.consultar("select * from sincronizaciones order by tabla")
+
+    def _control(self, tabla):
+        """Marca y versión de la última sincronización de la tabla (None si nunca)"""
+        filas = self.consultar("select marca, version from sincronizaciones where tabla = ?", [tabla])
+        if filas.empty:
+            return None
+        control = filas.iloc[0].to_dict()
+        control['marca'] = None if pd.isna(control['marca']) else pd.Timestamp(control['marca']).date()
+        return control
+
+    # ---------------------------------------------------------- sincronización
+
+    def _asegurar_columnas(self, cursor, tabla, lote):
+        """Crea la tabla con el primer lote; columnas nuevas en Supabase se agregan"""
+        cursor.register('_lote', lote)
+        try:
+            existe = cursor.execute(
+                "select count(*) from information_schema.tables where table_name = ?", [tabla]
+            ).fetchone()[0]
+            if not existe:
+                cursor.execute(f'create table "{tabla}" as select * from _lote limit 0')
+                return
+            actuales = {f[0] for f in cursor.execute(f'describe "{tabla}"').fetchall()}
+            for nombre, tipo, *_ in cursor.execute("describe select * from _lote").fetchall():
+                if nombre not in actuales:
+                    cursor.execute(f'alter table "{tabla}" add column "{nombre}" {tipo}')
+        finally:
+            cursor.unregister('_lote')
+
+    def sincronizar_tabla(self, app, tabla, completo=False):
+        """
+        Copia incremental de una tabla: borra desde la marca local (último
+        corte) y reinserta todo lo de Supabase >= marca, en una transacción.
+        Devuelve {'tabla', 'estado', 'leidas', 'marca', 'segundos'}.
+        """
+        columna = TABLAS_ALMACEN[tabla]
+        inicio = time.perf_counter()
+        version = str(app.obtener_version_tabla(tabla))
+        control = self._control(tabla)
+        presente = tabla in self.tablas_presentes()
+
+        if not completo and presente and control and control['version'] == version:
+            return {'tabla': tabla, 'estado': 'al_dia', 'leidas': 0, 'marca': control['marca'], 'segundos': 0.0}
+
+        marca = None
+        if presente and not completo:
+            marca = self.consultar(f'select max("{columna}") as m from "{tabla}"')['m'].iloc[0]
+            marca = None if pd.isna(marca) else pd.Timestamp(marca).date()
+
+        supabase = app.get_supabase()
+
+        def consulta():
+            q = supabase.table(tabla).select('*')
+            if marca is not None:
+                q = q.gte(columna, str(marca))
+            return q.order(columna).order(DESEMPATE_ALMACEN[tabla])
+
+        cursor = self.conexion.cursor()
+        leidas = 0
+        try:
+            cursor.execute("begin transaction")
+            if completo and presente:
+                cursor.execute(f'drop table "{tabla}"')
+            elif marca is not None:
+                cursor.execute(f'delete from "{tabla}" where "{columna}" >= ?', [marca])
+
+            for filas in app.iterar_paginas(consulta, LOTE_LECTURA):
+                lote = preparar_lote(filas, columna)
+                self._asegurar_columnas(cursor, tabla, lote)
+                cursor.register('_lote', lote)
+                cursor.execute(f'insert into "{tabla}" by name select * from _lote')
+                cursor.unregister('_lote')
+                leidas += len(lote)
+
+            if leidas or presente:
+                nueva_marca, total = cursor.execute(
+                    f'select max("{columna}"), count(*) from "{tabla}"'
+                ).fetchone()
+            else:
+                nueva_marca, total = None, 0
+            segundos = time.perf_counter() - inicio
+            cursor.execute(
+                "insert or replace into sincronizaciones values (?, ?, ?, ?, ?, ?, ?)",
+                [tabla, nueva_marca, version, total, leidas, segundos, datetime.now()]
+            )
+            cursor.execute("commit")
+        except Exception:
+            cursor.execute("rollback")
+            raise
+        finally:
+            cursor.close()
+
+        return {'tabla': tabla, 'estado': 'sincronizada', 'leidas': leidas, 'marca': nueva_marca, 'segundos': segundos}
+
+    def sincronizar(self, app, tablas=None, completo=False):
+        """
+        Sincroniza las tablas (todas por defecto). Una tabla que falla no
+        detiene las demás: su resultado trae 'error'. Devuelve la lista de resultados.
+        """
+        resultados = []
+        with self.lock_sync:
+            for tabla in tablas or TABLAS_ALMACEN:
+                try:
+                    resultados.append(self.sincronizar_tabla(app, tabla, completo))
+                except Exception as e:
+                    resultados.append({'tabla': tabla, 'estado': 'error', 'error': str(e)})
+        return resultados
+
+    # ------------------------------------------------------ consultas del panel
+
+    def top_agencias(self, meses=6, limite=10):
+        """
+        Agencias con más diamantes en los últimos `meses`, sumando un corte por
+        mes y contrato (el último: los cortes del mes son acumulados).
+        """
+        return self.consultar("""
+            with cierres as (
+                select contrato, max(fecha_datos) as fecha_datos
+                from usuarios_tiktok
+                where fecha_datos >= date_trunc('month', (select max(fecha_datos) from usuarios_tiktok))
+                                     - to_months(? - 1)
+                group by contrato, date_trunc('month', fecha_datos)
+            )
+            select coalesce(nullif(trim(u.agencia), ''), '(sin agencia)') as agencia,
+                   count(distinct u.contrato)                              as contratos,
+                   count(distinct u.id_tiktok)                             as jugadores,
+                   count(distinct date_trunc('month', u.fecha_datos))      as meses,
+                   sum(u.diamantes)                                        as diamantes,
+                   sum(u.diamantes) / count(distinct date_trunc('month', u.fecha_datos)) as diamantes_mes
+            from usuarios_tiktok u
+            join cierres c using (contrato, fecha_datos)
+            group by 1
+            order by diamantes desc
+            limit ?
+        """, [int(meses), int(limite)])
+
+    def tendencia_cumplimiento(self, meses=12):
+        """
+        Por mes: jugadores del cierre, usuarios que cumplen (usuarios_validos de
+        resumen_contratos) y totales pagados. Un periodo por mes y contrato.
+        """
+        return self.consultar("""
+            with resumen as (
+                select contrato, periodo, usuarios_validos, total_coins, total_paypal, total_final,
+                       row_number() over (partition by contrato, date_trunc('month', periodo)
+                                          order by periodo desc) as orden
+                from resumen_contratos
+            ),
+            jugadores as (
+                select contrato, fecha_datos as periodo, count(*) as jugadores
+                from usuarios_tiktok
+                group by contrato, fecha_datos
+            )
+            select date_trunc('month', r.periodo)::date                 as mes,
+                   count(distinct r.contrato)                            as contratos,
+                   sum(coalesce(j.jugadores, 0))                         as jugadores,
+                   sum(r.usuarios_validos)                               as cumplen,
+                   sum(r.usuarios_validos) / nullif(sum(j.jugadores), 0) as tasa_cumple,
+                   sum(r.total_coins)                                    as total_coins,
+                   sum(r.total_paypal)                                   as total_paypal,
+                   sum(r.total_final)                                    as total_final
+            from resumen r
+            left join jugadores j on j.contrato = r.contrato and j.periodo = r.periodo
+            where r.orden = 1
+              and r.periodo >= date_trunc('month', (select max(periodo) from resumen_contratos))
+                               - to_months(? - 1)
+            group by 1
+            order by 1
+        """, [int(meses)])
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Copia analítica local (DuckDB) de las tablas por corte")
+    parser.add_argument("--ruta", default=ALMACEN_RUTA, help="Archivo DuckDB (por defecto ALMACEN_ANALITICO)")
+    parser.add_argument("--completo", action="store_true", help="Reconstruir las tablas desde cero")
+    parser.add_argument("--tablas", nargs="*", choices=list(TABLAS_ALMACEN), help="Solo estas tablas")
+    parser.add_argument("--sql", help="Consulta a ejecutar sobre la copia local (sin sincronizar)")
+    args = parser.parse_args()
+
+    if not disponible():
+        raise SystemExit("❌ Falta duckdb: pip install duckdb")
+
+    almacen = AlmacenAnalitico(args.ruta)
+
+    if args.sql:
+        inicio = time.perf_counter()
+        resultado = almacen.consultar(args.sql)
+        print(resultado.to_string(index=False))
+        print(f"\n⏱️ {len(resultado):,} filas en {(time.perf_counter() - inicio) * 1000:.1f} ms")
+        return
+
+    from streamlit import logger as st_logger
+
+    # capa_datos.py usa Streamlit; fuera de `streamlit run` solo emite avisos de "bare mode"
+    st_logger.set_log_level("error")
+
+    import capa_datos
+
+    for r in almacen.sincronizar(capa_datos, args.tablas, args.completo):
+        if r['estado'] == 'error':
+            print(f"❌ {r['tabla']}: {r['error']}")
+        elif r['estado'] == 'al_dia':
+            print(f"🟢 {r['tabla']}: al día (hasta {r['marca']})")
+        else:
+            print(f"✅ {r['tabla']}: {r['leidas']:,} filas leídas, hasta {r['marca']} ({r['segundos']:.1f}s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+# ============================================================================
+# api_lectura.py - API JSON de solo lectura para las páginas HTML
+# Una vista completa por petición (en vez de decenas de llamadas paginadas
+# desde el navegador), reutilizando los cargadores y cachés de capa_datos.py.
+# gzip, ETag / 304 y proyección de columnas (?columnas=a,b,c). La frescura
+# de la copia va en cabeceras X-Frescura-*, fuera del cuerpo: el ETag solo
+# cambia cuando cambian los datos, no en cada refresco de la última copia.
+#
+# Rutas (GET):
+#   /api/periodos?token=T                         periodos visibles para el token
+#   /api/contrato?token=T&periodo=P[&contrato=C]  tabla del contrato en un corte
+#   /api/jugador?token=T[&desde=F][&cierres=0]    historial de un jugador
+#                                                 (desde = último corte que ya tiene el cliente)
+#
+# Uso:
+#   python api_lectura.py                      # 0.0.0.0:8502
+#   python api_lectura.py --puerto 9000
+#   API_LECTURA_PUERTO=8502 streamlit run app.py   # en un hilo de la app
+# ============================================================================
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+GZIP_MINIMO = 1024   # bytes: por debajo no compensa comprimir
+CORS_ORIGEN = os.getenv("API_LECTURA_CORS", "*")
+CABECERAS_FRESCURA = ('X-Frescura-Estado', 'X-Frescura-Actualizado', 'X-Frescura-Origen')
+
+# Columnas que ve un jugador con token grupal (mismas que su tabla en la app)
+COLUMNAS_VISTA_JUGADORES = [
+    'usuario', 'dias', 'duracion', 'diamantes', 'nivel', 'cumple',
+    'incentivo_coins', 'incentivo_paypal', 'paypal_bruto',
+]
+
+class ErrorApi(Exception):
+    """Error con código HTTP para el cliente"""
+
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+
+# ============================================================================
+# SERIALIZACIÓN
+# ============================================================================
+
+def _json_default(valor):
+    """Tipos de numpy / pandas / fechas que json no conoce"""
+    if isinstance(valor, np.generic):
+        return valor.item()
+    if isinstance(valor, (datetime, date, pd.Timestamp)):
+        return valor.isoformat()
+    return str(valor)
+
+def filas_json(df, columnas=None):
+    """
+    DataFrame -> lista de dicts lista para json (NaN -> null).
+    `columnas` proyecta: solo las pedidas que existan, en ese orden.
+    """
+    if columnas:
+        df = df[[c for c in columnas if c in df.columns]]
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+def _columnas_pedidas(params):
+    """?columnas=a,b,c -> ['a', 'b', 'c'] (None = todas)"""
+    valor = params.get('columnas')
+    if not valor:
+        return None
+    return [c.strip() for c in valor.split(',') if c.strip()]
+
+# ============================================================================
+# VISTAS
+# ============================================================================
+
+def _resolver_token(app, token):
+    """('admin' | 'contrato' | 'jugador', datos del token) o ErrorApi 401"""
+    if not token:
+        raise ErrorApi(401, "Falta el parámetro token")
+    for tipo, verificar in (('admin', app.verificar_token_admin),
+                            ('contrato', app.verificar_token_contrato),
+                            ('jugador', app.verificar_token_jugador)):
+        datos = verificar(token)
+        if datos:
+            return tipo, datos
+    raise ErrorApi(401, "Token inválido o inactivo")
+
+def vista_periodos(app, params):
+    """Periodos del selector: globales para admin / contrato, del historial para jugador"""
+    tipo, datos = _resolver_token(app, params.get('token'))
+
+    if tipo == 'jugador':
+        historial = app.filtrar_cierres_mes(app.obtener_historial_jugador(datos['id_tiktok']))
+        periodos = historial['fecha_datos'].astype(str).tolist()[::-1] if not historial.empty else []
+        return {'tipo': tipo, 'id_tiktok': datos['id_tiktok'], 'periodos': periodos}
+
+    return {'tipo': tipo, 'contrato': datos.get('contrato'), 'periodos': app.obtener_periodos_disponibles()}
+
+def vista_contrato(app, params):
+    """Tabla de un contrato en un corte (la misma que pinta la app); la frescura va en cabeceras"""
+    tipo, datos = _resolver_token(app, params.get('token'))
+    if tipo == 'jugador':
+        raise ErrorApi(403, "El token de jugador no da acceso a la tabla del contrato")
+
+    contrato = params.get('contrato') if tipo == 'admin' else datos.get('contrato')
+    if not contrato:
+        raise ErrorApi(400, "Falta el parámetro contrato")
+
+    periodo = params.get('periodo')
+    if not periodo:
+        periodos = app.obtener_periodos_disponibles()
+        if not periodos:
+            raise ErrorApi(404, "No hay periodos disponibles")
+        periodo = periodos[0]
+
+    df, frescura = app.obtener_datos_contrato_swr(contrato, periodo)
+    if frescura['estado'] == 'sin_conexion':
+        raise ErrorApi(503, "Sin conexión con la base y sin copia previa del contrato")
+
+    columnas = _columnas_pedidas(params)
+    if tipo == 'contrato':
+        # Token grupal: solo lo que ve el jugador en la app
+        ocultas = app.columnas_ocultas_jugadores(contrato)
+        visibles = [c for c in COLUMNAS_VISTA_JUGADORES if c not in ocultas]
+        columnas = [c for c in (columnas or visibles) if c in visibles]
+
+    cabeceras = {
+        'X-Frescura-Estado': frescura['estado'],
+        'X-Frescura-Actualizado': frescura['actualizado'].isoformat(timespec='seconds') if frescura['actualizado'] else '',
+        'X-Frescura-Origen': frescura['origen'] or '',
+    }
+    return {
+        'contrato': contrato,
+        'periodo': periodo,
+        'total': len(df),
+        'filas': filas_json(df, columnas),
+    }, cabeceras
+
+def vista_jugador(app, params):
+    """
+    Historial del jugador del token (una fila por mes salvo ?cierres=0).
+    Con ?desde=F llegan los cortes cerrados posteriores a F y toda la ventana
+    abierta; el cliente borra sus filas desde `reemplaza_desde`, añade las
+    nuevas y guarda `hasta` como próxima marca.
+    """
+    tipo, datos = _resolver_token(app, params.get('token'))
+    if tipo != 'jugador':
+        raise ErrorApi(403, "Se requiere un token de jugador")
+
+    desde = params.get('desde')
+    if desde and not re.fullmatch(r'\d{4}-\d{2}-\d{2}', desde):
+        raise ErrorApi(400, "desde debe tener formato YYYY-MM-DD")
+
+    historial = app.obtener_historial_jugador(datos['id_tiktok'], desde=desde)
+    hasta = historial['fecha_datos'].astype(str).max() if not historial.empty else desde
+    if params.get('cierres', '1') != '0':
+        historial = app.filtrar_cierres_mes(historial)
+
+    return {
+        'id_tiktok': datos['id_tiktok'],
+        'desde': desde,
+        'hasta': hasta,
+        'reemplaza_desde': app.limite_historial_cerrado(),
+        'total': len(historial),
+        'filas': filas_json(historial, _columnas_pedidas(params)),
+    }
+
+RUTAS = {
+    '/api/periodos': vista_periodos,
+    '/api/contrato': vista_contrato,
+    '/api/jugador': vista_jugador,
+}
+
+# ============================================================================
+# SERVIDOR HTTP
+# ============================================================================
+
+class ManejadorLectura(BaseHTTPRequestHandler):
+    """GET -> JSON; `self.server.app` es el módulo capa_datos ya importado"""
+
+    server_version = "TikTokLectura/1.0"
+
+    def log_message(self, formato, *args):
+        # Sin log por petición (el hilo dentro de Streamlit ensucia la consola)
+        pass
+
+    def _cabeceras_cors(self):
+        self.send_header('Access-Control-Allow-Origin', CORS_ORIGEN)
+        self.send_header('Access-Control-Expose-Headers', ', '.join(('ETag',) + CABECERAS_FRESCURA))
+
+    def do_OPTIONS(self):
+        self.send_response(204)
+        self._cabeceras_cors()
+        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'If-None-Match')
+        self.send_header('Access-Control-Max-Age', '86400')
+        self.end_headers()
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        vista = RUTAS.get(url.path.rstrip('/'))
+
+        cabeceras = {}
+        try:
+            if vista is None:
+                raise ErrorApi(404, f"Ruta desconocida: {url.path}")
+            estado, payload = 200, vista(self.server.app, params)
+            if isinstance(payload, tuple):
+                payload, cabeceras = payload
+        except ErrorApi as e:
+            estado, payload = e.estado, {'error': str(e)}
+        except Exception as e:
+            # El detalle queda en el log del servidor, no en la respuesta (CORS abierto)
+            print(f"⚠️ api_lectura {url.path}: {type(e).__name__}: {e}")
+            estado, payload = 500, {'error': "Error interno del servidor"}
+
+        self._responder(estado, payload, cabeceras)
+
+    def _responder(self, estado, payload, cabeceras=None):
+        """
+        JSON con ETag (304 si el cliente ya lo tiene) y gzip si lo acepta.
+        `cabeceras` (frescura) no entran en el ETag: van también en el 304.
+        """
+        cuerpo = json.dumps(payload, ensure_ascii=False, separators=(',', ':'), default=_json_default).encode('utf-8')
+        etag = f'W/"{hashlib.sha1(cuerpo).hexdigest()[:20]}"'
+
+        if estado == 200:
+            previas = [e.strip() for e in self.headers.get('If-None-Match', '').split(',')]
+            if etag in previas or '*' in previas:
+                self.send_response(304)
+                self._cabeceras_cors()
+                self.send_header('ETag', etag)
+                for nombre, valor in (cabeceras or {}).items():
+                    self.send_header(nombre, valor)
+                self.end_headers()
+                return
+
+        comprimido = len(cuerpo) >= GZIP_MINIMO and 'gzip' in self.headers.get('Accept-Encoding', '')
+        if comprimido:
+            cuerpo = gzip.compress(cuerpo, compresslevel=5)
+
+        self.send_response(estado)
+        self._cabeceras_cors()
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.send_header('Vary', 'Accept-Encoding')
+        if estado == 200:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'private, no-cache')
+            for nombre, valor in (cabeceras or {}).items():
+                self.send_header(nombre, valor)
+        elif estado == 503:
+            self.send_header('Retry-After', '30')
+        if comprimido:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+def crear_servidor(app, host="0.0.0.0", puerto=8502):
+    """Servidor multihilo (un hilo por petición) ligado al módulo de datos dado"""
+    servidor = ThreadingHTTPServer((host, puerto), ManejadorLectura)
+    servidor.daemon_threads = True
+    servidor.app = app
+    return servidor
+
+def iniciar_en_hilo(app, host="0.0.0.0", puerto=8502):
+    """Arranca el servidor en un hilo daemon (p. ej. dentro del proceso de Streamlit)"""
+    servidor = crear_servidor(app, host, puerto)
+    threading.Thread(target=servidor.serve_forever, daemon=True, name='api-lectura').start()
+    return servidor
+
+def main():
+    parser = argparse.ArgumentParser(description="API JSON de lectura para las páginas HTML")
+    parser.add_argument("--host", default=os.getenv("API_LECTURA_HOST", "0.0.0.0"))
+    parser.add_argument("--puerto", type=int, default=int(os.getenv("API_LECTURA_PUERTO", "8502")))
+    args = parser.parse_args()
+
+    from streamlit import logger as st_logger
+
+    # capa_datos.py usa Streamlit; fuera de `streamlit run` solo emite avisos de "bare mode"
+    st_logger.set_log_level("error")
+
+    import capa_datos
+
+    servidor = crear_servidor(capa_datos, args.host, args.puerto)
+    print(f"🌐 API de lectura en http://{args.host}:{args.puerto}/api/ (Ctrl+C para salir)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -6,38 +6,70 @@
 
 import streamlit as st
 import pandas as pd
-from supabase import create_client
+import numpy as np
 import os
+import cProfile
+import io
+import marshal
+import pstats
+import time
 from dotenv import load_dotenv
 from datetime import datetime
 import calendar
 import plotly.graph_objects as go
 import plotly.express as px
+import sys
+import threading
 
 # Cargar variables de entorno
 load_dotenv()
 
-# Configurar página
-st.set_page_config(
-    page_title="Sistema TikTok Live",
-    page_icon="📊",
-    layout="wide",
-    initial_sidebar_state="auto"
+# Capa de datos (módulo importable): bajo `streamlit run` este script corre como
+# __main__ y pages/ comparte con él una sola instancia de planificador y cachés.
+# Los paneles de estado que dibujan sobre ella están en vistas.py
+from capa_datos import (
+    get_supabase, obtener_version_datos, TABLAS_DATOS_CONTRATO, verificar_rutas_rapidas, obtener_resumen_periodo,
+    verificar_token_admin, verificar_token_contrato, verificar_login_agente, cambiar_password_agente,
+    obtener_periodos_disponibles, obtener_mes_español, formatear_fecha_español, columnas_ocultas_jugadores,
+    contratos_descendientes, obtener_datos_red, resumen_red, obtener_datos_contrato_swr,
+    precargar_periodos_vecinos, obtener_precalentador, iniciar_api_lectura, obtener_progreso_contrato,
+    COLUMNAS_CAMBIOS, obtener_cortes_contrato, corte_anterior, obtener_cambios_contrato, obtener_cache_acotada,
+    tamano_aproximado,
 )
+from vistas import (
+    mostrar_estado_planificador, mostrar_estado_caches_datos, mostrar_estado_rutas_rapidas,
+    mostrar_frescura, mostrar_busqueda_jugadores, mostrar_estado_precalentador, mostrar_conciliacion,
+    mostrar_historico_almacen,
+)
+
+def configurar_pagina():
+    """
+    Configuración de página, build y estilos. Se llama al inicio de main()
+    para que importar app.py (CLIs, procesos batch) no dibuje nada.
+    """
+    # Configurar página
+    st.set_page_config(
+        page_title="Sistema TikTok Live",
+        page_icon="📊",
+        layout="wide",
+        initial_sidebar_state="auto"
+    )
 
-# Build tracking
-st.sidebar.caption("🔧 Build: 2025-11-19a")
+    # Build tracking
+    st.sidebar.caption("🔧 Build: 2025-11-19a")
 
-# DEBUG: Descomentar si necesitas forzar recarga
-# if st.sidebar.button("🔄 Forzar Recarga de Periodos"):
-#     st.cache_data.clear()
-#     st.rerun()
+    # DEBUG: Descomentar si necesitas forzar recarga
+    # if st.sidebar.button("🔄 Forzar Recarga de Periodos"):
+    #     st.cache_data.clear()
+    #     st.rerun()
+
+    st.markdown(ESTILOS_CSS, unsafe_allow_html=True)
 
 # ============================================================================
 # ESTILOS CSS
 # ============================================================================
 
-st.markdown("""
+ESTILOS_CSS = """
 <style>
     :root {
         --tiktok-black: #000000;
@@ -143,564 +175,138 @@ st.markdown("""
         text-align:center !important;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
 
 # ============================================================================
-# CONEXIÓN SUPABASE
+# CACHÉ DE RENDER (gráficos y tablas ya preparadas)
 # ============================================================================
 
-@st.cache_resource
-def get_supabase():
-    """Obtiene cliente de Supabase"""
-    try:
-        url = st.secrets["SUPABASE_URL"]
-        key = st.secrets["SUPABASE_SERVICE_KEY"]
-    except:
-        url = os.getenv("SUPABASE_URL")
-        key = os.getenv("SUPABASE_SERVICE_KEY")
-    
-    if not url or not key:
-        st.error("❌ Error: Credenciales de Supabase no configuradas")
-        st.stop()
-    
-    return create_client(url, key)
-
-# ============================================================================
-# FUNCIONES DE AUTENTICACIÓN
-# ============================================================================
+RENDER_CACHE_MAX_MB = int(os.getenv("RENDER_CACHE_MAX_MB", "64"))
+RENDER_CACHE_MAX_ENTRADAS = int(os.getenv("RENDER_CACHE_MAX_ENTRADAS", "512"))
 
-def verificar_token_admin(token):
-    """Verifica token de administrador"""
-    supabase = get_supabase()
-    resultado = supabase.table('contratos_tokens').select('*').eq('token', token).eq('activo', True).execute()
-    
-    if resultado.data:
-        token_data = resultado.data[0]
-        tipo = token_data.get('tipo', 'contrato')
-        if tipo == 'admin':
-            return token_data
-    return None
-
-def verificar_token_contrato(token):
-    """Verifica token de contrato (jugadores)"""
-    supabase = get_supabase()
-    resultado = supabase.table('contratos_tokens').select('*').eq('token', token).eq('activo', True).execute()
-    
-    if resultado.data:
-        token_data = resultado.data[0]
-        tipo = token_data.get('tipo', 'contrato')
-        if tipo == 'contrato':
-            return token_data
-    return None
-
-def verificar_login_agente(usuario, password):
-    """Verifica credenciales de agente"""
-    supabase = get_supabase()
-    resultado = supabase.table('agentes_login')\
-        .select('*')\
-        .eq('usuario', usuario)\
-        .eq('password', password)\
-        .eq('activo', True)\
-        .execute()
-    
-    if resultado.data and len(resultado.data) > 0:
-        return resultado.data[0]
-    return None
-
-def cambiar_password_agente(usuario, nueva_password):
-    """Cambia la contraseña del agente"""
-    supabase = get_supabase()
-    try:
-        supabase.table('agentes_login')\
-            .update({'password': nueva_password, 'cambio_password': True})\
-            .eq('usuario', usuario)\
-            .execute()
-        return True
-    except:
-        return False
+def _cache_render():
+    """Espacio 'render' de la caché acotada (compartido por sesiones, en el panel de cachés)"""
+    return obtener_cache_acotada('render', RENDER_CACHE_MAX_ENTRADAS, RENDER_CACHE_MAX_MB)
 
-# ============================================================================
-# FUNCIONES COMPARTIDAS
-# ============================================================================
+def _tamano_render(valor):
+    """Bytes aproximados de una entrada (figuras: JSON serializado; lo demás como la caché acotada)"""
+    if isinstance(valor, go.Figure):
+        return len(valor.to_json())
+    return tamano_aproximado(valor)
 
-def obtener_periodos_disponibles():
+def clave_render(contrato, periodo, rol, columnas_ocultas=(), version=None):
     """
-    Obtiene periodos disponibles con lógica inteligente:
-    - Siempre muestra cierres de mes (último día del mes)
-    - Para cada mes, solo muestra la fecha MÁS RECIENTE
+    (contrato, periodo, versión de datos, rol de la vista, columnas ocultas).
+    `version` es la de los datos que se pintan (p. ej. la de la última copia
+    de obtener_datos_contrato_swr); por defecto la actual.
     """
-    supabase = get_supabase()
-    
-    try:
-        # OPCIÓN A: Intentar usar función RPC (si existe)
-        try:
-            resultado_rpc = supabase.rpc('obtener_fechas_disponibles').execute()
-            if resultado_rpc.data:
-                fechas = [r['fecha_datos'] for r in resultado_rpc.data]
-                fechas_filtradas = filtrar_fechas_inteligente(fechas)
-                # DEBUG: Descomentar para ver info de fechas
-                # st.sidebar.success(f"✅ Usando RPC: {len(fechas_filtradas)} fechas visibles")
-                # st.sidebar.write("📋 Fechas mostradas:", fechas_filtradas)
-                return fechas_filtradas
-        except Exception as e_rpc:
-            # DEBUG: Descomentar para ver errores de RPC
-            # st.sidebar.warning(f"⚠️ RPC no disponible: {str(e_rpc)}")
-            pass
-        
-        # OPCIÓN B: Paginación manual (fallback)
-        todas_fechas = set()
-        offset = 0
-        batch_size = 1000
-        batch_count = 0
-        
-        while batch_count < 10:  # Máximo 10 batches = 10,000 registros
-            resultado = supabase.table('usuarios_tiktok')\
-                .select('fecha_datos')\
-                .range(offset, offset + batch_size - 1)\
-                .execute()
-            
-            if not resultado.data or len(resultado.data) == 0:
-                break
-            
-            # Extraer fechas del batch
-            fechas_batch = [r['fecha_datos'] for r in resultado.data if r.get('fecha_datos')]
-            todas_fechas.update(fechas_batch)
-            batch_count += 1
-            
-            # Si obtuvimos menos que batch_size, ya terminamos
-            if len(resultado.data) < batch_size:
-                break
-            
-            offset += batch_size
-        
-        fechas_unicas = list(todas_fechas)
-        fechas_filtradas = filtrar_fechas_inteligente(fechas_unicas)
-        
-        # DEBUG: Descomentar para ver info de paginación
-        # st.sidebar.success(f"✅ Paginación: {len(fechas_filtradas)} fechas visibles")
-        # st.sidebar.write(f"📦 Procesados {batch_count} batches")
-        # st.sidebar.write("📋 Fechas mostradas:", fechas_filtradas)
-        
-        return fechas_filtradas
-        
-    except Exception as e:
-        st.sidebar.error(f"❌ Error: {str(e)}")
-        return []
+    return (
+        str(contrato),
+        str(periodo),
+        version if version is not None else obtener_version_datos(*TABLAS_DATOS_CONTRATO),
+        rol,
+        tuple(sorted(columnas_ocultas)),
+    )
 
-def filtrar_fechas_inteligente(fechas_str):
+def obtener_render(clave, construir):
     """
-    Filtra fechas con lógica inteligente:
-    - Cierres de mes (último día): SIEMPRE
-    - Fechas intermedias: Solo la MÁS RECIENTE por mes
+    Devuelve el render cacheado para `clave` o lo construye y lo guarda.
+    Lo cacheado se comparte entre sesiones: quien lo reciba no debe modificarlo.
     """
-    from datetime import datetime
-    from collections import defaultdict
-    
-    if not fechas_str:
-        return []
-    
-    # Convertir strings a datetime y agrupar por mes
-    fechas_obj = []
-    for f_str in fechas_str:
-        try:
-            f_obj = datetime.strptime(str(f_str).strip(), '%Y-%m-%d')
-            fechas_obj.append(f_obj)
-        except:
-            continue
-    
-    # Agrupar por año-mes
-    por_mes = defaultdict(list)
-    for f in fechas_obj:
-        clave_mes = f.strftime('%Y-%m')
-        por_mes[clave_mes].append(f)
-    
-    # Filtrar: cierres de mes + fecha más reciente por mes
-    fechas_finales = []
-    
-    for mes, fechas_del_mes in por_mes.items():
-        fechas_del_mes_sorted = sorted(fechas_del_mes, reverse=True)  # Más reciente primero
-        
-        # Obtener último día del mes
-        primera_fecha = fechas_del_mes_sorted[0]
-        año = primera_fecha.year
-        mes_num = primera_fecha.month
-        
-        # Último día del mes
-        if mes_num == 12:
-            ultimo_dia = 31
-        else:
-            from calendar import monthrange
-            ultimo_dia = monthrange(año, mes_num)[1]
-        
-        # Buscar si hay cierre de mes
-        cierre_existe = False
-        for f in fechas_del_mes:
-            if f.day == ultimo_dia:
-                fechas_finales.append(f)
-                cierre_existe = True
-                break
-        
-        # Si NO hay cierre, agregar la más reciente
-        if not cierre_existe:
-            fechas_finales.append(fechas_del_mes_sorted[0])
-    
-    # Ordenar descendente y convertir a strings
-    fechas_finales_sorted = sorted(fechas_finales, reverse=True)
-    return [f.strftime('%Y-%m-%d') for f in fechas_finales_sorted]
-
-def obtener_mes_español(fecha_str):
-    """Convierte fecha a Mes YYYY en español"""
-    meses = {
-        1: 'Enero', 2: 'Febrero', 3: 'Marzo', 4: 'Abril',
-        5: 'Mayo', 6: 'Junio', 7: 'Julio', 8: 'Agosto',
-        9: 'Septiembre', 10: 'Octubre', 11: 'Noviembre', 12: 'Diciembre'
-    }
-    try:
-        fecha = datetime.strptime(fecha_str, '%Y-%m-%d')
-        return f"{meses[fecha.month]} {fecha.year}"
-    except:
-        return fecha_str
-
-def formatear_fecha_español(fecha_str):
-    """Convierte fecha a DD de Mes, YYYY en español"""
-    meses = {
-        1: 'Enero', 2: 'Febrero', 3: 'Marzo', 4: 'Abril',
-        5: 'Mayo', 6: 'Junio', 7: 'Julio', 8: 'Agosto',
-        9: 'Septiembre', 10: 'Octubre', 11: 'Noviembre', 12: 'Diciembre'
-    }
-    try:
-        fecha = datetime.strptime(fecha_str, '%Y-%m-%d')
-        return f"{fecha.day} de {meses[fecha.month]}, {fecha.year}"
-    except:
-        return fecha_str
-
-def obtener_incentivos():
-    """Obtiene tabla de incentivos"""
-    supabase = get_supabase()
-    resultado = supabase.table('incentivos_horizontales').select('*').order('acumulado').execute()
-    
-    if resultado.data:
-        return pd.DataFrame(resultado.data)
-    return pd.DataFrame()
-
-def determinar_nivel(dias, horas):
-    """Determina nivel según días y horas"""
-    try: 
-        d = float(dias)
-    except: 
-        d = 0
-    try: 
-        h = float(horas)
-    except: 
-        h = 0
-    
-    if d >= 20 and h >= 40: return 3
-    if d >= 14 and h >= 30: return 2
-    if d >= 7  and h >= 15: return 1
-    return 0
-
-def calcular_incentivos(df_incentivos, diamantes, nivel):
-    """Calcula incentivos según tabla horizontal"""
-    if nivel == 0:
-        return (0, 0)
-    
-    try:
-        fila_valida = None
-        for idx, row in df_incentivos.iterrows():
-            if diamantes >= row.get('acumulado', 0):
-                fila_valida = idx
-            else:
-                break
-        
-        if fila_valida is None:
-            return (0, 0)
-        
-        fila = df_incentivos.iloc[fila_valida]
-        coins = fila.get(f'nivel_{nivel}_monedas', 0)
-        paypal = fila.get(f'nivel_{nivel}_paypal', 0)
-        
-        return (coins, paypal)
-    except Exception:
-        return (0, 0)
+    cache = _cache_render()
+    encontrado, valor = cache.obtener(clave)
+    if not encontrado:
+        valor = construir()
+        cache.guardar(clave, valor, _tamano_render(valor))
+    return valor
+
+def grafico_niveles(df, clave):
+    """Gráfico de pastel de niveles, construido una vez por versión de datos (sin clave: sin caché)"""
+    construir = lambda: crear_grafico_pastel(df['nivel'].value_counts().sort_index(ascending=False))
+    if clave is None:
+        return construir()
+    return obtener_render(clave + ('grafico_niveles',), construir)
 
 # ============================================================================
-# NUEVAS FUNCIONES INTEGRADAS DE CHATGPT
+# TABLAS PAGINADAS (orden y corte de página en el servidor)
 # ============================================================================
 
-def _col(df, *cands):
-    """Helper para encontrar columna con diferentes nombres posibles"""
-    for c in cands:
-        if c in df.columns: 
-            return c
-    return None
+TAMANOS_PAGINA = [25, 50, 100, 250]
+ORDENES_TABLA = {
+    '💎 Diamantes': 'diamantes',
+    '📅 Días': 'dias',
+    '🏆 Nivel': 'nivel',
+}
 
-def enriquecer_nombres_desde_historial(df: pd.DataFrame, sb) -> pd.DataFrame:
+def paginar_dataframe(df, columna_orden, descendente, pagina, tamano):
     """
-    INTEGRADO DE CHATGPT - MEJORADO
-    Rellena 'usuario' cuando viene vacío usando historico_usuarios.
-    Busca por id_tiktok (o usuario_id) y usa el último username conocido.
-    Procesa en lotes de 400 para no sobrecargar Supabase.
+    Ordena por la columna numérica (sobre el frame tipado, no el formateado)
+    y devuelve solo las filas de la página pedida.
     """
-    if df.empty or sb is None: 
-        return df
-
-    col_user = _col(df, "usuario", "username", "user", "nick")
-    col_id   = _col(df, "id_tiktok", "usuario_id", "user_id", "id_usuario")
-    if not col_user or not col_id:
-        return df
-
-    # Identificar usuarios sin nombre
-    mask = df[col_user].isna() | (df[col_user].astype(str).str.strip() == "")
-    ids = df.loc[mask, col_id].dropna().astype(str).unique().tolist()
-    if not ids:
-        return df
-
-    mapping = {}
-    CHUNK = 400  # Procesar en lotes de 400
-    
-    for i in range(0, len(ids), CHUNK):
-        lote = ids[i:i+CHUNK]
-        rows = []
-        
-        # Intento 1: Por id_tiktok
-        try:
-            r = (sb.table("historico_usuarios")
-                    .select("*")
-                    .in_("id_tiktok", lote)
-                    .order("visto_ultima_vez", desc=True)
-                    .execute())
-            rows = r.data or []
-        except Exception:
-            rows = []
-        
-        # Intento 2: Por usuario_id si no funcionó
-        if not rows:
-            try:
-                r = (sb.table("historico_usuarios")
-                        .select("*")
-                        .in_("usuario_id", lote)
-                        .order("visto_ultima_vez", desc=True)
-                        .execute())
-                rows = r.data or []
-            except Exception:
-                rows = []
-
-        if not rows: 
-            continue
-
-        # Mapear IDs a nombres
-        h = pd.DataFrame(rows)
-        hid = _col(h, "id_tiktok", "usuario_id", "user_id")
-        hun = _col(h, "usuario_1", "usuario_2", "usuario_3", "usuario", "username", "user", "nick")
-        
-        if not hid or not hun:
-            continue
+    if columna_orden in df.columns:
+        # Vacíos siempre al final, en cualquier sentido
+        valores = pd.to_numeric(df[columna_orden], errors='coerce').to_numpy(dtype=float)
+        valores = np.where(np.isnan(valores), np.inf, -valores if descendente else valores)
+        orden = np.argsort(valores, kind='stable')
+    else:
+        orden = np.arange(len(df))
+    inicio = (pagina - 1) * tamano
+    return df.iloc[orden[inicio:inicio + tamano]]
 
-        h["id_str"] = h[hid].astype(str)
-        h = h.dropna(subset=[hun]).drop_duplicates(subset=["id_str"], keep="first")
-        mapping.update(dict(zip(h["id_str"], h[hun])))
+def mostrar_tabla_paginada(df, formatear, clave, orden_default='💎 Diamantes', column_config=None, columnas_ocultas=(),
+                           clave_cache=None, ordenes=None):
+    """
+    Tabla paginada: controles de orden / tamaño / página y totales.
+    Solo la página visible pasa por `formatear` y se envía al navegador.
+    No se ofrece ordenar por columnas ocultas al usuario.
+    Con `clave_cache` (ver clave_render) la página formateada se reutiliza.
+    `ordenes` reemplaza las opciones de orden (etiqueta -> columna).
+    """
+    total = len(df)
+    ordenes = ordenes or ORDENES_TABLA
+    opciones_orden = [o for o, c in ordenes.items() if c in df.columns and c not in columnas_ocultas]
 
-    # Aplicar mapeo
-    if mapping:
-        df[col_id] = df[col_id].astype(str)
-        df.loc[mask, col_user] = df.loc[mask, col_id].map(mapping).fillna(df.loc[mask, col_user])
+    col1, col2, col3, col4 = st.columns([2, 1, 1, 1])
 
-    return df
+    with col1:
+        orden = st.selectbox(
+            "Ordenar por",
+            opciones_orden or ["—"],
+            index=opciones_orden.index(orden_default) if orden_default in opciones_orden else 0,
+            key=f"{clave}_orden"
+        )
 
-def _alias_oculto(col_raw: str) -> str:
-    """
-    INTEGRADO DE CHATGPT
-    Normaliza nombres de columnas para sistema de ocultamiento.
-    Acepta múltiples variaciones.
-    """
-    alias = {
-        # Base visibles
-        "usuario":"usuario","username":"usuario","user":"usuario","nick":"usuario",
-        "agencia":"agencia","agency":"agencia","Agencia":"agencia","AGENCIA":"agencia",
-        "dias":"dias","días":"dias","Dias":"dias","Días":"dias",
-        "duracion":"duracion","horas":"duracion","tiempo":"duracion",
-        "diamantes":"diamantes",
-        "nivel":"nivel","cumple":"cumple",
-        # Incentivos/pagos
-        "coins":"incentivo_coins","incentivo coin":"incentivo_coins","incentivo_coins":"incentivo_coins",
-        "paypal":"incentivo_paypal","incentivo paypal":"incentivo_paypal","incentivo_paypal":"incentivo_paypal",
-        "sueldo":"paypal_bruto","paypal_bruto":"paypal_bruto","coins_bruto":"coins_bruto",
-    }
-    return alias.get(col_raw.lower(), col_raw.lower())
-
-@st.cache_data(ttl=300)
-def _leer_reglas_ocultas():
-    """Lee reglas de columnas ocultas desde Supabase"""
-    sb = get_supabase()
-    if not sb: 
-        return []
-    try:
-        r = sb.table("config_columnas_ocultas").select("*").execute()
-        return r.data or []
-    except Exception:
-        return []
+    with col2:
+        descendente = st.selectbox("Sentido", ["⬇️ Mayor", "⬆️ Menor"], key=f"{clave}_sentido") == "⬇️ Mayor"
 
-def obtener_columnas_ocultas(contrato: str):
-    """
-    MEJORADO CON ALIAS
-    Obtiene columnas ocultas con normalización de nombres
-    """
-    reglas = _leer_reglas_ocultas()
-    ocultas = []
-    
-    for row in reglas:
-        c = row.get("contrato")
-        col_raw = str(row.get("columna", "")).strip()
-        
-        if not col_raw:
-            continue
-        
-        col = _alias_oculto(col_raw)
-        
-        # Aplica si es global (contrato=None) o específico
-        if (c is None) or (str(c).strip() == "") or (str(c).strip() == str(contrato).strip()):
-            ocultas.append(col)
-    
-    return ocultas
+    with col3:
+        tamano = st.selectbox("Filas", TAMANOS_PAGINA, index=1, key=f"{clave}_tamano")
 
-# ============================================================================
-# FUNCIONES DE DATOS
-# ============================================================================
+    paginas = max(1, -(-total // tamano))
 
-def obtener_contrato_equivalente(supabase, contrato):
-    """Busca si el contrato tiene un equivalente en contratos_equivalencias (A↔B)."""
-    try:
-        # Buscar como nexus_codigo
-        r = supabase.table('contratos_equivalencias')\
-            .select('nexus_codigo,vertex_codigo')\
-            .or_(f'nexus_codigo.eq.{contrato},vertex_codigo.eq.{contrato}')\
-            .execute()
-        if r.data:
-            row = r.data[0]
-            # Devolver el otro lado
-            if row['nexus_codigo'] == contrato:
-                return row['vertex_codigo']
-            else:
-                return row['nexus_codigo']
-    except Exception:
-        pass
-    return None
+    with col4:
+        pagina = st.number_input("Página", min_value=1, max_value=paginas, value=1, step=1, key=f"{clave}_pagina")
 
+    pagina = min(int(pagina), paginas)
 
-def obtener_datos_contrato(contrato, fecha_datos):
-    """
-    MEJORADO CON ENRIQUECIMIENTO + INTEGRACIÓN VERTEX
-    Obtiene datos del contrato desde usuarios_tiktok,
-    enriquece nombres desde histórico,
-    mapea paypal_bruto desde reportes_contratos,
-    y une datos del contrato equivalente (A↔B) si existe.
-    """
-    supabase = get_supabase()
-    
-    # Verificar nivel1_tabla3
-    config_resultado = supabase.table('contratos').select('*').eq('codigo', contrato).execute()
-    
-    nivel1_tabla3 = False
-    if config_resultado.data and len(config_resultado.data) > 0:
-        valor = config_resultado.data[0].get('nivel1_tabla3', False)
-        if isinstance(valor, str):
-            nivel1_tabla3 = valor.upper() in ['SI', 'YES', 'TRUE', '1', 'SÍ']
-        else:
-            nivel1_tabla3 = bool(valor)
-
-    # Buscar contrato equivalente (Nexus ↔ Vertex)
-    contrato_equivalente = obtener_contrato_equivalente(supabase, contrato)
-
-    # Obtener datos base de usuarios_tiktok
-    # Si hay equivalente, traer ambos contratos en una sola query
-    if contrato_equivalente:
-        resultado = supabase.table('usuarios_tiktok')\
-            .select('*')\
-            .in_('contrato', [contrato, contrato_equivalente])\
-            .eq('fecha_datos', fecha_datos)\
-            .execute()
-    else:
-        resultado = supabase.table('usuarios_tiktok')\
-            .select('*')\
-            .eq('contrato', contrato)\
-            .eq('fecha_datos', fecha_datos)\
-            .execute()
-    
-    if resultado.data:
-        df = pd.DataFrame(resultado.data)
-        
-        # ✨ NUEVO: Enriquecer nombres desde histórico (INTEGRADO DE CHATGPT)
-        df = enriquecer_nombres_desde_historial(df, supabase)
-        
-        # Normalizar horas
-        if 'horas' not in df.columns:
-            df['horas'] = 0
-        
-        # Calcular nivel y cumplimiento
-        df['nivel_original'] = df.apply(lambda r: determinar_nivel(r.get('dias', 0), r.get('horas', 0)), axis=1)
-        df['cumple'] = df['nivel_original'].apply(lambda n: 'SI' if n > 0 else 'NO')
-        
-        # Calcular incentivos
-        df_incentivos = obtener_incentivos()
-        
-        if not df_incentivos.empty:
-            def calcular_incentivo_row(row):
-                nivel_original = row['nivel_original']
-                if nivel1_tabla3 and nivel_original >= 1:
-                    nivel_para_incentivo = 3
-                else:
-                    nivel_para_incentivo = nivel_original
-                return calcular_incentivos(df_incentivos, row.get('diamantes', 0), nivel_para_incentivo)
-            
-            incentivos = df.apply(calcular_incentivo_row, axis=1, result_type='expand')
-            df['incentivo_coins'] = incentivos[0]
-            df['incentivo_paypal'] = incentivos[1]
-            
-            if nivel1_tabla3:
-                df['nivel'] = df['nivel_original'].apply(lambda n: 3 if n >= 1 else 0)
-            else:
-                df['nivel'] = df['nivel_original']
-        else:
-            df['incentivo_coins'] = 0
-            df['incentivo_paypal'] = 0
-            df['nivel'] = df['nivel_original']
-        
-        # Limpiar valores para no cumplen
-        df.loc[df['cumple'] == 'NO', ['incentivo_coins', 'incentivo_paypal']] = 0
-        
-        # ✨ OBTENER paypal_bruto desde reportes_contratos (ambos contratos si hay equivalente)
-        try:
-            contratos_buscar = [contrato]
-            if contrato_equivalente:
-                contratos_buscar.append(contrato_equivalente)
-
-            reportes = supabase.table('reportes_contratos')\
-                .select('usuario_id, paypal_bruto')\
-                .in_('contrato', contratos_buscar)\
-                .eq('periodo', fecha_datos)\
-                .execute()
+    def construir_pagina():
+        return formatear(paginar_dataframe(df, ordenes.get(orden), descendente, pagina, tamano))
 
-            if reportes.data:
-                df_reportes = pd.DataFrame(reportes.data)
-                df['id_tiktok_str'] = df['id_tiktok'].astype(str)
-                df_reportes['usuario_id_str'] = df_reportes['usuario_id'].astype(str)
+    if clave_cache is None:
+        df_pagina = construir_pagina()
+    else:
+        df_pagina = obtener_render(clave_cache + (clave, orden, descendente, tamano, pagina), construir_pagina)
 
-                paypal_map = dict(zip(df_reportes['usuario_id_str'], df_reportes['paypal_bruto']))
+    desde = (pagina - 1) * tamano + 1 if total else 0
+    hasta = (pagina - 1) * tamano + len(df_pagina)
+    st.caption(f"Mostrando {desde:,}–{hasta:,} de {total:,} | Página {pagina} de {paginas}")
 
-                df['paypal_bruto'] = df['id_tiktok_str'].map(paypal_map).fillna(
-                    df.get('paypal_bruto', pd.Series(0, index=df.index))
-                )
-                df = df.drop('id_tiktok_str', axis=1)
-            else:
-                # Para jugadores de Vertex usar sueldo ya calculado si existe
-                if 'paypal_bruto' not in df.columns:
-                    df['paypal_bruto'] = 0
-        except Exception:
-            df['paypal_bruto'] = 0
-        
-        return df
-    
-    return pd.DataFrame()
+    st.dataframe(
+        df_pagina,
+        use_container_width=True,
+        hide_index=True,
+        column_config=column_config
+    )
 
 # ============================================================================
 # GRÁFICOS
@@ -741,6 +347,272 @@ def crear_grafico_pastel(nivel_counts):
     
     return fig
 
+# ============================================================================
+# PESTAÑAS DEL AGENTE (progreso, cambios entre cortes y red)
+# ============================================================================
+
+ORDENES_PROGRESO = {
+    '🎯 Más cerca del próximo pago': 'avance_proximo_pago',
+    '💎 Faltan diamantes': 'faltan_diamantes',
+    '📅 Faltan días': 'faltan_dias',
+    '📈 Diamantes proyectados': 'proy_diamantes',
+    '💰 PayPal proyectado': 'proy_incentivo_paypal',
+}
+
+def formatear_progreso(df_input):
+    """Columnas y formato de la tabla de progreso (solo la página visible)"""
+    columnas = {
+        'usuario': 'Usuario',
+        'nivel': 'Nivel',
+        'nivel_siguiente': 'Siguiente',
+        'faltan_dias': 'Faltan Días',
+        'faltan_horas': 'Faltan Horas',
+        'faltan_diamantes': 'Faltan 💎',
+        'avance_proximo_pago': 'Avance',
+        'proy_diamantes': '💎 Proyectados',
+        'proy_nivel': 'Nivel Proyectado',
+        'proy_incentivo_paypal': 'PayPal Proyectado',
+    }
+    df_show = df_input[[c for c in columnas if c in df_input.columns]].rename(columns=columnas)
+    
+    for col in ('Faltan 💎', '💎 Proyectados'):
+        if col in df_show.columns:
+            df_show[col] = df_show[col].apply(lambda x: f"{int(x):,}" if pd.notnull(x) else "—")
+    
+    if 'PayPal Proyectado' in df_show.columns:
+        df_show['PayPal Proyectado'] = df_show['PayPal Proyectado'].apply(lambda x: f"${float(x):,.2f}" if pd.notnull(x) else "—")
+    
+    return df_show
+
+def mostrar_progreso_agente(contrato, periodo, clave_vista):
+    """Pestaña de progreso: faltantes al siguiente nivel / tramo y proyección al cierre"""
+    try:
+        df_progreso = obtener_progreso_contrato(contrato, periodo)
+    except Exception as e:
+        st.error(f"❌ Error al calcular progreso: {str(e)}")
+        return
+    
+    if df_progreso.empty:
+        st.info("ℹ️ Sin datos de progreso")
+        return
+    
+    fecha = pd.Timestamp(periodo)
+    dias_mes = calendar.monthrange(fecha.year, fecha.month)[1]
+    st.caption(f"🎯 Faltantes al siguiente nivel / tramo y proyección al día {dias_mes} con el ritmo entre cortes")
+    
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        cerca = (df_progreso['avance_proximo_pago'] >= 0.8).sum()
+        st.metric("🔥 A menos del 20%", int(cerca))
+    
+    with col2:
+        suben = (df_progreso['proy_nivel'] > pd.to_numeric(df_progreso['nivel_original'], errors='coerce').fillna(0)).sum()
+        st.metric("📈 Subirían de nivel", int(suben))
+    
+    with col3:
+        st.metric("💰 PayPal proyectado", f"${df_progreso['proy_incentivo_paypal'].sum():,.2f}")
+    
+    mostrar_tabla_paginada(
+        df_progreso,
+        formatear_progreso,
+        "agente_progreso",
+        orden_default='🎯 Más cerca del próximo pago',
+        column_config={
+            'Avance': st.column_config.ProgressColumn('Avance', min_value=0, max_value=1, format="%.2f"),
+            'Faltan Horas': st.column_config.NumberColumn('Faltan Horas', format="%.1f"),
+        },
+        clave_cache=clave_vista,
+        ordenes=ORDENES_PROGRESO,
+    )
+
+ORDENES_CAMBIOS = {
+    '💎 Δ Diamantes': 'delta_diamantes',
+    '⏱️ Δ Horas': 'delta_horas',
+    '📅 Δ Días': 'delta_dias',
+    '🏆 Δ Nivel': 'delta_nivel',
+}
+
+def formatear_cambios(df_input):
+    """Columnas y formato de la tabla de cambios (solo la página visible)"""
+    df_show = pd.DataFrame({
+        'Usuario': df_input['usuario'].to_numpy(),
+        'Estado': df_input['estado'].map({'sigue': '', 'nuevo': '🆕 Nuevo', 'salió': '👋 Salió'}).to_numpy(),
+        'Días': df_input['dias_despues'].fillna(0).astype(int).to_numpy(),
+        'Δ Días': df_input['delta_dias'].astype(int).to_numpy(),
+        'Horas': df_input['horas_despues'].fillna(0).round(1).to_numpy(),
+        'Δ Horas': df_input['delta_horas'].round(1).to_numpy(),
+        'Diamantes': df_input['diamantes_despues'].apply(lambda x: f"{int(x):,}" if pd.notnull(x) else "—").to_numpy(),
+        'Δ Diamantes': df_input['delta_diamantes'].apply(lambda x: f"{int(x):+,}").to_numpy(),
+        'Nivel': [f"{int(a)} → {int(d)}" for a, d in zip(df_input['nivel_antes'].fillna(0), df_input['nivel_despues'].fillna(0))],
+        'Umbral': df_input['cruce_nivel'].map({1: '📈', -1: '📉', 0: ''}).to_numpy(),
+    })
+    return df_show
+
+def mostrar_cambios_agente(contrato, periodo):
+    """Pestaña de cambios: qué se movió entre dos cortes (por defecto el anterior y el elegido)"""
+    try:
+        cortes = obtener_cortes_contrato(contrato)
+    except Exception as e:
+        st.error(f"❌ Error al cargar cortes: {str(e)}")
+        return
+    
+    if len(cortes) < 2:
+        st.info("ℹ️ Se necesitan al menos dos cortes del contrato para comparar")
+        return
+    
+    despues_default = str(periodo) if str(periodo) in cortes else cortes[0]
+    antes_default = corte_anterior(cortes, despues_default) or cortes[-1]
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        antes = st.selectbox("📅 Desde el corte:", cortes, index=cortes.index(antes_default),
+                             format_func=formatear_fecha_español, key=f"cambios_antes_{despues_default}")
+    
+    with col2:
+        despues = st.selectbox("📅 Hasta el corte:", cortes, index=cortes.index(despues_default),
+                               format_func=formatear_fecha_español, key=f"cambios_despues_{despues_default}")
+    
+    if antes == despues:
+        st.info("ℹ️ Elige dos cortes distintos")
+        return
+    if antes > despues:
+        antes, despues = despues, antes
+    
+    try:
+        cambios = obtener_cambios_contrato(contrato, antes, despues)
+    except Exception as e:
+        st.error(f"❌ Error al comparar cortes: {str(e)}")
+        return
+    
+    dias_entre = (pd.Timestamp(despues) - pd.Timestamp(antes)).days
+    st.caption(f"🔀 {formatear_fecha_español(antes)} → {formatear_fecha_español(despues)} ({dias_entre} días)")
+    
+    subieron = cambios[cambios['cruce_nivel'] > 0]
+    bajaron = cambios[cambios['cruce_nivel'] < 0]
+    
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric("💎 Diamantes ganados", f"{int(cambios['delta_diamantes'].sum()):+,}")
+    
+    with col2:
+        activos = (cambios[['delta_dias', 'delta_horas', 'delta_diamantes']] != 0).any(axis=1).sum()
+        st.metric("🔥 Con actividad", f"{int(activos):,}")
+    
+    with col3:
+        st.metric("📈 Subieron de nivel", len(subieron))
+    
+    with col4:
+        st.metric("📉 Bajaron de nivel", len(bajaron))
+    
+    nuevos = int((cambios['estado'] == 'nuevo').sum())
+    salieron = int((cambios['estado'] == 'salió').sum())
+    if nuevos or salieron:
+        st.caption(f"🆕 {nuevos} nuevos · 👋 {salieron} ya no aparecen")
+    
+    if not subieron.empty or not bajaron.empty:
+        st.markdown("### 🏆 Cruzaron un umbral de nivel")
+        cruces = pd.concat([subieron, bajaron])
+        st.dataframe(
+            formatear_cambios(cruces.sort_values(['cruce_nivel', 'nivel_despues'], ascending=False))
+                [['Usuario', 'Nivel', 'Umbral', 'Días', 'Horas', 'Δ Diamantes']],
+            use_container_width=True,
+            hide_index=True,
+        )
+    
+    st.markdown("### 👥 Todos los jugadores")
+    solo_cambios = st.checkbox("Solo jugadores con cambios", value=True, key="cambios_solo_activos")
+    if solo_cambios:
+        cambios = cambios[(cambios[[f'delta_{c}' for c in COLUMNAS_CAMBIOS]] != 0).any(axis=1)
+                          | (cambios['estado'] != 'sigue')]
+    
+    mostrar_tabla_paginada(
+        cambios,
+        formatear_cambios,
+        "agente_cambios",
+        orden_default='💎 Δ Diamantes',
+        column_config={
+            'Δ Horas': st.column_config.NumberColumn('Δ Horas', format="%+.1f"),
+            'Δ Días': st.column_config.NumberColumn('Δ Días', format="%+d"),
+            'Horas': st.column_config.NumberColumn('Horas', format="%.1f"),
+        },
+        ordenes=ORDENES_CAMBIOS,
+    )
+
+ORDENES_RED = {
+    '💎 Diamantes': 'diamantes',
+    '🏢 Contrato': 'contrato_grupo',
+    '📅 Días': 'dias',
+    '🏆 Nivel': 'nivel',
+}
+
+def mostrar_red_agente(contrato, periodo, formatear, column_config, version):
+    """
+    Pestaña de red: totales por subcontrato y tabla combinada de toda la red.
+    `version` es la de la copia mostrada (frescura); sin versión no hay caché de render.
+    """
+    try:
+        df_red = obtener_datos_red(contrato, periodo)
+    except Exception as e:
+        st.error(f"❌ Error al cargar la red: {str(e)}")
+        return
+    
+    if df_red.empty:
+        st.info("ℹ️ Sin datos de la red en este periodo")
+        return
+    
+    resumen = resumen_red(df_red)
+    
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric("🏢 Contratos", len(resumen))
+    
+    with col2:
+        st.metric("👥 Jugadores", f"{int(resumen['jugadores'].sum()):,}")
+    
+    with col3:
+        st.metric("✅ Cumplen", f"{int(resumen['cumplen'].sum()):,}")
+    
+    with col4:
+        st.metric("💰 PayPal", f"${resumen['incentivo_paypal'].sum():,.2f}")
+    
+    st.markdown("### 🏢 Por contrato")
+    st.dataframe(
+        resumen.rename(columns={
+            'contrato': 'Contrato', 'jugadores': 'Jugadores', 'cumplen': 'Cumplen', 'diamantes': 'Diamantes',
+            'incentivo_coins': 'Incentivo Coin', 'incentivo_paypal': 'Incentivo PayPal', 'paypal_bruto': 'Sueldo',
+        }),
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            'Diamantes': st.column_config.NumberColumn('Diamantes', format="%d"),
+            'Incentivo Coin': st.column_config.NumberColumn('Incentivo Coin', format="%d"),
+            'Incentivo PayPal': st.column_config.NumberColumn('Incentivo PayPal', format="$%.2f"),
+            'Sueldo': st.column_config.NumberColumn('Sueldo', format="$%.2f"),
+        }
+    )
+    
+    st.markdown("### 👥 Toda la red")
+    
+    def formatear_red(df_input):
+        """Formato de la vista agente con la columna de contrato al inicio"""
+        df_show = formatear(df_input)
+        df_show.insert(0, 'Contrato', df_input['contrato_grupo'].to_numpy())
+        return df_show
+    
+    mostrar_tabla_paginada(
+        df_red,
+        formatear_red,
+        "agente_red",
+        column_config={'Contrato': st.column_config.TextColumn('Contrato', width='small'), **column_config},
+        clave_cache=(clave_render(contrato, periodo, 'red:' + ','.join(sorted(df_red['contrato_grupo'].unique())),
+                                  version=version) if version is not None else None),
+        ordenes=ORDENES_RED,
+    )
+
 # ============================================================================
 # MODO 1: PANTALLA PÚBLICA (sin login)
 # ============================================================================
@@ -838,7 +710,7 @@ def mostrar_panel_admin(token_data):
     
     st.title("🔐 Panel de Administración")
     
-    tab1, tab2, tab3 = st.tabs(["📊 Dashboard", "👥 Usuarios", "⚙️ Configuración"])
+    tab1, tab2, tab3, tab4 = st.tabs(["📊 Dashboard", "👥 Usuarios", "⚙️ Configuración", "🧮 Conciliación"])
     
     with tab1:
         st.subheader("📈 Métricas Generales")
@@ -858,8 +730,37 @@ def mostrar_panel_admin(token_data):
             with col3:
                 st.metric("✅ Sistema", "Operativo")
         
+            st.divider()
+
+            resumen = obtener_resumen_periodo(periodo_actual)
+            if resumen.empty:
+                st.info("ℹ️ Sin datos del corte actual")
+            else:
+                st.markdown(f"### 🏢 Contratos en el corte {formatear_fecha_español(periodo_actual)}")
+
+                col1, col2, col3 = st.columns(3)
+
+                with col1:
+                    st.metric("🏢 Contratos", len(resumen))
+
+                with col2:
+                    st.metric("👥 Jugadores", f"{int(resumen['jugadores'].sum()):,}")
+
+                with col3:
+                    st.metric("💎 Diamantes", f"{int(pd.to_numeric(resumen['diamantes']).sum()):,}")
+
+                st.dataframe(
+                    resumen.rename(columns={
+                        'contrato': 'Contrato', 'jugadores': 'Jugadores', 'con_actividad': 'Con actividad',
+                        'diamantes': 'Diamantes', 'dias_promedio': 'Días promedio',
+                    }),
+                    use_container_width=True,
+                    hide_index=True,
+                    column_config={'Diamantes': st.column_config.NumberColumn('Diamantes', format="%d")}
+                )
+        
         st.divider()
-        st.info("💡 Dashboard completo - En desarrollo")
+        mostrar_historico_almacen()
     
     with tab2:
         st.subheader("👥 Gestión de Usuarios")
@@ -867,7 +768,16 @@ def mostrar_panel_admin(token_data):
     
     with tab3:
         st.subheader("⚙️ Configuración del Sistema")
-        st.info("💡 Configuración - En desarrollo")
+        mostrar_estado_precalentador()
+        st.divider()
+        mostrar_estado_planificador()
+        st.divider()
+        mostrar_estado_caches_datos()
+        st.divider()
+        mostrar_estado_rutas_rapidas()
+    
+    with tab4:
+        mostrar_conciliacion()
 
 # ============================================================================
 # MODO 3: PANEL AGENTE
@@ -957,7 +867,9 @@ def mostrar_vista_agente(agente_data):
         st.metric("📆 Periodo", obtener_mes_español(periodo_seleccionado))
     
     with st.spinner('📄 Cargando datos...'):
-        df = obtener_datos_contrato(contrato, periodo_seleccionado)
+        df, frescura = obtener_datos_contrato_swr(contrato, periodo_seleccionado)
+    
+    mostrar_frescura(frescura)
     
     if df.empty:
         st.info(f"ℹ️ Sin datos para el periodo {obtener_mes_español(periodo_seleccionado)}")
@@ -965,32 +877,42 @@ def mostrar_vista_agente(agente_data):
     
     st.divider()
     
-    tab1, tab2, tab3, tab4 = st.tabs(["👥 Todos", "✅ Cumplen", "📄 Notas del Periodo", "📊 Resumen"])
+    mostrar_busqueda_jugadores(contrato, periodo_seleccionado, df)
     
-    with tab1:
-        st.caption(f"📊 {len(df)} usuarios")
-        
-        # MOSTRAR COLUMNAS COMPLETAS (vista agente)
-        columnas_mostrar = ['usuario', 'agencia', 'dias', 'duracion', 'diamantes', 
-                           'nivel', 'cumple', 'incentivo_coins', 'incentivo_paypal',
-                           'paypal_bruto']
-        
-        df_show = df[[c for c in columnas_mostrar if c in df.columns]].copy()
-        
-        # Renombrar columnas
-        nombres_columnas = {
-            'usuario': 'Usuario',
-            'agencia': 'Agencia',
-            'dias': 'Días',
-            'duracion': 'Horas',
-            'diamantes': 'Diamantes',
-            'nivel': 'Nivel',
-            'cumple': 'Cumple',
-            'incentivo_coins': 'Incentivo Coin',
-            'incentivo_paypal': 'Incentivo PayPal',
-            'paypal_bruto': 'Sueldo'
-        }
-        
+    # Agentes con subcontratos (jerarquia_contratos) ven además su red completa
+    try:
+        red = contratos_descendientes(contrato)
+    except Exception:
+        red = [contrato]  # registro de contratos no disponible: solo el contrato propio
+    nombres_tabs = ["👥 Todos", "✅ Cumplen", "🎯 Progreso", "🔀 Cambios", "📄 Notas del Periodo", "📊 Resumen"]
+    if len(red) > 1:
+        nombres_tabs.append(f"🌐 Mi Red ({len(red)})")
+    
+    tabs = st.tabs(nombres_tabs)
+    tab1, tab2, tab_progreso, tab_cambios, tab3, tab4 = tabs[:6]
+    
+    # MOSTRAR COLUMNAS COMPLETAS (vista agente)
+    columnas_mostrar = ['usuario', 'agencia', 'dias', 'duracion', 'diamantes', 
+                       'nivel', 'cumple', 'incentivo_coins', 'incentivo_paypal',
+                       'paypal_bruto']
+    
+    # Renombrar columnas
+    nombres_columnas = {
+        'usuario': 'Usuario',
+        'agencia': 'Agencia',
+        'dias': 'Días',
+        'duracion': 'Horas',
+        'diamantes': 'Diamantes',
+        'nivel': 'Nivel',
+        'cumple': 'Cumple',
+        'incentivo_coins': 'Incentivo Coin',
+        'incentivo_paypal': 'Incentivo PayPal',
+        'paypal_bruto': 'Sueldo'
+    }
+    
+    def formatear_dataframe_agente(df_input):
+        """Selecciona, renombra y formatea (solo se llama con la página visible)"""
+        df_show = df_input[[c for c in columnas_mostrar if c in df_input.columns]].copy()
         df_show = df_show.rename(columns={k: v for k, v in nombres_columnas.items() if k in df_show.columns})
         
         # Formatear números
@@ -1006,53 +928,45 @@ def mostrar_vista_agente(agente_data):
         if 'Sueldo' in df_show.columns:
             df_show['Sueldo'] = df_show['Sueldo'].apply(lambda x: f"${float(x):,.2f}" if pd.notnull(x) else "$0.00")
         
-        # Configuración de columnas compactas
-        column_config = {
-            'Usuario': st.column_config.TextColumn('Usuario', width='medium'),
-            'Agencia': st.column_config.TextColumn('Agencia', width='small'),
-            'Días': st.column_config.NumberColumn('Días', width='small'),
-            'Horas': st.column_config.TextColumn('Horas', width='small'),
-            'Diamantes': st.column_config.TextColumn('Diamantes', width='medium'),
-            'Nivel': st.column_config.NumberColumn('Nivel', width='small'),
-            'Cumple': st.column_config.TextColumn('Cumple', width='small'),
-            'Incentivo Coin': st.column_config.TextColumn('Incentivo Coin', width='medium'),
-            'Incentivo PayPal': st.column_config.TextColumn('Incentivo PayPal', width='medium'),
-            'Sueldo': st.column_config.TextColumn('Sueldo', width='medium')
-        }
-        
-        st.dataframe(
-            df_show.sort_values('Diamantes', ascending=False) if 'Diamantes' in df_show.columns else df_show, 
-            use_container_width=True, 
-            hide_index=True, 
-            height=500,
-            column_config=column_config
-        )
+        return df_show
+    
+    # Clave de la caché de render con la versión de los datos mostrados (la copia
+    # puede ser anterior a la versión actual); copia sin versión: sin caché
+    clave_vista = (clave_render(contrato, periodo_seleccionado, 'agente', version=frescura['version'])
+                   if frescura['version'] is not None else None)
+    
+    # Configuración de columnas compactas
+    column_config = {
+        'Usuario': st.column_config.TextColumn('Usuario', width='medium'),
+        'Agencia': st.column_config.TextColumn('Agencia', width='small'),
+        'Días': st.column_config.NumberColumn('Días', width='small'),
+        'Horas': st.column_config.TextColumn('Horas', width='small'),
+        'Diamantes': st.column_config.TextColumn('Diamantes', width='medium'),
+        'Nivel': st.column_config.NumberColumn('Nivel', width='small'),
+        'Cumple': st.column_config.TextColumn('Cumple', width='small'),
+        'Incentivo Coin': st.column_config.TextColumn('Incentivo Coin', width='medium'),
+        'Incentivo PayPal': st.column_config.TextColumn('Incentivo PayPal', width='medium'),
+        'Sueldo': st.column_config.TextColumn('Sueldo', width='medium')
+    }
+    
+    with tab1:
+        st.caption(f"📊 {len(df)} usuarios")
+        mostrar_tabla_paginada(df, formatear_dataframe_agente, "agente_todos", column_config=column_config,
+                               clave_cache=clave_vista)
     
     with tab2:
         df_cumplen = df[df['cumple'] == 'SI']
         st.caption(f"✅ {len(df_cumplen)} cumplen")
         
         if not df_cumplen.empty:
-            df_show = df_cumplen[[c for c in columnas_mostrar if c in df_cumplen.columns]].copy()
-            df_show = df_show.rename(columns={k: v for k, v in nombres_columnas.items() if k in df_show.columns})
-            
-            # Formatear igual
-            if 'Diamantes' in df_show.columns:
-                df_show['Diamantes'] = df_show['Diamantes'].apply(lambda x: f"{int(x):,}" if pd.notnull(x) else "0")
-            if 'Incentivo Coin' in df_show.columns:
-                df_show['Incentivo Coin'] = df_show['Incentivo Coin'].apply(lambda x: f"{int(x):,}" if pd.notnull(x) else "0")
-            if 'Incentivo PayPal' in df_show.columns:
-                df_show['Incentivo PayPal'] = df_show['Incentivo PayPal'].apply(lambda x: f"${float(x):,.2f}" if pd.notnull(x) else "$0.00")
-            if 'Sueldo' in df_show.columns:
-                df_show['Sueldo'] = df_show['Sueldo'].apply(lambda x: f"${float(x):,.2f}" if pd.notnull(x) else "$0.00")
-            
-            st.dataframe(
-                df_show.sort_values('Diamantes', ascending=False) if 'Diamantes' in df_show.columns else df_show, 
-                use_container_width=True, 
-                hide_index=True, 
-                height=500,
-                column_config=column_config
-            )
+            mostrar_tabla_paginada(df_cumplen, formatear_dataframe_agente, "agente_cumplen", column_config=column_config,
+                                   clave_cache=clave_vista)
+    
+    with tab_progreso:
+        mostrar_progreso_agente(contrato, periodo_seleccionado, clave_vista)
+    
+    with tab_cambios:
+        mostrar_cambios_agente(contrato, periodo_seleccionado)
     
     with tab3:
         st.subheader("📄 Notas del Periodo")
@@ -1163,9 +1077,16 @@ def mostrar_vista_agente(agente_data):
         
         st.divider()
         
-        nivel_counts = df['nivel'].value_counts().sort_index(ascending=False)
-        fig = crear_grafico_pastel(nivel_counts)
+        fig = grafico_niveles(df, clave_vista)
         st.plotly_chart(fig, use_container_width=True)
+    
+    if len(red) > 1:
+        with tabs[6]:
+            mostrar_red_agente(contrato, periodo_seleccionado, formatear_dataframe_agente, column_config,
+                               frescura['version'])
+    
+    # Ya pintado: el periodo anterior / siguiente se carga en segundo plano
+    precargar_periodos_vecinos(contrato, periodos, periodo_seleccionado)
 
 # ============================================================================
 # MODO 4: VISTA JUGADORES (token grupal - columnas limitadas)
@@ -1177,9 +1098,6 @@ def mostrar_vista_jugadores(token_data):
     contrato = token_data['contrato']
     nombre = token_data.get('nombre', contrato)
     
-    # ✨ MEJORADO: Obtener columnas ocultas con alias
-    columnas_ocultas_config = obtener_columnas_ocultas(contrato)
-    
     col_logo, col_titulo, col_whatsapp = st.columns([1, 3, 2])
     
     with col_logo:
@@ -1250,7 +1168,9 @@ def mostrar_vista_jugadores(token_data):
         st.metric("📆 Periodo", obtener_mes_español(periodo_seleccionado))
     
     with st.spinner('📄 Cargando...'):
-        df = obtener_datos_contrato(contrato, periodo_seleccionado)
+        df, frescura = obtener_datos_contrato_swr(contrato, periodo_seleccionado)
+    
+    mostrar_frescura(frescura)
     
     if df.empty:
         st.info(f"ℹ️ Sin datos")
@@ -1260,35 +1180,14 @@ def mostrar_vista_jugadores(token_data):
     
     tab1, tab2, tab3, tab4 = st.tabs(["👥 Todos", "✅ Cumplen", "❌ No Cumplen", "📊 Resumen"])
     
+    columnas_a_ocultar = columnas_ocultas_jugadores(contrato)
+    
+    # Versión de los datos mostrados (ver vista agente)
+    clave_vista = (clave_render(contrato, periodo_seleccionado, 'jugador', columnas_a_ocultar, frescura['version'])
+                   if frescura['version'] is not None else None)
+    
     def formatear_dataframe_jugadores(df_input):
         """Formatea con columnas ocultas usando aliases"""
-        # Mapeo de configuración a columnas reales
-        mapeo_ocultar = {
-            # Incentivos
-            'coins': 'incentivo_coins',
-            'incentivo_coins': 'incentivo_coins',
-            'paypal': 'incentivo_paypal',
-            'incentivo_paypal': 'incentivo_paypal',
-            'sueldo': 'paypal_bruto',
-            'paypal_bruto': 'paypal_bruto',
-            'coins_bruto': 'coins_bruto',
-            # Métricas básicas
-            'diamantes': 'diamantes',
-            'dias': 'dias',
-            'duracion': 'duracion',
-            'horas': 'duracion',
-            'nivel': 'nivel',
-            'cumple': 'cumple',
-            # Usuario
-            'usuario': 'usuario'
-        }
-        
-        columnas_a_ocultar = set(['agencia'])  # Siempre ocultar agencia en vista jugadores
-        
-        for config in columnas_ocultas_config:
-            if config in mapeo_ocultar:
-                columnas_a_ocultar.add(mapeo_ocultar[config])
-        
         columnas_orden = ['usuario', 'dias', 'duracion', 'diamantes', 'nivel', 'cumple', 
                          'incentivo_coins', 'incentivo_paypal', 'paypal_bruto']
         
@@ -1326,22 +1225,22 @@ def mostrar_vista_jugadores(token_data):
     
     with tab1:
         st.caption(f"📊 {len(df)} usuarios")
-        st.dataframe(formatear_dataframe_jugadores(df.sort_values('dias', ascending=False)), 
-                    use_container_width=True, hide_index=True, height=500)
+        mostrar_tabla_paginada(df, formatear_dataframe_jugadores, "jug_todos", orden_default='📅 Días',
+                               columnas_ocultas=columnas_a_ocultar, clave_cache=clave_vista)
     
     with tab2:
         df_cumplen = df[df['cumple'] == 'SI']
         st.caption(f"✅ {len(df_cumplen)} cumplen")
         if not df_cumplen.empty:
-            st.dataframe(formatear_dataframe_jugadores(df_cumplen.sort_values('dias', ascending=False)), 
-                        use_container_width=True, hide_index=True, height=500)
+            mostrar_tabla_paginada(df_cumplen, formatear_dataframe_jugadores, "jug_cumplen", orden_default='📅 Días',
+                                   columnas_ocultas=columnas_a_ocultar, clave_cache=clave_vista)
     
     with tab3:
         df_no = df[df['cumple'] == 'NO']
         st.caption(f"❌ {len(df_no)} no cumplen")
         if not df_no.empty:
-            st.dataframe(formatear_dataframe_jugadores(df_no.sort_values('dias', ascending=False)), 
-                        use_container_width=True, hide_index=True, height=500)
+            mostrar_tabla_paginada(df_no, formatear_dataframe_jugadores, "jug_no_cumplen", orden_default='📅 Días',
+                                   columnas_ocultas=columnas_a_ocultar, clave_cache=clave_vista)
     
     with tab4:
         st.markdown("### 📈 Métricas")
@@ -1362,9 +1261,166 @@ def mostrar_vista_jugadores(token_data):
         
         st.divider()
         
-        nivel_counts = df['nivel'].value_counts().sort_index(ascending=False)
-        fig = crear_grafico_pastel(nivel_counts)
+        fig = grafico_niveles(df, clave_vista)
         st.plotly_chart(fig, use_container_width=True)
+    
+    # Ya pintado: el periodo anterior / siguiente se carga en segundo plano
+    precargar_periodos_vecinos(contrato, periodos, periodo_seleccionado)
+
+# ============================================================================
+# PERFIL DE CPU BAJO DEMANDA (sesión admin + ?perfil=1)
+# ============================================================================
+
+PARAMETRO_PERFIL = "perfil"
+PERFIL_INTERVALO_MUESTREO = 0.005   # segundos entre muestras de pila
+PERFIL_TOP = 15                     # funciones en la tabla del sidebar
+
+# Categoría de una muestra: la primera que coincida recorriendo la pila desde la hoja.
+# Esperar a ejecutar_async / planificador es esperar a Supabase (hilo del bucle async).
+CATEGORIAS_PERFIL = [
+    ('🌐 Supabase', ('ejecutar_async', 'ejecutar_planificado', 'aejecutar_planificado'),
+     ('/supabase', '/postgrest', '/httpx', '/httpcore', '/gotrue')),
+    ('🐼 pandas / numpy', (), ('/pandas/', '/numpy/', '/pyarrow/')),
+    ('📺 Streamlit', (), ('/streamlit/', '/plotly/', '/google/protobuf/')),
+]
+
+class MuestreadorPilas:
+    """
+    Muestrea la pila del hilo del script cada PERFIL_INTERVALO_MUESTREO s
+    desde otro hilo: pilas en formato folded (flame graph) y muestras por categoría.
+    """
+
+    def __init__(self, hilo_id):
+        self.hilo_id = hilo_id
+        self.pilas = {}
+        self.categorias = {}
+        self._parar = threading.Event()
+        self._hilo = threading.Thread(target=self._correr, daemon=True, name='perfil-muestreo')
+
+    @staticmethod
+    def _categoria(frame):
+        while frame is not None:
+            codigo = frame.f_code
+            for nombre, funciones, rutas in CATEGORIAS_PERFIL:
+                if codigo.co_name in funciones or any(r in codigo.co_filename for r in rutas):
+                    return nombre
+            frame = frame.f_back
+        return '🧮 app / otros'
+
+    def _correr(self):
+        while not self._parar.wait(PERFIL_INTERVALO_MUESTREO):
+            frame = sys._current_frames().get(self.hilo_id)
+            if frame is None:
+                continue
+            categoria = self._categoria(frame)
+            pila = []
+            while frame is not None:
+                codigo = frame.f_code
+                pila.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})")
+                frame = frame.f_back
+            clave = ';'.join(reversed(pila))
+            self.pilas[clave] = self.pilas.get(clave, 0) + 1
+            self.categorias[categoria] = self.categorias.get(categoria, 0) + 1
+
+    def iniciar(self):
+        self._hilo.start()
+
+    def detener(self):
+        self._parar.set()
+        self._hilo.join()
+
+    def folded(self):
+        """Texto 'pila;separada;por;puntos_y_coma N' (speedscope.app, flamegraph.pl)"""
+        return '\n'.join(f"{pila} {n}" for pila, n in sorted(self.pilas.items()))
+
+def _top_funciones(perfil, limite=PERFIL_TOP):
+    """Funciones con más tiempo propio del perfil determinista"""
+    estadisticas = pstats.Stats(perfil)
+    filas = []
+    for (archivo, linea, funcion), (_, llamadas, propio, acumulado, _) in estadisticas.stats.items():
+        filas.append({
+            'Función': f"{funcion} ({os.path.basename(archivo)}:{linea})" if linea else funcion,
+            'Llamadas': llamadas,
+            'Propio (s)': round(propio, 3),
+            'Acumulado (s)': round(acumulado, 3),
+        })
+    return pd.DataFrame(filas).sort_values('Propio (s)', ascending=False).head(limite)
+
+def mostrar_perfil(perfil, muestreador, segundos):
+    """Sidebar: tiempo por categoría, funciones calientes y descargas"""
+    with st.sidebar.expander("🔬 Perfil de esta ejecución", expanded=True):
+        st.metric("⏱️ Ejecución completa", f"{segundos * 1000:,.0f} ms")
+
+        total = sum(muestreador.categorias.values())
+        if total:
+            for categoria, n in sorted(muestreador.categorias.items(), key=lambda x: -x[1]):
+                st.caption(f"{categoria}: {n / total:.0%} (~{n * PERFIL_INTERVALO_MUESTREO * 1000:,.0f} ms)")
+
+        st.dataframe(_top_funciones(perfil), use_container_width=True, hide_index=True)
+
+        buffer = io.StringIO()
+        pstats.Stats(perfil, stream=buffer).sort_stats('cumulative').print_stats(60)
+        marca = datetime.now().strftime('%Y%m%d_%H%M%S')
+
+        st.download_button(
+            label="📥 Perfil (.prof)",
+            data=marshal.dumps(pstats.Stats(perfil).stats),
+            file_name=f"perfil_{marca}.prof",
+            mime="application/octet-stream",
+            key="descargar_perfil_prof"
+        )
+        st.download_button(
+            label="🔥 Flame graph (folded)",
+            data=muestreador.folded().encode('utf-8'),
+            file_name=f"perfil_{marca}.folded.txt",
+            mime="text/plain",
+            key="descargar_perfil_folded"
+        )
+        st.download_button(
+            label="📄 Resumen (texto)",
+            data=buffer.getvalue().encode('utf-8'),
+            file_name=f"perfil_{marca}.txt",
+            mime="text/plain",
+            key="descargar_perfil_txt"
+        )
+        st.caption("`.prof`: snakeviz / `python -m pstats`. Folded: speedscope.app o flamegraph.pl")
+
+def ejecutar_con_perfil(funcion):
+    """
+    Corre `funcion` (main) y, solo en una sesión admin con ?perfil=1 en la URL,
+    la perfila completa: cProfile para funciones y un muestreo de pila para el
+    flame graph. La URL no lleva credenciales (se comparte en capturas e
+    historial). Sin el parámetro no se instala nada (costo cero) y si el
+    perfilador no arranca la app corre igual, sin perfil.
+    """
+    try:
+        activo = (st.query_params.get(PARAMETRO_PERFIL) == '1'
+                  and st.session_state.get('modo') == 'admin')
+    except Exception:
+        activo = False
+    if not activo:
+        return funcion()
+
+    try:
+        perfil = cProfile.Profile()
+        muestreador = MuestreadorPilas(threading.get_ident())
+        perfil.enable()
+    except Exception as e:
+        print(f"⚠️ Perfil no disponible: {e}")
+        return funcion()
+
+    muestreador.iniciar()
+    inicio = time.perf_counter()
+    try:
+        return funcion()
+    finally:
+        perfil.disable()
+        segundos = time.perf_counter() - inicio
+        muestreador.detener()
+        try:
+            mostrar_perfil(perfil, muestreador, segundos)
+        except Exception as e:
+            print(f"⚠️ No se pudo mostrar el perfil: {e}")
 
 # ============================================================================
 # MAIN - ROUTER
@@ -1373,6 +1429,17 @@ def mostrar_vista_jugadores(token_data):
 def main():
     """Router principal"""
     
+    configurar_pagina()
+    
+    # Hilo de fondo que precalienta la caché cuando llegan datos nuevos
+    obtener_precalentador()
+    
+    # API JSON de lectura para las páginas HTML (opcional, mismo proceso y cachés)
+    iniciar_api_lectura()
+    
+    # Aviso (una vez por proceso) si faltan las RPC / índices de migraciones/
+    verificar_rutas_rapidas()
+    
     # Verificar si hay token en URL (jugadores con token grupal)
     query_params = st.query_params
     token_url = query_params.get("token", None)
@@ -1423,4 +1490,4 @@ def main():
             st.rerun()
 
 if __name__ == "__main__":
-    main()
+    ejecutar_con_perfil(main)
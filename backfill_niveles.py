@@ -0,0 +1,278 @@
+# ============================================================================
+# backfill_niveles.py - Recalculo histórico de niveles e incentivos
+# Reparte (contrato, corte) entre un pool de procesos, reutiliza la lógica
+# de capa_datos.py y escribe en lotes a la tabla niveles_calculados.
+#
+# Uso:
+#   python backfill_niveles.py                       # todo el historial
+#   python backfill_niveles.py --contratos A002 B003 --desde 2026-01-01
+#   python backfill_niveles.py --procesos 8 --checkpoint backfill.jsonl
+#   python backfill_niveles.py --solo-calcular       # sin escribir (prueba)
+# ============================================================================
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import pandas as pd
+from streamlit import logger as st_logger
+
+# capa_datos.py usa Streamlit; fuera de `streamlit run` solo emite avisos de "bare mode"
+st_logger.set_log_level("error")
+
+import capa_datos
+
+TABLA_DESTINO = "niveles_calculados"
+LOTE_LECTURA = 1000    # filas por página de usuarios_tiktok
+LOTE_ESCRITURA = 500   # filas por upsert
+
+# usuarios_tiktok no tiene columna horas: calcular_niveles_contrato la deriva de duracion
+COLUMNAS_LECTURA = "id_tiktok, contrato, fecha_datos, dias, duracion, diamantes"
+COLUMNAS_RESULTADO = [
+    "contrato", "fecha_datos", "id_tiktok", "dias", "horas", "diamantes",
+    "nivel_original", "nivel", "cumple", "incentivo_coins", "incentivo_paypal",
+]
+
+# ============================================================================
+# DESCUBRIMIENTO DE TRABAJO
+# ============================================================================
+
+def listar_pares(contratos=None, desde=None, hasta=None):
+    """
+    Pares (contrato, fecha_datos) existentes en usuarios_tiktok. Con contratos
+    explícitos usa la RPC obtener_fechas_disponibles (migraciones/); si no,
+    lee esas dos columnas página a página.
+    """
+    supabase = capa_datos.get_supabase()
+
+    if contratos:
+        try:
+            pares = set()
+            for contrato in contratos:
+                resultado = supabase.rpc("obtener_fechas_disponibles", {"p_contrato": contrato}).execute()
+                pares.update((contrato, str(r["fecha_datos"])) for r in resultado.data or []
+                             if (not desde or str(r["fecha_datos"]) >= desde)
+                             and (not hasta or str(r["fecha_datos"]) <= hasta))
+            return sorted(pares, key=lambda p: (p[1], p[0]))
+        except Exception:
+            pass  # RPC sin aplicar: lectura paginada
+
+    def consulta():
+        q = supabase.table("usuarios_tiktok").select("contrato, fecha_datos")
+        if contratos:
+            q = q.in_("contrato", list(contratos))
+        if desde:
+            q = q.gte("fecha_datos", desde)
+        if hasta:
+            q = q.lte("fecha_datos", hasta)
+        return q.order("fecha_datos").order("contrato")
+
+    pares = set()
+    for lote in capa_datos.iterar_paginas(consulta, LOTE_LECTURA):
+        for row in lote:
+            if row.get("contrato") and row.get("fecha_datos"):
+                pares.add((str(row["contrato"]).strip(), str(row["fecha_datos"])))
+    return sorted(pares, key=lambda p: (p[1], p[0]))
+
+def huella_reglas(config_contratos, filas_reglas, filas_incentivos):
+    """
+    Huella de todo lo que cambia el resultado además de usuarios_tiktok:
+    config de contratos, tablas de reglas e incentivos. Un par del checkpoint
+    solo cuenta como hecho si se calculó con la misma huella.
+    """
+    def canonico(filas):
+        # Sin depender del orden en que PostgREST devuelve las filas
+        return sorted(json.dumps(f, sort_keys=True, default=str) for f in filas)
+
+    texto = json.dumps([config_contratos,
+                        {tabla: canonico(filas) for tabla, filas in filas_reglas.items()},
+                        canonico(filas_incentivos)], sort_keys=True, default=str)
+    return hashlib.sha1(texto.encode("utf-8")).hexdigest()[:16]
+
+def leer_checkpoint(ruta, huella):
+    """
+    Pares ya completados en corridas anteriores con las mismas reglas (archivo
+    JSON por línea); los calculados con otra huella se vuelven a procesar.
+    """
+    hechos = set()
+    if ruta and os.path.exists(ruta):
+        with open(ruta, encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    reg = json.loads(linea)
+                    if reg.get("huella") == huella:
+                        hechos.add((reg["contrato"], reg["periodo"]))
+                except (ValueError, KeyError, AttributeError):
+                    continue
+    return hechos
+
+def registrar_checkpoint(ruta, resultado, huella):
+    """Agrega un par terminado al checkpoint (se escribe al completar cada par)"""
+    if not ruta:
+        return
+    with open(ruta, "a", encoding="utf-8") as f:
+        f.write(json.dumps({**resultado, "huella": huella}, ensure_ascii=False) + "\n")
+
+# ============================================================================
+# WORKER (un proceso del pool)
+# ============================================================================
+
+_CONFIG_WORKER = {}
+
+def _inicializar_worker(config_contratos, filas_reglas, filas_incentivos, solo_calcular):
+    """Recibe una sola vez la config de contratos, las reglas y la tabla de incentivos"""
+    _CONFIG_WORKER["config"] = config_contratos
+    _CONFIG_WORKER["reglas"] = filas_reglas
+    _CONFIG_WORKER["motores"] = {}
+    _CONFIG_WORKER["incentivos"] = pd.DataFrame(filas_incentivos)
+    _CONFIG_WORKER["solo_calcular"] = solo_calcular
+
+def _motor_periodo(periodo):
+    """MotorReglas del corte, compilado una vez por worker"""
+    motores = _CONFIG_WORKER["motores"]
+    if periodo not in motores:
+        reglas = capa_datos.compilar_reglas_calculo(_CONFIG_WORKER["reglas"], periodo)
+        motores[periodo] = capa_datos.MotorReglas(_CONFIG_WORKER["config"], reglas)
+    return motores[periodo]
+
+def _escribir_lote(supabase, filas):
+    """Upsert en bloque (idempotente: clave contrato + fecha_datos + id_tiktok)"""
+    supabase.table(TABLA_DESTINO)\
+        .upsert(filas, on_conflict="contrato,fecha_datos,id_tiktok")\
+        .execute()
+
+def procesar_par(contrato, periodo):
+    """
+    Recalcula un (contrato, corte): lee usuarios_tiktok por páginas, aplica
+    calcular_niveles_contrato de capa_datos.py (con el motor de reglas del corte)
+    a cada página y escribe en lotes.
+    """
+    inicio = time.perf_counter()
+    supabase = capa_datos.get_supabase()
+    motor = _motor_periodo(periodo)
+    df_incentivos = _CONFIG_WORKER["incentivos"]
+    calculado_en = datetime.now().isoformat(timespec="seconds")
+
+    filas_leidas = 0
+    filas_escritas = 0
+    pendientes = []
+
+    def consulta():
+        return supabase.table("usuarios_tiktok")\
+            .select(COLUMNAS_LECTURA)\
+            .eq("contrato", contrato)\
+            .eq("fecha_datos", periodo)\
+            .order("id_tiktok")
+
+    for lote in capa_datos.iterar_paginas(consulta, LOTE_LECTURA):
+        filas_leidas += len(lote)
+        df = capa_datos.calcular_niveles_contrato(pd.DataFrame(lote), df_incentivos, motor)
+        df = df.reindex(columns=COLUMNAS_RESULTADO)
+        df["calculado_en"] = calculado_en
+        # NaN no es JSON válido para PostgREST
+        pendientes.extend(df.astype(object).where(df.notna(), None).to_dict("records"))
+
+        while len(pendientes) >= LOTE_ESCRITURA:
+            if not _CONFIG_WORKER["solo_calcular"]:
+                _escribir_lote(supabase, pendientes[:LOTE_ESCRITURA])
+            filas_escritas += LOTE_ESCRITURA
+            pendientes = pendientes[LOTE_ESCRITURA:]
+
+    if pendientes:
+        if not _CONFIG_WORKER["solo_calcular"]:
+            _escribir_lote(supabase, pendientes)
+        filas_escritas += len(pendientes)
+
+    return {
+        "contrato": contrato,
+        "periodo": periodo,
+        "filas": filas_leidas,
+        "escritas": filas_escritas,
+        "segundos": round(time.perf_counter() - inicio, 3),
+    }
+
+# ============================================================================
+# ORQUESTACIÓN
+# ============================================================================
+
+def imprimir_reporte(resultados, errores, total, segundos):
+    """Reporte de throughput al final de la corrida"""
+    filas = sum(r["filas"] for r in resultados)
+    print("\n" + "=" * 60)
+    print("📊 Reporte de backfill")
+    print("=" * 60)
+    print(f"Pares procesados : {len(resultados)}/{total}")
+    print(f"Pares con error  : {len(errores)}")
+    print(f"Filas procesadas : {filas:,}")
+    print(f"Tiempo total     : {segundos:,.1f}s")
+    if segundos > 0:
+        print(f"Throughput       : {filas / segundos:,.0f} filas/s | {len(resultados) / segundos * 60:,.1f} pares/min")
+    if resultados:
+        lento = max(resultados, key=lambda r: r["segundos"])
+        print(f"Par más lento    : {lento['contrato']} {lento['periodo']} ({lento['segundos']}s, {lento['filas']:,} filas)")
+    for contrato, periodo, error in errores:
+        print(f"  ❌ {contrato} {periodo}: {error}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Recalcula nivel, cumple e incentivos de todo el historial")
+    parser.add_argument("--contratos", nargs="*", help="Solo estos contratos (por defecto todos)")
+    parser.add_argument("--desde", help="Primer fecha_datos a incluir (YYYY-MM-DD)")
+    parser.add_argument("--hasta", help="Última fecha_datos a incluir (YYYY-MM-DD)")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 2, help="Procesos del pool")
+    parser.add_argument("--checkpoint", default="backfill_niveles.checkpoint.jsonl",
+                        help="Archivo de avance para reanudar (vacío = sin checkpoint)")
+    parser.add_argument("--reiniciar", action="store_true",
+                        help="Ignorar el checkpoint existente (los pares de reglas anteriores ya se ignoran solos)")
+    parser.add_argument("--solo-calcular", action="store_true", help="Calcular sin escribir en Supabase")
+    args = parser.parse_args()
+
+    # Config, reglas e incentivos se leen una vez aquí y viajan a cada worker;
+    # su huella decide qué pares del checkpoint siguen valiendo
+    metadatos = capa_datos.obtener_metadatos_contratos()
+    filas_reglas = capa_datos.leer_reglas_calculo()
+    filas_incentivos = capa_datos.obtener_incentivos().to_dict("records")
+    huella = huella_reglas(metadatos["config"], filas_reglas, filas_incentivos)
+
+    pares = listar_pares(args.contratos, args.desde, args.hasta)
+    hechos = set() if args.reiniciar else leer_checkpoint(args.checkpoint, huella)
+    pendientes = [p for p in pares if p not in hechos]
+
+    print(f"🔎 {len(pares)} pares (contrato, corte) | {len(hechos & set(pares))} ya hechos con estas reglas "
+          f"(huella {huella}) | {len(pendientes)} pendientes")
+    if not pendientes:
+        return
+
+    resultados, errores = [], []
+    inicio = time.perf_counter()
+
+    # spawn: cada worker abre su propio cliente (no hereda conexiones del padre)
+    with ProcessPoolExecutor(
+        max_workers=args.procesos,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_inicializar_worker,
+        initargs=(metadatos["config"], filas_reglas, filas_incentivos, args.solo_calcular),
+    ) as pool:
+        futuros = {pool.submit(procesar_par, c, p): (c, p) for c, p in pendientes}
+        for i, futuro in enumerate(as_completed(futuros), start=1):
+            contrato, periodo = futuros[futuro]
+            try:
+                resultado = futuro.result()
+                resultados.append(resultado)
+                if not args.solo_calcular:
+                    registrar_checkpoint(args.checkpoint, resultado, huella)
+            except Exception as e:
+                errores.append((contrato, periodo, str(e)))
+
+            transcurrido = time.perf_counter() - inicio
+            filas = sum(r["filas"] for r in resultados)
+            print(f"[{i}/{len(pendientes)}] {contrato} {periodo} | {filas:,} filas | {filas / max(transcurrido, 1e-9):,.0f} filas/s")
+
+    imprimir_reporte(resultados, errores, len(pendientes), time.perf_counter() - inicio)
+
+if __name__ == "__main__":
+    main()
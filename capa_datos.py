@@ -0,0 +1,2973 @@
+# ============================================================================
+# capa_datos.py - Capa de datos de Sistema TikTok Live
+# Conexión, planificador, cachés, versiones, motor de reglas y consultas.
+# Módulo importable: app.py (que bajo `streamlit run` corre como __main__) y
+# pages/ lo comparten, así planificador, bucle async, últimas copias y cachés
+# existen una sola vez por proceso. Importarlo no dibuja nada: los paneles
+# de estado están en vistas.py.
+# ============================================================================
+
+import streamlit as st
+import pandas as pd
+import numpy as np
+from supabase import create_client, acreate_client
+import os
+import re
+import asyncio
+import contextvars
+import copy
+import functools
+import hashlib
+import heapq
+import json
+import random
+import time
+from dotenv import load_dotenv
+from datetime import datetime
+import calendar
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Cargar variables de entorno
+load_dotenv()
+
+# ============================================================================
+# CONEXIÓN SUPABASE
+# ============================================================================
+
+def _credenciales_supabase():
+    """URL y llave de Supabase desde secrets o variables de entorno"""
+    try:
+        url = st.secrets["SUPABASE_URL"]
+        key = st.secrets["SUPABASE_SERVICE_KEY"]
+    except:
+        url = os.getenv("SUPABASE_URL")
+        key = os.getenv("SUPABASE_SERVICE_KEY")
+    
+    if not url or not key:
+        st.error("❌ Error: Credenciales de Supabase no configuradas")
+        st.stop()
+    
+    return url, key
+
+@st.cache_resource
+def get_supabase():
+    """Obtiene cliente de Supabase (cada execute() pasa por el planificador)"""
+    url, key = _credenciales_supabase()
+    return _Planificado(create_client(url, key))
+
+# ============================================================================
+# PLANIFICADOR DE CONSULTAS (tasa, concurrencia y prioridades)
+# ============================================================================
+
+SUPABASE_TASA_MAX = float(os.getenv("SUPABASE_TASA_MAX", "25"))          # consultas por segundo
+SUPABASE_RAFAGA = int(os.getenv("SUPABASE_RAFAGA", "50"))                # capacidad del token bucket
+SUPABASE_MAX_EN_VUELO = int(os.getenv("SUPABASE_MAX_EN_VUELO", "10"))    # consultas simultáneas (sync + async)
+SUPABASE_REINTENTOS = int(os.getenv("SUPABASE_REINTENTOS", "4"))         # reintentos ante 429 / 503
+
+# Carriles: menor número = pasa primero
+PRIORIDAD_INTERACTIVA = 0   # cargas de página
+PRIORIDAD_FONDO = 1         # precalentador y tareas en segundo plano
+PRIORIDAD_EXPORTACION = 2   # reportes pesados y exportaciones
+NOMBRES_PRIORIDAD = {0: 'Interactiva', 1: 'Fondo', 2: 'Exportación'}
+
+_PRIORIDAD_ACTUAL = contextvars.ContextVar('prioridad_supabase', default=PRIORIDAD_INTERACTIVA)
+
+@contextmanager
+def prioridad_supabase(prioridad):
+    """Las consultas dentro del bloque usan este carril (hilo o tarea async actual)"""
+    token = _PRIORIDAD_ACTUAL.set(prioridad)
+    try:
+        yield
+    finally:
+        _PRIORIDAD_ACTUAL.reset(token)
+
+class PlanificadorSupabase:
+    """
+    Token bucket + tope de consultas en vuelo + cola por prioridad.
+    Un turno se concede al primero de la cola (prioridad, orden de llegada)
+    cuando hay ficha disponible, cupo en vuelo y no hay pausa por 429 / 503.
+    """
+
+    def __init__(self, tasa, rafaga, max_en_vuelo):
+        self.tasa = tasa
+        self.rafaga = rafaga
+        self.max_en_vuelo = max_en_vuelo
+        self.fichas = float(rafaga)
+        self.ultima_recarga = time.monotonic()
+        self.en_vuelo = 0
+        self.pausa_hasta = 0.0
+        self.cola = []
+        self.secuencia = 0
+        self.cond = threading.Condition()
+        self.stats = {
+            'concedidas': {p: 0 for p in NOMBRES_PRIORIDAD},
+            'espera_total': {p: 0.0 for p in NOMBRES_PRIORIDAD},
+            'espera_max': {p: 0.0 for p in NOMBRES_PRIORIDAD},
+            'limitadas': 0,
+            'reintentos': 0,
+            'ultimo_limite': None,
+        }
+
+    def _recargar(self, ahora):
+        self.fichas = min(self.rafaga, self.fichas + (ahora - self.ultima_recarga) * self.tasa)
+        self.ultima_recarga = ahora
+
+    def _registrar(self, prioridad):
+        with self.cond:
+            self.secuencia += 1
+            ticket = (prioridad, self.secuencia)
+            heapq.heappush(self.cola, ticket)
+            return ticket
+
+    def _intentar(self, ticket):
+        """0 si el turno se concedió; si no, segundos sugeridos de espera. Con el lock tomado."""
+        ahora = time.monotonic()
+        self._recargar(ahora)
+        if ahora < self.pausa_hasta:
+            return self.pausa_hasta - ahora
+        if self.cola[0] != ticket or self.en_vuelo >= self.max_en_vuelo:
+            return 0.05
+        if self.fichas < 1:
+            return (1 - self.fichas) / self.tasa
+        heapq.heappop(self.cola)
+        self.fichas -= 1
+        self.en_vuelo += 1
+        return 0
+
+    def _conceder(self, ticket, inicio):
+        prioridad = ticket[0]
+        espera = time.monotonic() - inicio
+        self.stats['concedidas'][prioridad] += 1
+        self.stats['espera_total'][prioridad] += espera
+        self.stats['espera_max'][prioridad] = max(self.stats['espera_max'][prioridad], espera)
+
+    def _cancelar(self, ticket):
+        with self.cond:
+            if ticket in self.cola:
+                self.cola.remove(ticket)
+                heapq.heapify(self.cola)
+            self.cond.notify_all()
+
+    def adquirir(self, prioridad):
+        """Bloquea el hilo hasta tener turno"""
+        inicio = time.monotonic()
+        ticket = self._registrar(prioridad)
+        try:
+            with self.cond:
+                while True:
+                    espera = self._intentar(ticket)
+                    if espera == 0:
+                        self._conceder(ticket, inicio)
+                        return
+                    self.cond.wait(espera)
+        except BaseException:
+            self._cancelar(ticket)
+            raise
+
+    async def aadquirir(self, prioridad):
+        """Igual que adquirir, sin bloquear el bucle de eventos"""
+        inicio = time.monotonic()
+        ticket = self._registrar(prioridad)
+        try:
+            while True:
+                with self.cond:
+                    espera = self._intentar(ticket)
+                    if espera == 0:
+                        self._conceder(ticket, inicio)
+                        return
+                await asyncio.sleep(min(espera, 0.05))
+        except BaseException:
+            self._cancelar(ticket)
+            raise
+
+    def liberar(self):
+        with self.cond:
+            self.en_vuelo -= 1
+            self.cond.notify_all()
+
+    def penalizar(self, segundos):
+        """Pausa todos los carriles tras un 429 / 503 y vacía las fichas"""
+        with self.cond:
+            self.pausa_hasta = max(self.pausa_hasta, time.monotonic() + segundos)
+            self.fichas = 0
+            self.stats['limitadas'] += 1
+            self.stats['ultimo_limite'] = datetime.now()
+            self.cond.notify_all()
+
+    def resumen(self):
+        with self.cond:
+            return {
+                'en_vuelo': self.en_vuelo,
+                'en_cola': len(self.cola),
+                'fichas': self.fichas,
+                'pausa': max(0.0, self.pausa_hasta - time.monotonic()),
+                'stats': {k: (dict(v) if isinstance(v, dict) else v) for k, v in self.stats.items()},
+            }
+
+@st.cache_resource
+def obtener_planificador():
+    """Planificador único del proceso (compartido por sesiones, hilos y el bucle async)"""
+    return PlanificadorSupabase(SUPABASE_TASA_MAX, SUPABASE_RAFAGA, SUPABASE_MAX_EN_VUELO)
+
+def _espera_por_limite(error, intento):
+    """
+    Segundos a esperar si el error es 429 / 503 (None si es otro error).
+    Respeta Retry-After cuando viene; si no, backoff exponencial con jitter.
+    """
+    respuesta = getattr(error, 'response', None)
+    estado = getattr(respuesta, 'status_code', None) or getattr(error, 'status_code', None)
+    codigo = str(getattr(error, 'code', '') or '')
+    if estado not in (429, 503) and codigo not in ('429', '503') \
+            and not re.search(r'\b(429|503)\b|too many requests|service unavailable', str(error), re.IGNORECASE):
+        return None
+
+    retry_after = getattr(respuesta, 'headers', {}).get('retry-after') if respuesta is not None else None
+    try:
+        return min(float(retry_after), 30.0)
+    except (TypeError, ValueError):
+        return min(0.5 * 2 ** intento, 8.0) * (1 + random.random() * 0.25)
+
+def ejecutar_planificado(ejecutar):
+    """Corre `ejecutar()` (una consulta sync) con turno del planificador y reintentos"""
+    planificador = obtener_planificador()
+    prioridad = _PRIORIDAD_ACTUAL.get()
+    for intento in range(SUPABASE_REINTENTOS + 1):
+        planificador.adquirir(prioridad)
+        try:
+            return ejecutar()
+        except Exception as e:
+            espera = _espera_por_limite(e, intento)
+            if espera is None or intento == SUPABASE_REINTENTOS:
+                raise
+            planificador.penalizar(espera)
+            planificador.stats['reintentos'] += 1
+        finally:
+            planificador.liberar()
+
+async def aejecutar_planificado(ejecutar):
+    """Versión async: `ejecutar()` devuelve el awaitable de la consulta"""
+    planificador = obtener_planificador()
+    prioridad = _PRIORIDAD_ACTUAL.get()
+    for intento in range(SUPABASE_REINTENTOS + 1):
+        await planificador.aadquirir(prioridad)
+        try:
+            return await ejecutar()
+        except Exception as e:
+            espera = _espera_por_limite(e, intento)
+            if espera is None or intento == SUPABASE_REINTENTOS:
+                raise
+            planificador.penalizar(espera)
+            planificador.stats['reintentos'] += 1
+        finally:
+            planificador.liberar()
+
+class _Planificado:
+    """
+    Envoltorio transparente del cliente / query builders de Supabase:
+    todo pasa tal cual salvo execute(), que espera turno en el planificador.
+    """
+
+    _SIN_ENVOLVER = (str, bytes, int, float, bool, dict, list, tuple, type(None))
+
+    def __init__(self, objetivo):
+        self._objetivo = objetivo
+
+    def _envolver(self, valor):
+        return valor if isinstance(valor, self._SIN_ENVOLVER) else _Planificado(valor)
+
+    def __getattr__(self, nombre):
+        valor = getattr(self._objetivo, nombre)
+        if nombre == 'execute':
+            return lambda *args, **kwargs: ejecutar_planificado(lambda: valor(*args, **kwargs))
+        if callable(valor):
+            return lambda *args, **kwargs: self._envolver(valor(*args, **kwargs))
+        return self._envolver(valor)
+
+# ============================================================================
+# CACHÉ ACOTADA (capa de datos: límite de entradas y bytes, LRU / TTL)
+# ============================================================================
+
+def _limite_cache(espacio, nombre, defecto):
+    """Límite de un espacio, sobreescribible por entorno: CACHE_<ESPACIO>_<NOMBRE>"""
+    return float(os.getenv(f"CACHE_{espacio.upper()}_{nombre}", defecto))
+
+def tamano_aproximado(valor, profundidad=0):
+    """Bytes aproximados: frames con memory_usage(deep=True), contenedores recorridos"""
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(index=True, deep=True).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(index=True, deep=True))
+    if isinstance(valor, np.ndarray):
+        return int(valor.nbytes)
+    if profundidad < 4:
+        if isinstance(valor, dict):
+            return sys.getsizeof(valor) + sum(
+                tamano_aproximado(k, profundidad + 1) + tamano_aproximado(v, profundidad + 1) for k, v in valor.items()
+            )
+        if isinstance(valor, (list, tuple, set)):
+            return sys.getsizeof(valor) + sum(tamano_aproximado(v, profundidad + 1) for v in valor)
+    return sys.getsizeof(valor)
+
+def _copia_cache(valor):
+    """Cada llamada recibe su copia (como st.cache_data): las vistas modifican los frames"""
+    if isinstance(valor, (str, bytes, int, float, bool, type(None))):
+        return valor
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        return valor.copy()
+    return copy.deepcopy(valor)
+
+class CacheAcotada:
+    """
+    LRU con TTL opcional y tope de entradas y de bytes para un espacio de nombres.
+    Cuenta aciertos, fallos, desalojos (por tamaño / entradas) y expirados (TTL).
+    """
+
+    def __init__(self, espacio, max_entradas, max_mb, ttl=None):
+        self.espacio = espacio
+        self.max_entradas = int(_limite_cache(espacio, 'ENTRADAS', max_entradas))
+        self.max_bytes = int(_limite_cache(espacio, 'MB', max_mb) * 1024 * 1024)
+        self.ttl = ttl
+        self.entradas = OrderedDict()   # clave -> (valor, bytes, expira)
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.en_curso = {}              # clave -> lock de cálculo (una carga por clave)
+        self.stats = {'aciertos': 0, 'fallos': 0, 'desalojos': 0, 'expirados': 0, 'demasiado_grandes': 0}
+
+    def _quitar(self, clave):
+        _, tamano, _ = self.entradas.pop(clave)
+        self.bytes -= tamano
+
+    def obtener(self, clave, contar=True):
+        """(True, valor) si está vigente; (False, None) si no"""
+        with self.lock:
+            entrada = self.entradas.get(clave)
+            if entrada is not None and entrada[2] is not None and time.monotonic() >= entrada[2]:
+                self._quitar(clave)
+                self.stats['expirados'] += 1
+                entrada = None
+            if entrada is None:
+                if contar:
+                    self.stats['fallos'] += 1
+                return False, None
+            self.entradas.move_to_end(clave)
+            if contar:
+                self.stats['aciertos'] += 1
+            return True, entrada[0]
+
+    def guardar(self, clave, valor, tamano=None):
+        """`tamano` en bytes si el llamador lo mide mejor (p. ej. figuras de plotly)"""
+        tamano = tamano_aproximado(valor) if tamano is None else tamano
+        expira = time.monotonic() + self.ttl if self.ttl else None
+        with self.lock:
+            if clave in self.entradas:
+                self._quitar(clave)
+            if tamano > self.max_bytes:
+                self.stats['demasiado_grandes'] += 1
+                return
+            self.entradas[clave] = (valor, tamano, expira)
+            self.bytes += tamano
+            while self.entradas and (self.bytes > self.max_bytes or len(self.entradas) > self.max_entradas):
+                self._quitar(next(iter(self.entradas)))
+                self.stats['desalojos'] += 1
+
+    def lock_calculo(self, clave):
+        with self.lock:
+            return self.en_curso.setdefault(clave, threading.Lock())
+
+    def fin_calculo(self, clave):
+        with self.lock:
+            self.en_curso.pop(clave, None)
+
+    def limpiar(self):
+        with self.lock:
+            self.entradas.clear()
+            self.bytes = 0
+
+    def resumen(self):
+        with self.lock:
+            return {
+                'espacio': self.espacio,
+                'entradas': len(self.entradas),
+                'max_entradas': self.max_entradas,
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                **self.stats,
+            }
+
+@st.cache_resource
+def _caches_acotadas():
+    """Registro del proceso: espacio -> CacheAcotada (sobrevive a los reruns del script)"""
+    return {'lock': threading.Lock(), 'espacios': {}}
+
+def obtener_cache_acotada(espacio, max_entradas=128, max_mb=64, ttl=None):
+    """CacheAcotada del espacio (se crea con estos límites la primera vez)"""
+    registro = _caches_acotadas()
+    with registro['lock']:
+        cache = registro['espacios'].get(espacio)
+        if cache is None:
+            cache = CacheAcotada(espacio, max_entradas, max_mb, ttl)
+            registro['espacios'][espacio] = cache
+        return cache
+
+def resumen_caches_acotadas():
+    """Contadores de cada espacio (CacheAcotada.resumen), el que más ocupa primero"""
+    registro = _caches_acotadas()
+    with registro['lock']:
+        caches = list(registro['espacios'].values())
+    return sorted((c.resumen() for c in caches), key=lambda r: -r['bytes'])
+
+def cache_acotada(espacio, max_entradas=128, max_mb=64, ttl=None, copiar=True):
+    """
+    Decorador de la capa de datos (en lugar de st.cache_data): clave por
+    argumentos, una sola carga por clave aunque la pidan varias sesiones,
+    copia por llamada y límites / contadores por espacio (ver panel admin).
+    Los errores no se cachean. `copiar=False` comparte el mismo objeto entre
+    sesiones (como st.cache_resource): solo para resultados de solo lectura.
+    """
+    def decorador(funcion):
+        def _cache():
+            return obtener_cache_acotada(espacio, max_entradas, max_mb, ttl)
+
+        def _clave(args, kwargs):
+            return (funcion.__qualname__, args, tuple(sorted(kwargs.items())))
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            cache = _cache()
+            clave = _clave(args, kwargs)
+            encontrado, valor = cache.obtener(clave)
+            if not encontrado:
+                with cache.lock_calculo(clave):
+                    # Otra sesión pudo terminar la misma carga mientras se esperaba
+                    encontrado, valor = cache.obtener(clave, contar=False)
+                    if not encontrado:
+                        try:
+                            valor = funcion(*args, **kwargs)
+                            cache.guardar(clave, valor)
+                        finally:
+                            cache.fin_calculo(clave)
+            return _copia_cache(valor) if copiar else valor
+
+        def en_cache(*args, **kwargs):
+            """(True, copia) si la clave está vigente, sin calcular; cuenta acierto / fallo"""
+            encontrado, valor = _cache().obtener(_clave(args, kwargs))
+            if not encontrado:
+                return False, None
+            return True, (_copia_cache(valor) if copiar else valor)
+
+        def sembrar(valor, *args, **kwargs):
+            """Guarda un resultado calculado por otra vía (p. ej. carga en lote)"""
+            _cache().guardar(_clave(args, kwargs), valor)
+
+        envoltura.clear = lambda: _cache().limpiar()
+        envoltura.cache = _cache
+        envoltura.en_cache = en_cache
+        envoltura.sembrar = sembrar
+        return envoltura
+
+    return decorador
+
+# ============================================================================
+# VERSIONES DE DATOS (invalidación de caché por cambios)
+# ============================================================================
+
+VERSION_SONDEO_TTL = 30       # segundos que se reutiliza un sondeo de versión
+VERSION_TTL_SIN_FECHA = 300   # tablas sin fecha ni hash de contenido: versión por ventana de 5 min
+VERSION_HASH_MAX_FILAS = 1000 # hasta cuántas filas se versiona por contenido (una página)
+
+# Tablas que crecen por corte: la fecha más reciente cambia con cada subida
+COLUMNA_FECHA_TABLA = {
+    'usuarios_tiktok': 'fecha_datos',
+    'reportes_contratos': 'periodo',
+    'resumen_contratos': 'periodo',
+    'historico_usuarios': 'visto_ultima_vez',
+}
+
+def _hash_filas(filas):
+    """Hash estable del contenido (independiente del orden en que lleguen las filas)"""
+    lineas = sorted(json.dumps(f, sort_keys=True, default=str) for f in filas)
+    return hashlib.sha1('\n'.join(lineas).encode('utf-8')).hexdigest()[:16]
+
+def obtener_version_tabla(tabla):
+    """
+    Marca de versión de una tabla (ver _sondear_version_tabla). Si el sondeo
+    falla se usa una ventana de 5 minutos, sin guardarla: el siguiente
+    llamado vuelve a sondear en vez de arrastrar el respaldo 30 s.
+    """
+    try:
+        return _sondear_version_tabla(tabla)
+    except Exception:
+        return f"ttl-{int(datetime.now().timestamp() // 300)}"
+
+@cache_acotada('versiones', max_entradas=1, max_mb=1, ttl=VERSION_SONDEO_TTL)
+def _leer_versiones_tablas():
+    """
+    {tabla: version} de version_tablas (migración 005: contador que un trigger
+    sube en cada INSERT / UPDATE / DELETE). Una sola RPC para todas las tablas.
+    """
+    resultado = get_supabase().rpc('obtener_versiones_tablas', {'p_tablas': None}).execute()
+    return {f['tabla']: f['version'] for f in resultado.data or []}
+
+@cache_acotada('versiones', max_entradas=64, max_mb=1, ttl=VERSION_SONDEO_TTL)
+def _sondear_version_tabla(tabla):
+    """
+    Marca de versión barata de una tabla, en una sola petición:
+    - con la migración 005: contador de version_tablas (ve también los UPDATE en sitio)
+    - con columna de fecha (tablas por corte): conteo estimado + fecha más reciente
+    - configuración (sin fecha, pocas filas): hash del contenido, así
+      un UPDATE en sitio (nivel1_tabla3, tramos, columnas ocultas) cambia la versión
+    - sin fecha y más de VERSION_HASH_MAX_FILAS: ventana de VERSION_TTL_SIN_FECHA
+    Los errores se propagan (no se guardan) y obtener_version_tabla responde.
+    """
+    if 'obtener_versiones_tablas' not in verificar_rutas_rapidas()['faltan_rpc']:
+        versiones = _leer_versiones_tablas()
+        if tabla in versiones:
+            return f"v{versiones[tabla]}"
+
+    supabase = get_supabase()
+    col_fecha = COLUMNA_FECHA_TABLA.get(tabla)
+    if col_fecha:
+        # 'planned' sale de las estadísticas del planificador: sin recorrer la tabla
+        resultado = supabase.table(tabla)\
+            .select(col_fecha, count='planned')\
+            .order(col_fecha, desc=True)\
+            .limit(1)\
+            .execute()
+        ultima = resultado.data[0].get(col_fecha) if resultado.data else None
+        return f"{resultado.count}|{ultima}"
+
+    filas = supabase.table(tabla)\
+        .select('*')\
+        .limit(VERSION_HASH_MAX_FILAS + 1)\
+        .execute().data or []
+    if len(filas) <= VERSION_HASH_MAX_FILAS:
+        return f"{len(filas)}|{_hash_filas(filas)}"
+    return f"ttl-{int(time.time() // VERSION_TTL_SIN_FECHA)}"
+
+def obtener_version_datos(*tablas):
+    """Versión combinada de varias tablas (clave de caché)"""
+    return tuple(obtener_version_tabla(t) for t in tablas)
+
+# Tablas de las que depende el resultado de obtener_datos_contrato
+TABLAS_DATOS_CONTRATO = (
+    'usuarios_tiktok', 'reportes_contratos', 'historico_usuarios',
+    'contratos', 'contratos_equivalencias', 'incentivos_horizontales',
+    'incentivos_custom_vertex', 'excepciones_calculo_jugador',
+)
+
+# ============================================================================
+# RUTAS RÁPIDAS EN LA BASE (migraciones/)
+# ============================================================================
+
+DIR_MIGRACIONES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migraciones')
+
+# RPC que crean las migraciones, con parámetros de una llamada que no trae filas
+RPC_RUTAS_RAPIDAS = {
+    'obtener_fechas_disponibles': {'p_contrato': ''},
+    'resumen_metricas_periodo': {'p_fecha_datos': '1900-01-01'},
+    'obtener_versiones_tablas': {'p_tablas': []},
+}
+
+COLUMNAS_RESUMEN_PERIODO = ['contrato', 'jugadores', 'con_actividad', 'diamantes', 'dias_promedio']
+
+def migraciones_locales():
+    """Versiones de migraciones/ (nombre del archivo sin .sql), en orden"""
+    try:
+        return sorted(f[:-4] for f in os.listdir(DIR_MIGRACIONES) if f.endswith('.sql'))
+    except OSError:
+        return []
+
+@st.cache_resource
+def verificar_rutas_rapidas():
+    """
+    Una vez por proceso, al arrancar: RPC de migraciones/ que no existen y
+    versiones sin registrar en migraciones_aplicadas. Sin ellas la app
+    funciona con los respaldos lentos; se avisa en consola y en el panel admin.
+    """
+    supabase = get_supabase()
+
+    faltan_rpc = []
+    for nombre, parametros in RPC_RUTAS_RAPIDAS.items():
+        try:
+            supabase.rpc(nombre, parametros).execute()
+        except Exception:
+            faltan_rpc.append(nombre)
+
+    try:
+        resultado = supabase.table('migraciones_aplicadas').select('version').execute()
+        aplicadas = {r['version'] for r in resultado.data or []}
+    except Exception:
+        aplicadas = set()
+    pendientes = [v for v in migraciones_locales() if v not in aplicadas]
+
+    if faltan_rpc or pendientes:
+        print(f"⚠️ Rutas rápidas ausentes en Supabase (RPC: {', '.join(faltan_rpc) or '—'}; "
+              f"migraciones pendientes: {', '.join(pendientes) or '—'}). "
+              f"Se usan los respaldos paginados; ver migraciones/ y verificar_migraciones.py")
+
+    return {'faltan_rpc': faltan_rpc, 'pendientes': pendientes, 'revisado': datetime.now()}
+
+def obtener_resumen_periodo(periodo):
+    """Totales por contrato de un corte (recalculado al cambiar usuarios_tiktok)"""
+    try:
+        return _cargar_resumen_periodo(periodo, obtener_version_tabla('usuarios_tiktok'))
+    except Exception:
+        return pd.DataFrame(columns=COLUMNAS_RESUMEN_PERIODO)
+
+@cache_acotada('resumen', max_entradas=12, max_mb=4)
+def _cargar_resumen_periodo(periodo, version):
+    """
+    RPC resumen_metricas_periodo (una fila por contrato); si no existe,
+    lee contrato / dias / diamantes del corte y agrega aquí.
+    """
+    supabase = get_supabase()
+
+    try:
+        resultado = supabase.rpc('resumen_metricas_periodo', {'p_fecha_datos': periodo}).execute()
+        return pd.DataFrame(resultado.data or [], columns=COLUMNAS_RESUMEN_PERIODO)
+    except Exception:
+        pass
+
+    df = pd.DataFrame(leer_paginado(lambda: supabase.table('usuarios_tiktok')
+                                    .select('contrato, dias, diamantes')
+                                    .eq('fecha_datos', periodo)),
+                      columns=['contrato', 'dias', 'diamantes'])
+    df['dias'] = pd.to_numeric(df['dias'], errors='coerce').fillna(0)
+    df['diamantes'] = pd.to_numeric(df['diamantes'], errors='coerce').fillna(0)
+    resumen = df.groupby('contrato').agg(
+        jugadores=('dias', 'size'),
+        con_actividad=('dias', lambda d: int((d > 0).sum())),
+        diamantes=('diamantes', 'sum'),
+        dias_promedio=('dias', 'mean'),
+    ).reset_index()
+    resumen['dias_promedio'] = resumen['dias_promedio'].round(1)
+    return resumen[COLUMNAS_RESUMEN_PERIODO]
+
+# ============================================================================
+# FUNCIONES DE AUTENTICACIÓN
+# ============================================================================
+
+def verificar_token_admin(token):
+    """Verifica token de administrador"""
+    supabase = get_supabase()
+    resultado = supabase.table('contratos_tokens').select('*').eq('token', token).eq('activo', True).execute()
+    
+    if resultado.data:
+        token_data = resultado.data[0]
+        tipo = token_data.get('tipo', 'contrato')
+        if tipo == 'admin':
+            return token_data
+    return None
+
+def verificar_token_contrato(token):
+    """Verifica token de contrato (jugadores)"""
+    supabase = get_supabase()
+    resultado = supabase.table('contratos_tokens').select('*').eq('token', token).eq('activo', True).execute()
+    
+    if resultado.data:
+        token_data = resultado.data[0]
+        tipo = token_data.get('tipo', 'contrato')
+        if tipo == 'contrato':
+            return token_data
+    return None
+
+def verificar_token_jugador(token):
+    """Verifica token individual de jugador (tokens_jugadores)"""
+    supabase = get_supabase()
+    resultado = supabase.table('tokens_jugadores').select('*').eq('token', token).eq('activo', True).execute()
+    
+    if resultado.data:
+        return resultado.data[0]
+    return None
+
+def verificar_login_agente(usuario, password):
+    """Verifica credenciales de agente"""
+    supabase = get_supabase()
+    resultado = supabase.table('agentes_login')\
+        .select('*')\
+        .eq('usuario', usuario)\
+        .eq('password', password)\
+        .eq('activo', True)\
+        .execute()
+    
+    if resultado.data and len(resultado.data) > 0:
+        return resultado.data[0]
+    return None
+
+def cambiar_password_agente(usuario, nueva_password):
+    """Cambia la contraseña del agente"""
+    supabase = get_supabase()
+    try:
+        supabase.table('agentes_login')\
+            .update({'password': nueva_password, 'cambio_password': True})\
+            .eq('usuario', usuario)\
+            .execute()
+        return True
+    except:
+        return False
+
+# ============================================================================
+# FUNCIONES COMPARTIDAS
+# ============================================================================
+
+def obtener_periodos_disponibles():
+    """
+    Obtiene periodos disponibles con lógica inteligente:
+    - Siempre muestra cierres de mes (último día del mes)
+    - Para cada mes, solo muestra la fecha MÁS RECIENTE
+    Se recalcula solo cuando cambia la versión de usuarios_tiktok.
+    """
+    try:
+        return _cargar_periodos_disponibles(obtener_version_tabla('usuarios_tiktok'))
+    except Exception as e:
+        st.sidebar.error(f"❌ Error: {str(e)}")
+        return []
+
+@cache_acotada('periodos', max_entradas=4, max_mb=1)
+def _cargar_periodos_disponibles(version):
+    """Carga de periodos (cacheada por versión de datos, vía capa async)"""
+    return ejecutar_async(aobtener_periodos_disponibles())
+
+def filtrar_fechas_inteligente(fechas_str):
+    """
+    Filtra fechas con lógica inteligente:
+    - Cierres de mes (último día): SIEMPRE
+    - Fechas intermedias: Solo la MÁS RECIENTE por mes
+    """
+    from datetime import datetime
+    from collections import defaultdict
+    
+    if not fechas_str:
+        return []
+    
+    # Convertir strings a datetime y agrupar por mes
+    fechas_obj = []
+    for f_str in fechas_str:
+        try:
+            f_obj = datetime.strptime(str(f_str).strip(), '%Y-%m-%d')
+            fechas_obj.append(f_obj)
+        except:
+            continue
+    
+    # Agrupar por año-mes
+    por_mes = defaultdict(list)
+    for f in fechas_obj:
+        clave_mes = f.strftime('%Y-%m')
+        por_mes[clave_mes].append(f)
+    
+    # Filtrar: cierres de mes + fecha más reciente por mes
+    fechas_finales = []
+    
+    for mes, fechas_del_mes in por_mes.items():
+        fechas_del_mes_sorted = sorted(fechas_del_mes, reverse=True)  # Más reciente primero
+        
+        # Obtener último día del mes
+        primera_fecha = fechas_del_mes_sorted[0]
+        año = primera_fecha.year
+        mes_num = primera_fecha.month
+        
+        # Último día del mes
+        if mes_num == 12:
+            ultimo_dia = 31
+        else:
+            from calendar import monthrange
+            ultimo_dia = monthrange(año, mes_num)[1]
+        
+        # Buscar si hay cierre de mes
+        cierre_existe = False
+        for f in fechas_del_mes:
+            if f.day == ultimo_dia:
+                fechas_finales.append(f)
+                cierre_existe = True
+                break
+        
+        # Si NO hay cierre, agregar la más reciente
+        if not cierre_existe:
+            fechas_finales.append(fechas_del_mes_sorted[0])
+    
+    # Ordenar descendente y convertir a strings
+    fechas_finales_sorted = sorted(fechas_finales, reverse=True)
+    return [f.strftime('%Y-%m-%d') for f in fechas_finales_sorted]
+
+def obtener_mes_español(fecha_str):
+    """Convierte fecha a Mes YYYY en español"""
+    meses = {
+        1: 'Enero', 2: 'Febrero', 3: 'Marzo', 4: 'Abril',
+        5: 'Mayo', 6: 'Junio', 7: 'Julio', 8: 'Agosto',
+        9: 'Septiembre', 10: 'Octubre', 11: 'Noviembre', 12: 'Diciembre'
+    }
+    try:
+        fecha = datetime.strptime(fecha_str, '%Y-%m-%d')
+        return f"{meses[fecha.month]} {fecha.year}"
+    except:
+        return fecha_str
+
+def formatear_fecha_español(fecha_str):
+    """Convierte fecha a DD de Mes, YYYY en español"""
+    meses = {
+        1: 'Enero', 2: 'Febrero', 3: 'Marzo', 4: 'Abril',
+        5: 'Mayo', 6: 'Junio', 7: 'Julio', 8: 'Agosto',
+        9: 'Septiembre', 10: 'Octubre', 11: 'Noviembre', 12: 'Diciembre'
+    }
+    try:
+        fecha = datetime.strptime(fecha_str, '%Y-%m-%d')
+        return f"{fecha.day} de {meses[fecha.month]}, {fecha.year}"
+    except:
+        return fecha_str
+
+def obtener_incentivos():
+    """Obtiene tabla de incentivos"""
+    return _cargar_incentivos(obtener_version_tabla('incentivos_horizontales'))
+
+@cache_acotada('incentivos', max_entradas=4, max_mb=4)
+def _cargar_incentivos(version):
+    """Carga de incentivos_horizontales (cacheada por versión de datos)"""
+    supabase = get_supabase()
+    resultado = supabase.table('incentivos_horizontales').select('*').order('acumulado').execute()
+    
+    if resultado.data:
+        return pd.DataFrame(resultado.data)
+    return pd.DataFrame()
+
+# Textos de duración ya parseados: se repiten mucho entre jugadores y cortes
+DURACIONES_CACHE_MAX = 200_000
+
+@st.cache_resource
+def _cache_duraciones():
+    """Diccionario texto de duración -> horas decimales (compartido por proceso)"""
+    return {}
+
+def parsear_duracion_horas(serie):
+    """
+    Convierte textos de duración ("12h 30min 5s") a horas decimales.
+    Misma regla que parseHorasDecimal() de mi-progreso.html, pero vectorizada:
+    str.extract corre una sola vez sobre los textos distintos que aún no
+    están en caché y el resultado se mapea a toda la columna.
+    El mapeo usa un dict local de esta llamada: otro hilo puede vaciar la
+    caché compartida en cualquier momento sin dejar horas en NaN.
+    """
+    texto = serie.fillna('').astype(str).str.strip()
+    cache = _cache_duraciones()
+
+    horas, nuevos = {}, []
+    for t in texto.unique():
+        valor = cache.get(t)
+        if valor is None:
+            nuevos.append(t)
+        else:
+            horas[t] = valor
+
+    if nuevos:
+        s = pd.Series(nuevos, dtype=object)
+        h = pd.to_numeric(s.str.extract(r'(\d+)\s*h', flags=re.IGNORECASE)[0], errors='coerce').fillna(0)
+        m = pd.to_numeric(s.str.extract(r'(\d+)\s*min', flags=re.IGNORECASE)[0], errors='coerce').fillna(0)
+        seg = pd.to_numeric(s.str.extract(r'(\d+)\s*s', flags=re.IGNORECASE)[0], errors='coerce').fillna(0)
+        calculadas = dict(zip(nuevos, (h + m / 60 + seg / 3600).tolist()))
+        horas.update(calculadas)
+        if len(cache) + len(calculadas) > DURACIONES_CACHE_MAX:
+            cache.clear()
+        cache.update(calculadas)
+
+    return texto.map(horas).astype(float)
+
+def determinar_nivel(dias, horas):
+    """Determina nivel según días y horas (mínimos estándar de MINIMOS_NIVEL)"""
+    try: 
+        d = float(dias)
+    except: 
+        d = 0
+    try: 
+        h = float(horas)
+    except: 
+        h = 0
+    
+    for nivel in (3, 2, 1):
+        dias_min, horas_min = MINIMOS_NIVEL[nivel]
+        if d >= dias_min and h >= horas_min:
+            return nivel
+    return 0
+
+def calcular_incentivos(df_incentivos, diamantes, nivel):
+    """Calcula incentivos según tabla horizontal"""
+    if nivel == 0:
+        return (0, 0)
+    
+    try:
+        fila_valida = None
+        for idx, row in df_incentivos.iterrows():
+            if diamantes >= row.get('acumulado', 0):
+                fila_valida = idx
+            else:
+                break
+        
+        if fila_valida is None:
+            return (0, 0)
+        
+        fila = df_incentivos.iloc[fila_valida]
+        coins = fila.get(f'nivel_{nivel}_monedas', 0)
+        paypal = fila.get(f'nivel_{nivel}_paypal', 0)
+        
+        return (coins, paypal)
+    except Exception:
+        return (0, 0)
+
+def determinar_nivel_vectorizado(dias, horas):
+    """Versión vectorizada de determinar_nivel para columnas completas"""
+    d = pd.to_numeric(dias, errors='coerce').fillna(0)
+    h = pd.to_numeric(horas, errors='coerce').fillna(0)
+    
+    niveles = np.select(
+        [(d >= MINIMOS_NIVEL[k][0]) & (h >= MINIMOS_NIVEL[k][1]) for k in (3, 2, 1)],
+        [3, 2, 1],
+        default=0
+    )
+    return pd.Series(niveles, index=d.index)
+
+def calcular_incentivos_vectorizado(df_incentivos, diamantes, niveles):
+    """
+    Versión vectorizada de calcular_incentivos: ubica el tramo de cada fila con
+    searchsorted sobre 'acumulado' (la tabla viene ordenada ascendente) y toma
+    la columna del nivel. Devuelve (coins, paypal) como Series.
+    """
+    diamantes = pd.to_numeric(diamantes, errors='coerce')
+    niveles = pd.Series(niveles, index=diamantes.index)
+    coins = pd.Series(0.0, index=diamantes.index)
+    paypal = pd.Series(0.0, index=diamantes.index)
+    
+    if df_incentivos.empty or 'acumulado' not in df_incentivos.columns:
+        return coins, paypal
+    
+    acumulado = pd.to_numeric(df_incentivos['acumulado'], errors='coerce').to_numpy()
+    # Última fila con diamantes >= acumulado (-1 = no alcanza el primer tramo)
+    fila = np.searchsorted(acumulado, diamantes.fillna(-np.inf).to_numpy(), side='right') - 1
+    valida = fila >= 0
+    
+    for nivel in (1, 2, 3):
+        mask = valida & (niveles.to_numpy() == nivel)
+        if not mask.any():
+            continue
+        for destino, columna in ((coins, f'nivel_{nivel}_monedas'), (paypal, f'nivel_{nivel}_paypal')):
+            if columna in df_incentivos.columns:
+                valores = pd.to_numeric(df_incentivos[columna], errors='coerce').fillna(0).to_numpy()
+                destino[mask] = valores[fila[mask]]
+    
+    return coins, paypal
+
+# ============================================================================
+# NUEVAS FUNCIONES INTEGRADAS DE CHATGPT
+# ============================================================================
+
+def _col(df, *cands):
+    """Helper para encontrar columna con diferentes nombres posibles"""
+    for c in cands:
+        if c in df.columns: 
+            return c
+    return None
+
+HISTORIAL_CHUNK = 400  # ids por consulta a historico_usuarios
+
+def _ids_sin_nombre(df: pd.DataFrame):
+    """
+    Detecta filas sin 'usuario' y los ids a buscar en historico_usuarios.
+    Devuelve (col_user, col_id, mask, ids) o None si el frame no aplica.
+    """
+    if df.empty:
+        return None
+
+    col_user = _col(df, "usuario", "username", "user", "nick")
+    col_id   = _col(df, "id_tiktok", "usuario_id", "user_id", "id_usuario")
+    if not col_user or not col_id:
+        return None
+
+    # Identificar usuarios sin nombre
+    mask = df[col_user].isna() | (df[col_user].astype(str).str.strip() == "")
+    ids = df.loc[mask, col_id].dropna().astype(str).unique().tolist()
+    return col_user, col_id, mask, ids
+
+def _mapa_nombres_historial(rows) -> dict:
+    """Mapea id -> último username conocido a partir de filas de historico_usuarios"""
+    if not rows:
+        return {}
+
+    h = pd.DataFrame(rows)
+    hid = _col(h, "id_tiktok", "usuario_id", "user_id")
+    hun = _col(h, "usuario_1", "usuario_2", "usuario_3", "usuario", "username", "user", "nick")
+    
+    if not hid or not hun:
+        return {}
+
+    h["id_str"] = h[hid].astype(str)
+    h = h.dropna(subset=[hun]).drop_duplicates(subset=["id_str"], keep="first")
+    return dict(zip(h["id_str"], h[hun]))
+
+def _aplicar_mapa_nombres(df, col_user, col_id, mask, mapping):
+    """Rellena los nombres vacíos con el mapeo id -> username"""
+    if mapping:
+        df[col_id] = df[col_id].astype(str)
+        df.loc[mask, col_user] = df.loc[mask, col_id].map(mapping).fillna(df.loc[mask, col_user])
+    return df
+
+def enriquecer_nombres_desde_historial(df: pd.DataFrame, sb) -> pd.DataFrame:
+    """
+    INTEGRADO DE CHATGPT - MEJORADO
+    Rellena 'usuario' cuando viene vacío usando historico_usuarios.
+    Busca por id_tiktok (o usuario_id) y usa el último username conocido.
+    Procesa en lotes de 400 para no sobrecargar Supabase.
+    """
+    if sb is None:
+        return df
+
+    pendientes = _ids_sin_nombre(df)
+    if not pendientes or not pendientes[3]:
+        return df
+    col_user, col_id, mask, ids = pendientes
+
+    mapping = {}
+    
+    for i in range(0, len(ids), HISTORIAL_CHUNK):
+        lote = ids[i:i+HISTORIAL_CHUNK]
+        rows = []
+        
+        # Intento 1: Por id_tiktok
+        try:
+            r = (sb.table("historico_usuarios")
+                    .select("*")
+                    .in_("id_tiktok", lote)
+                    .order("visto_ultima_vez", desc=True)
+                    .execute())
+            rows = r.data or []
+        except Exception:
+            rows = []
+        
+        # Intento 2: Por usuario_id si no funcionó
+        if not rows:
+            try:
+                r = (sb.table("historico_usuarios")
+                        .select("*")
+                        .in_("usuario_id", lote)
+                        .order("visto_ultima_vez", desc=True)
+                        .execute())
+                rows = r.data or []
+            except Exception:
+                rows = []
+
+        mapping.update(_mapa_nombres_historial(rows))
+
+    return _aplicar_mapa_nombres(df, col_user, col_id, mask, mapping)
+
+def _alias_oculto(col_raw: str) -> str:
+    """
+    INTEGRADO DE CHATGPT
+    Normaliza nombres de columnas para sistema de ocultamiento.
+    Acepta múltiples variaciones.
+    """
+    alias = {
+        # Base visibles
+        "usuario":"usuario","username":"usuario","user":"usuario","nick":"usuario",
+        "agencia":"agencia","agency":"agencia","Agencia":"agencia","AGENCIA":"agencia",
+        "dias":"dias","días":"dias","Dias":"dias","Días":"dias",
+        "duracion":"duracion","horas":"duracion","tiempo":"duracion",
+        "diamantes":"diamantes",
+        "nivel":"nivel","cumple":"cumple",
+        # Incentivos/pagos
+        "coins":"incentivo_coins","incentivo coin":"incentivo_coins","incentivo_coins":"incentivo_coins",
+        "paypal":"incentivo_paypal","incentivo paypal":"incentivo_paypal","incentivo_paypal":"incentivo_paypal",
+        "sueldo":"paypal_bruto","paypal_bruto":"paypal_bruto","coins_bruto":"coins_bruto",
+    }
+    return alias.get(col_raw.lower(), col_raw.lower())
+
+@cache_acotada('columnas_ocultas', max_entradas=4, max_mb=1)
+def _leer_reglas_ocultas(version):
+    """
+    Lee reglas de columnas ocultas desde Supabase (cacheada por versión de datos).
+    Un error se propaga: no se cachea una lista vacía que mostraría todo.
+    """
+    sb = get_supabase()
+    if not sb: 
+        return []
+    r = sb.table("config_columnas_ocultas").select("*").execute()
+    return r.data or []
+
+def obtener_columnas_ocultas(contrato: str):
+    """
+    MEJORADO CON ALIAS
+    Obtiene columnas ocultas con normalización de nombres
+    """
+    reglas = _leer_reglas_ocultas(obtener_version_tabla('config_columnas_ocultas'))
+    ocultas = []
+    
+    for row in reglas:
+        c = row.get("contrato")
+        col_raw = str(row.get("columna", "")).strip()
+        
+        if not col_raw:
+            continue
+        
+        col = _alias_oculto(col_raw)
+        
+        # Aplica si es global (contrato=None) o específico
+        if (c is None) or (str(c).strip() == "") or (str(c).strip() == str(contrato).strip()):
+            ocultas.append(col)
+    
+    return ocultas
+
+# Mapeo de configuración a columnas reales
+MAPEO_COLUMNAS_OCULTAS = {
+    # Incentivos
+    'coins': 'incentivo_coins',
+    'incentivo_coins': 'incentivo_coins',
+    'paypal': 'incentivo_paypal',
+    'incentivo_paypal': 'incentivo_paypal',
+    'sueldo': 'paypal_bruto',
+    'paypal_bruto': 'paypal_bruto',
+    'coins_bruto': 'coins_bruto',
+    # Métricas básicas
+    'diamantes': 'diamantes',
+    'dias': 'dias',
+    'duracion': 'duracion',
+    'horas': 'duracion',
+    'nivel': 'nivel',
+    'cumple': 'cumple',
+    # Usuario
+    'usuario': 'usuario'
+}
+
+# Columnas de pago: se ocultan todas si no se pueden leer las reglas
+COLUMNAS_PAGO = {'incentivo_coins', 'incentivo_paypal', 'paypal_bruto', 'coins_bruto'}
+
+def columnas_ocultas_jugadores(contrato):
+    """Columnas del DataFrame que no ve un jugador con token grupal"""
+    columnas_a_ocultar = set(['agencia'])  # Siempre ocultar agencia en vista jugadores
+    
+    try:
+        configs = obtener_columnas_ocultas(contrato)
+    except Exception:
+        # Sin reglas (error de lectura, no cacheado): ante la duda no se muestran pagos
+        return columnas_a_ocultar | COLUMNAS_PAGO
+    
+    for config in configs:
+        if config in MAPEO_COLUMNAS_OCULTAS:
+            columnas_a_ocultar.add(MAPEO_COLUMNAS_OCULTAS[config])
+    
+    return columnas_a_ocultar
+
+# ============================================================================
+# FUNCIONES DE DATOS
+# ============================================================================
+
+def iterar_paginas(construir_consulta, tamano_lote=1000):
+    """
+    Recorre una consulta página a página con .range() (PostgREST corta en 1000
+    por defecto). `construir_consulta` debe devolver un query builder nuevo en
+    cada llamada. Generador: permite procesar sin tener todo en memoria.
+    """
+    offset = 0
+    while True:
+        resultado = construir_consulta().range(offset, offset + tamano_lote - 1).execute()
+        lote = resultado.data or []
+        if lote:
+            yield lote
+        if len(lote) < tamano_lote:
+            break
+        offset += tamano_lote
+
+def leer_paginado(construir_consulta, tamano_lote=1000):
+    """Trae todas las filas de una consulta paginada (ver iterar_paginas)"""
+    filas = []
+    for lote in iterar_paginas(construir_consulta, tamano_lote):
+        filas.extend(lote)
+    return filas
+
+def _valor_si_no(valor):
+    """Interpreta flags de configuración escritos de muchas formas (SI, TRUE, 1, True...)"""
+    if isinstance(valor, str):
+        return valor.strip().upper() in ['SI', 'YES', 'TRUE', '1', 'SÍ']
+    return bool(valor)
+
+def obtener_metadatos_contratos():
+    """
+    Registro en memoria de metadatos de contratos, cargado en bloque:
+    - equivalencias: código -> código pareja (Nexus ↔ Vertex, en ambos sentidos)
+    - config: código -> {'nivel1_tabla3': bool, 'tipo_logica': str | None}
+    - subordinados: código -> contratos que le reportan (jerarquia_contratos)
+    - reporta_a: código -> contrato superior
+    Se recarga solo cuando cambia la versión de alguna de sus tablas.
+    Un error de lectura se propaga (no queda cacheado un registro incompleto).
+    """
+    return _cargar_metadatos_contratos(
+        obtener_version_datos('contratos', 'contratos_equivalencias', 'jerarquia_contratos')
+    )
+
+@cache_acotada('metadatos', max_entradas=2, max_mb=16, copiar=False)
+def _cargar_metadatos_contratos(version):
+    """Carga en bloque de contratos, equivalencias y jerarquía (una consulta por tabla)"""
+    supabase = get_supabase()
+    metadatos = {'equivalencias': {}, 'config': {}, 'subordinados': {}, 'reporta_a': {}}
+
+    # Sin try: si una lectura falla no se cachea nada (un config vacío cambiaría
+    # nivel1_tabla3 / tipo_logica de todos los contratos hasta la próxima versión)
+    filas = leer_paginado(lambda: supabase.table('contratos_equivalencias').select('nexus_codigo,vertex_codigo'))
+    for row in filas:
+        a = str(row.get('nexus_codigo') or '').strip()
+        b = str(row.get('vertex_codigo') or '').strip()
+        if a and b:
+            metadatos['equivalencias'][a] = b
+            metadatos['equivalencias'][b] = a
+
+    filas = leer_paginado(lambda: supabase.table('contratos').select('codigo,nivel1_tabla3,tipo_logica'))
+    for row in filas:
+        codigo = str(row.get('codigo') or '').strip()
+        if codigo:
+            metadatos['config'][codigo] = {
+                'nivel1_tabla3': _valor_si_no(row.get('nivel1_tabla3', False)),
+                'tipo_logica': row.get('tipo_logica'),
+            }
+
+    filas = leer_paginado(lambda: supabase.table('jerarquia_contratos').select('contrato,reporta_a'))
+    for row in filas:
+        hijo = str(row.get('contrato') or '').strip()
+        padre = str(row.get('reporta_a') or '').strip()
+        if hijo and padre:
+            metadatos['subordinados'].setdefault(padre, []).append(hijo)
+            metadatos['reporta_a'][hijo] = padre
+
+    return metadatos
+
+def obtener_config_contrato(contrato):
+    """Config del contrato desde el registro (nivel1_tabla3, tipo_logica)"""
+    config = obtener_metadatos_contratos()['config'].get(str(contrato).strip())
+    return config or {'nivel1_tabla3': False, 'tipo_logica': None}
+
+def obtener_contrato_equivalente(supabase, contrato):
+    """Busca si el contrato tiene un equivalente en contratos_equivalencias (A↔B)."""
+    return obtener_metadatos_contratos()['equivalencias'].get(str(contrato).strip())
+
+
+def obtener_datos_contrato(contrato, fecha_datos):
+    """
+    MEJORADO CON ENRIQUECIMIENTO + INTEGRACIÓN VERTEX
+    Obtiene datos del contrato desde usuarios_tiktok,
+    enriquece nombres desde histórico,
+    mapea paypal_bruto desde reportes_contratos,
+    y une datos del contrato equivalente (A↔B) si existe.
+    Se recalcula solo cuando cambia la versión de alguna tabla de origen.
+    """
+    return _cargar_datos_contrato(contrato, fecha_datos, obtener_version_datos(*TABLAS_DATOS_CONTRATO))
+
+@cache_acotada('contratos', max_entradas=500, max_mb=512)
+def _cargar_datos_contrato(contrato, fecha_datos, version):
+    """Carga y cálculo de datos del contrato (cacheada por versión de datos, vía capa async)"""
+    return ejecutar_async(aobtener_datos_contrato(contrato, fecha_datos))
+
+# ============================================================================
+# MOTOR DE REGLAS DE CONTRATO (tipo_logica, umbrales Vertex, excepciones)
+# ============================================================================
+
+# Mínimos de cada nivel: nivel -> (días, horas). El nivel 1 puede ajustarse
+# por contrato Vertex (incentivos_custom_vertex) o por jugador (excepciones).
+MINIMOS_NIVEL = {1: (7, 15), 2: (14, 30), 3: (20, 40)}
+
+# tipo_logica que cobran con incentivos_horizontales (mismo criterio que
+# mi-progreso.html). Sin tipo_logica se mantiene la tabla, como hasta ahora.
+LOGICAS_CON_TABLA = {'EMPLEADO_ESTANDAR', 'EMPLEADO_TABLA_LIMITADA', 'HIBRIDO_MEVAK', 'EMPLEADO_4PCT_AUTONOMO'}
+
+# Forma de pago de una fila
+PAGO_TABLA = 0          # tramos de incentivos_horizontales
+PAGO_SIN_REGALO = 1     # Vertex sin_regalo: puede cumplir, no cobra
+PAGO_DESCONOCIDO = 2    # tabla propia de Vertex o tipo_logica sin tabla: no se adivina (NaN)
+PAGO_PORCENTAJE = 3     # excepción por % de diamantes
+
+# Excepciones por %: paypal = diamantes * pct / 10000, coins = diamantes * pct / 100
+# (100 coins = $1); aplica_descuento_paypal paga el 80% (mi-progreso.html v1.3-v1.4)
+FACTOR_DESCUENTO_PAYPAL = 0.8
+
+TABLAS_REGLAS_CALCULO = ('incentivos_custom_vertex', 'excepciones_calculo_jugador')
+
+def _a_float(valor, defecto):
+    """Número de configuración o `defecto` si falta / no es numérico"""
+    try:
+        numero = float(valor)
+    except (TypeError, ValueError):
+        return float(defecto)
+    return float(defecto) if np.isnan(numero) else numero
+
+def leer_reglas_calculo():
+    """
+    Filas crudas de las tablas de reglas. Sin try: un fallo de lectura se propaga
+    y no queda en caché un motor compilado sin excepciones ni umbrales Vertex.
+    """
+    supabase = get_supabase()
+    return {tabla: leer_paginado(lambda: supabase.table(tabla).select('*'))
+            for tabla in TABLAS_REGLAS_CALCULO}
+
+def compilar_reglas_calculo(filas, periodo):
+    """
+    Reglas vigentes en `periodo`: {'vertex': {codigo: (dias, horas)}, 'sin_regalo': set,
+    'tabla_propia': set, 'excepciones': {id_tiktok: {...}}}.
+    Solo cuentan las excepciones conectadas al cálculo (con moneda_regalo) y ya vigentes.
+    """
+    reglas = {'vertex': {}, 'sin_regalo': set(), 'tabla_propia': set(), 'excepciones': {}}
+
+    for row in filas.get('incentivos_custom_vertex', []):
+        codigo = str(row.get('codigo') or '').strip().upper()
+        if not codigo:
+            continue
+        if row.get('sin_regalo'):
+            reglas['sin_regalo'].add(codigo)
+        elif row.get('usa_tabla_propia'):
+            reglas['tabla_propia'].add(codigo)
+        else:
+            reglas['vertex'][codigo] = (row.get('dias_min'), row.get('horas_min'))
+
+    for row in filas.get('excepciones_calculo_jugador', []):
+        if not row.get('moneda_regalo') or not row.get('id_tiktok'):
+            continue
+        if row.get('activo_desde') and str(row['activo_desde']) > str(periodo):
+            continue
+        reglas['excepciones'][str(row['id_tiktok']).strip()] = {
+            'dias': row.get('dias_min'),
+            'horas': row.get('horas_min'),
+            'porcentaje': row.get('tipo_pago') == 'porcentaje',
+            'regalo_pct': row.get('regalo_pct'),
+            'moneda': str(row.get('moneda_regalo')).strip().lower(),
+            'descuento': row.get('aplica_descuento_paypal') is True,
+        }
+
+    return reglas
+
+def obtener_reglas_calculo(periodo):
+    """Umbrales Vertex y excepciones de jugador vigentes en el periodo"""
+    return _cargar_reglas_calculo(str(periodo), obtener_version_datos(*TABLAS_REGLAS_CALCULO))
+
+@cache_acotada('reglas_calculo', max_entradas=24, max_mb=4)
+def _cargar_reglas_calculo(periodo, version):
+    """Lectura y compilación de reglas (cacheada por versión de datos)"""
+    return compilar_reglas_calculo(leer_reglas_calculo(), periodo)
+
+class MotorReglas:
+    """
+    Reglas de un periodo compiladas una sola vez:
+    - por contrato: mínimos (días, horas) de los 3 niveles, nivel1_tabla3 y forma de pago
+    - por jugador: excepciones indexadas por id_tiktok (mínimo propio, %, moneda)
+    resolver() cruza un frame completo con get_indexer; evaluar() calcula
+    nivel, cumple e incentivos en una pasada vectorizada.
+    """
+
+    def __init__(self, config=None, reglas=None):
+        config = {str(c).strip().upper(): v for c, v in (config or {}).items()}
+        reglas = reglas or {'vertex': {}, 'sin_regalo': set(), 'tabla_propia': set(), 'excepciones': {}}
+
+        codigos = sorted(set(config) | set(reglas['vertex']) | reglas['sin_regalo'] | reglas['tabla_propia'])
+        n = len(codigos)
+
+        # Una fila por contrato + la última para contratos sin registro (reglas estándar)
+        dias = np.tile([float(MINIMOS_NIVEL[k][0]) for k in (1, 2, 3)], (n + 1, 1))
+        horas = np.tile([float(MINIMOS_NIVEL[k][1]) for k in (1, 2, 3)], (n + 1, 1))
+        tabla3 = np.zeros(n + 1, dtype=bool)
+        pago = np.full(n + 1, PAGO_TABLA, dtype=np.int8)
+
+        for i, codigo in enumerate(codigos):
+            cfg = config.get(codigo, {})
+            tabla3[i] = bool(cfg.get('nivel1_tabla3'))
+            logica = str(cfg.get('tipo_logica') or '').strip().upper()
+            if logica and logica not in LOGICAS_CON_TABLA:
+                pago[i] = PAGO_DESCONOCIDO
+            if codigo in reglas['sin_regalo']:
+                pago[i] = PAGO_SIN_REGALO
+            elif codigo in reglas['tabla_propia']:
+                pago[i] = PAGO_DESCONOCIDO
+            elif codigo in reglas['vertex']:
+                dias_min, horas_min = reglas['vertex'][codigo]
+                dias[i, 0] = _a_float(dias_min, dias[i, 0])
+                horas[i, 0] = _a_float(horas_min, horas[i, 0])
+
+        # Un mínimo de nivel 1 por encima del estándar arrastra a los niveles superiores
+        self.contratos = pd.Index(codigos)
+        self.dias = np.maximum.accumulate(dias, axis=1)
+        self.horas = np.maximum.accumulate(horas, axis=1)
+        self.tabla3 = tabla3
+        self.pago = pago
+
+        excepciones = reglas['excepciones']
+        valores = list(excepciones.values())
+        self.excepciones = pd.Index(list(excepciones))
+        self.exc_dias = np.array([_a_float(e['dias'], MINIMOS_NIVEL[1][0]) for e in valores])
+        self.exc_horas = np.array([_a_float(e['horas'], MINIMOS_NIVEL[1][1]) for e in valores])
+        self.exc_porcentaje = np.array([bool(e['porcentaje']) for e in valores], dtype=bool)
+        self.exc_pct = np.array([_a_float(e['regalo_pct'], np.nan) for e in valores])
+        self.exc_factor = np.array([FACTOR_DESCUENTO_PAYPAL if e['descuento'] else 1.0 for e in valores])
+        self.exc_coins = np.array([e['moneda'] in ('coins', 'ambos') for e in valores], dtype=bool)
+        self.exc_paypal = np.array([e['moneda'] in ('paypal', 'ambos') for e in valores], dtype=bool)
+
+    def resolver(self, df):
+        """Reglas de cada fila del frame como arreglos alineados (contrato + excepción)"""
+        n = len(df)
+        contratos = df['contrato'] if 'contrato' in df.columns else pd.Series('', index=df.index)
+        pos = self.contratos.get_indexer(contratos.astype(str).str.strip().str.upper())
+        pos = np.where(pos < 0, len(self.contratos), pos)
+
+        r = SimpleNamespace(
+            dias=self.dias[pos], horas=self.horas[pos], tabla3=self.tabla3[pos], pago=self.pago[pos],
+            pct=np.full(n, np.nan), factor=np.ones(n),
+            paga_coins=np.ones(n, dtype=bool), paga_paypal=np.ones(n, dtype=bool),
+        )
+
+        if len(self.excepciones) and 'id_tiktok' in df.columns:
+            pos_e = self.excepciones.get_indexer(df['id_tiktok'].astype(str).str.strip())
+            con = pos_e >= 0
+            if con.any():
+                e = pos_e[con]
+                r.dias[con, 0] = self.exc_dias[e]
+                r.horas[con, 0] = self.exc_horas[e]
+                r.dias[con] = np.maximum.accumulate(r.dias[con], axis=1)
+                r.horas[con] = np.maximum.accumulate(r.horas[con], axis=1)
+                r.pago[con] = np.where(self.exc_porcentaje[e], PAGO_PORCENTAJE, r.pago[con])
+                r.pct[con] = self.exc_pct[e]
+                r.factor[con] = self.exc_factor[e]
+                r.paga_coins[con] = self.exc_coins[e]
+                r.paga_paypal[con] = self.exc_paypal[e]
+
+        return r
+
+    @staticmethod
+    def nivel(r, dias, horas):
+        """Nivel alcanzado con los mínimos de cada fila"""
+        return _nivel_por_minimos(np.asarray(dias, dtype=float), np.asarray(horas, dtype=float), r.dias, r.horas)
+
+    @staticmethod
+    def pagar(r, df_incentivos, diamantes, nivel):
+        """
+        (coins, paypal, nivel de pago) por fila: tramos con la columna del nivel
+        (nivel 3 con nivel1_tabla3), % de diamantes en excepciones, 0 sin regalo,
+        NaN cuando la tabla del contrato no es conocida. Sin nivel no se cobra.
+        """
+        diamantes = np.nan_to_num(np.asarray(diamantes, dtype=float))
+        nivel = np.asarray(nivel)
+        nivel_pago = np.where(r.tabla3, np.where(nivel >= 1, 3, 0), nivel)
+
+        coins, paypal = calcular_incentivos_vectorizado(df_incentivos, pd.Series(diamantes), nivel_pago)
+        coins, paypal = coins.to_numpy(dtype=float), paypal.to_numpy(dtype=float)
+
+        porcentaje = r.pago == PAGO_PORCENTAJE
+        base = diamantes * r.pct * r.factor
+        coins = np.where(porcentaje, np.round(base / 100), coins)
+        paypal = np.where(porcentaje, base / 10000, paypal)
+
+        coins = np.where(r.paga_coins, coins, 0)
+        paypal = np.where(r.paga_paypal, paypal, 0)
+        coins = np.where(r.pago == PAGO_SIN_REGALO, 0, np.where(r.pago == PAGO_DESCONOCIDO, np.nan, coins))
+        paypal = np.where(r.pago == PAGO_SIN_REGALO, 0, np.where(r.pago == PAGO_DESCONOCIDO, np.nan, paypal))
+
+        sin_nivel = nivel == 0
+        return np.where(sin_nivel, 0, coins), np.where(sin_nivel, 0, paypal), nivel_pago
+
+    def evaluar(self, df, df_incentivos):
+        """nivel_original, cumple, nivel e incentivos de todo el frame (lo modifica y lo devuelve)"""
+        r = self.resolver(df)
+        nivel_original = self.nivel(r, _numerico(df, 'dias'), _numerico(df, 'horas'))
+        coins, paypal, nivel_pago = self.pagar(r, df_incentivos, _numerico(df, 'diamantes'), nivel_original)
+
+        df['nivel_original'] = nivel_original
+        df['cumple'] = np.where(nivel_original > 0, 'SI', 'NO')
+        df['incentivo_coins'] = coins
+        df['incentivo_paypal'] = paypal
+        df['nivel'] = nivel_pago
+        return df
+
+def obtener_motor_reglas(periodo):
+    """MotorReglas del periodo; se recompila solo cuando cambian contratos o reglas"""
+    return _compilar_motor_reglas(str(periodo), obtener_version_datos('contratos', *TABLAS_REGLAS_CALCULO))
+
+@cache_acotada('motores', max_entradas=24, max_mb=16, copiar=False)
+def _compilar_motor_reglas(periodo, version):
+    """Compilación del motor (compartido entre sesiones: es de solo lectura)"""
+    return MotorReglas(obtener_metadatos_contratos()['config'], obtener_reglas_calculo(periodo))
+
+def _nivel_por_minimos(dias, horas, dias_req, horas_req):
+    """Nivel alcanzado con mínimos por fila (vectorizado)"""
+    cumple = (dias[:, None] >= dias_req) & (horas[:, None] >= horas_req)
+    return np.select([cumple[:, 2], cumple[:, 1], cumple[:, 0]], [3, 2, 1], default=0)
+
+def calcular_niveles_contrato(df, df_incentivos, motor=None):
+    """
+    Normaliza horas y calcula nivel, cumple e incentivos de las filas (uno o
+    varios contratos). Sin I/O: lo comparten la carga síncrona, la asíncrona,
+    el backfill y Mi Progreso. `motor` es el MotorReglas del periodo; sin él
+    se aplican las reglas estándar.
+    """
+    # Normalizar horas: derivarlas de 'duracion' cuando no vienen
+    if 'horas' not in df.columns:
+        df['horas'] = 0
+    if 'duracion' in df.columns:
+        horas_num = pd.to_numeric(df['horas'], errors='coerce')
+        df['horas'] = horas_num.where(horas_num > 0, parsear_duracion_horas(df['duracion']))
+    
+    # Nivel, cumplimiento e incentivos (vectorizado sobre todo el frame)
+    return (motor or MotorReglas()).evaluar(df, df_incentivos)
+
+def aplicar_paypal_bruto(df, filas_reportes):
+    """Mapea paypal_bruto desde filas de reportes_contratos (usuario_id -> paypal_bruto)"""
+    try:
+        if filas_reportes:
+            df_reportes = pd.DataFrame(filas_reportes)
+            df['id_tiktok_str'] = df['id_tiktok'].astype(str)
+            df_reportes['usuario_id_str'] = df_reportes['usuario_id'].astype(str)
+
+            paypal_map = dict(zip(df_reportes['usuario_id_str'], df_reportes['paypal_bruto']))
+
+            df['paypal_bruto'] = df['id_tiktok_str'].map(paypal_map).fillna(
+                df.get('paypal_bruto', pd.Series(0, index=df.index))
+            )
+            df = df.drop('id_tiktok_str', axis=1)
+        else:
+            # Para jugadores de Vertex usar sueldo ya calculado si existe
+            if 'paypal_bruto' not in df.columns:
+                df['paypal_bruto'] = 0
+    except Exception:
+        df['paypal_bruto'] = 0
+    
+    return df
+
+# ============================================================================
+# CAPA DE DATOS ASÍNCRONA (cliente async de Supabase)
+# ============================================================================
+
+ASYNC_MAX_CONCURRENCIA = int(os.getenv("ASYNC_MAX_CONCURRENCIA", "8"))  # consultas en vuelo a la vez
+
+@st.cache_resource
+def _estado_async():
+    """Bucle asyncio de fondo (uno por proceso), su cliente async y el semáforo de concurrencia"""
+    bucle = asyncio.new_event_loop()
+    threading.Thread(target=bucle.run_forever, daemon=True, name='supabase-async').start()
+    return {
+        'bucle': bucle,
+        'cliente': None,
+        'semaforo': asyncio.Semaphore(ASYNC_MAX_CONCURRENCIA),
+    }
+
+def ejecutar_async(corrutina):
+    """
+    Puente síncrono para las vistas Streamlit: corre la corrutina en el
+    bucle de fondo y bloquea hasta tener el resultado.
+    Nunca llamarlo desde dentro del propio bucle.
+    """
+    prioridad = _PRIORIDAD_ACTUAL.get()
+
+    async def con_prioridad():
+        # El carril del hilo que llama se hereda dentro del bucle de fondo
+        _PRIORIDAD_ACTUAL.set(prioridad)
+        return await corrutina
+
+    return asyncio.run_coroutine_threadsafe(con_prioridad(), _estado_async()['bucle']).result()
+
+async def get_supabase_async():
+    """Obtiene cliente async de Supabase (se crea dentro del bucle de fondo)"""
+    estado = _estado_async()
+    if estado['cliente'] is None:
+        url, key = _credenciales_supabase()
+        estado['cliente'] = await acreate_client(url, key)
+    return estado['cliente']
+
+async def _aejecutar(consulta):
+    """Ejecuta un query builder async respetando el tope de concurrencia y el planificador"""
+    async with _estado_async()['semaforo']:
+        return await aejecutar_planificado(consulta.execute)
+
+async def aleer_paginado(construir_consulta, tamano_lote=1000):
+    """Versión async de leer_paginado"""
+    filas = []
+    offset = 0
+    while True:
+        resultado = await _aejecutar(construir_consulta().range(offset, offset + tamano_lote - 1))
+        lote = resultado.data or []
+        filas.extend(lote)
+        if len(lote) < tamano_lote:
+            break
+        offset += tamano_lote
+    return filas
+
+PERIODOS_LOTE = 1000   # filas por página del respaldo de periodos
+
+async def aobtener_periodos_disponibles():
+    """
+    Versión async de la carga de periodos: RPC obtener_fechas_disponibles y,
+    si no existe, el respaldo por páginas.
+    """
+    asb = await get_supabase_async()
+
+    # OPCIÓN A: Intentar usar función RPC (si existe)
+    try:
+        resultado_rpc = await _aejecutar(asb.rpc('obtener_fechas_disponibles'))
+        if resultado_rpc.data:
+            return filtrar_fechas_inteligente([r['fecha_datos'] for r in resultado_rpc.data])
+    except Exception:
+        pass
+
+    # OPCIÓN B: páginas ordenadas por fecha (más reciente primero). Cada página
+    # sigue por debajo de la fecha más antigua leída (keyset): salta el resto de
+    # filas de ese corte, avanza al menos un corte por página y termina con la
+    # primera página corta. Ve todos los cortes, sin tope de filas
+    todas_fechas = set()
+    anterior = None
+    while True:
+        consulta = asb.table('usuarios_tiktok').select('fecha_datos').not_.is_('fecha_datos', 'null')
+        if anterior is not None:
+            consulta = consulta.lt('fecha_datos', anterior)
+        filas = (await _aejecutar(consulta.order('fecha_datos', desc=True).limit(PERIODOS_LOTE))).data or []
+        fechas = [r['fecha_datos'] for r in filas if r.get('fecha_datos')]
+        todas_fechas.update(fechas)
+        if len(filas) < PERIODOS_LOTE or not fechas:
+            break
+        anterior = min(fechas)
+
+    return filtrar_fechas_inteligente(list(todas_fechas))
+
+async def aobtener_reportes(contratos, periodo, columnas='*'):
+    """Filas de reportes_contratos de uno o varios contratos en un periodo (paginado)"""
+    asb = await get_supabase_async()
+    return await aleer_paginado(lambda: asb.table('reportes_contratos')
+                                .select(columnas)
+                                .in_('contrato', list(contratos))
+                                .eq('periodo', periodo))
+
+async def aenriquecer_nombres_desde_historial(df: pd.DataFrame) -> pd.DataFrame:
+    """Versión async de enriquecer_nombres_desde_historial: los lotes de 400 van en paralelo"""
+    pendientes = _ids_sin_nombre(df)
+    if not pendientes or not pendientes[3]:
+        return df
+    col_user, col_id, mask, ids = pendientes
+
+    asb = await get_supabase_async()
+
+    async def buscar_lote(lote):
+        # Intento 1: por id_tiktok / Intento 2: por usuario_id
+        for columna in ("id_tiktok", "usuario_id"):
+            try:
+                r = await _aejecutar(asb.table("historico_usuarios")
+                                     .select("*")
+                                     .in_(columna, lote)
+                                     .order("visto_ultima_vez", desc=True))
+                if r.data:
+                    return r.data
+            except Exception:
+                pass
+        return []
+
+    lotes = await asyncio.gather(*(
+        buscar_lote(ids[i:i+HISTORIAL_CHUNK]) for i in range(0, len(ids), HISTORIAL_CHUNK)
+    ))
+
+    mapping = {}
+    for rows in lotes:
+        mapping.update(_mapa_nombres_historial(rows))
+
+    return _aplicar_mapa_nombres(df, col_user, col_id, mask, mapping)
+
+async def aobtener_datos_contrato(contrato, fecha_datos):
+    """
+    Versión async de obtener_datos_contrato (sin caché).
+    usuarios_tiktok, reportes_contratos e incentivos se piden a la vez.
+    """
+    asb = await get_supabase_async()
+
+    # Motor de reglas del corte y registro de metadatos: caché síncrona, fuera del bucle
+    motor, contrato_equivalente = await asyncio.to_thread(
+        lambda: (obtener_motor_reglas(fecha_datos),
+                 obtener_contrato_equivalente(None, contrato))
+    )
+
+    # Si hay equivalente (Nexus ↔ Vertex), traer ambos contratos en una sola query
+    contratos = [contrato] + ([contrato_equivalente] if contrato_equivalente else [])
+
+    async def reportes_o_none():
+        try:
+            return await aobtener_reportes(contratos, fecha_datos, 'usuario_id, paypal_bruto')
+        except Exception:
+            return None
+
+    filas, filas_reportes, df_incentivos = await asyncio.gather(
+        aleer_paginado(lambda: asb.table('usuarios_tiktok')
+                       .select('*')
+                       .in_('contrato', contratos)
+                       .eq('fecha_datos', fecha_datos)),
+        reportes_o_none(),
+        asyncio.to_thread(obtener_incentivos),
+    )
+
+    if not filas:
+        return pd.DataFrame()
+
+    df = pd.DataFrame(filas)
+    df = await aenriquecer_nombres_desde_historial(df)
+    df = await asyncio.to_thread(calcular_niveles_contrato, df, df_incentivos, motor)
+
+    if filas_reportes is None:
+        df['paypal_bruto'] = 0
+    else:
+        df = aplicar_paypal_bruto(df, filas_reportes)
+
+    return df
+
+async def acargar_datos_contratos(pares):
+    """Carga varios (contrato, periodo) con asyncio.gather; el semáforo acota las consultas"""
+    resultados = await asyncio.gather(*(aobtener_datos_contrato(c, p) for c, p in pares))
+    return dict(zip(pares, resultados))
+
+def obtener_datos_contratos(pares):
+    """
+    Puente síncrono para cargas multi-contrato / multi-periodo.
+    Devuelve {(contrato, periodo): DataFrame}.
+    """
+    pares = list(dict.fromkeys((str(c), str(p)) for c, p in pares))
+    version = obtener_version_datos(*TABLAS_DATOS_CONTRATO)
+
+    # Lo que ya está en la caché de contratos (vistas, precalentador) no se vuelve a pedir
+    resultados, faltantes = {}, []
+    for par in pares:
+        encontrado, df = _cargar_datos_contrato.en_cache(*par, version)
+        if encontrado:
+            resultados[par] = df
+        else:
+            faltantes.append(par)
+
+    if faltantes:
+        for par, df in ejecutar_async(acargar_datos_contratos(faltantes)).items():
+            _cargar_datos_contrato.sembrar(df, *par, version)
+            resultados[par] = df.copy()
+
+    return {par: resultados[par] for par in pares}
+
+# ============================================================================
+# RED DE CONTRATOS (jerarquía: contrato + subcontratos + equivalentes)
+# ============================================================================
+
+def contratos_descendientes(contrato):
+    """Contrato y todos los que le reportan directa o indirectamente (jerarquia_contratos)"""
+    subordinados = obtener_metadatos_contratos()['subordinados']
+    contrato = str(contrato).strip()
+    red, pendientes = [contrato], [contrato]
+    while pendientes:
+        for hijo in sorted(subordinados.get(pendientes.pop(0), [])):
+            if hijo not in red:  # tolera ciclos en la tabla
+                red.append(hijo)
+                pendientes.append(hijo)
+    return red
+
+async def aobtener_datos_red(contratos, periodo):
+    """
+    Todos los contratos de la red (más sus equivalentes Nexus ↔ Vertex) en un
+    corte: un solo `in_('contrato', ...)` paginado y un cálculo vectorizado.
+    `contrato_grupo` es el contrato de la red al que pertenece cada fila.
+    """
+    asb = await get_supabase_async()
+    metadatos = await asyncio.to_thread(obtener_metadatos_contratos)
+
+    # Cada equivalente se agrupa con su contrato, como en la vista individual
+    grupo = {c: c for c in contratos}
+    for c in contratos:
+        equivalente = metadatos['equivalencias'].get(c)
+        if equivalente and equivalente not in grupo:
+            grupo[equivalente] = c
+    todos = list(grupo)
+
+    async def reportes_o_none():
+        try:
+            return await aobtener_reportes(todos, periodo, 'usuario_id, paypal_bruto')
+        except Exception:
+            return None
+
+    filas, filas_reportes, df_incentivos = await asyncio.gather(
+        aleer_paginado(lambda: asb.table('usuarios_tiktok')
+                       .select('*')
+                       .in_('contrato', todos)
+                       .eq('fecha_datos', periodo)),
+        reportes_o_none(),
+        asyncio.to_thread(obtener_incentivos),
+    )
+
+    if not filas:
+        return pd.DataFrame()
+
+    df = pd.DataFrame(filas)
+    df = await aenriquecer_nombres_desde_historial(df)
+    df['contrato_grupo'] = df['contrato'].astype(str).str.strip().map(grupo)
+
+    # Cada fila con las reglas de su propio contrato (motor del corte)
+    motor = await asyncio.to_thread(obtener_motor_reglas, periodo)
+    df = await asyncio.to_thread(calcular_niveles_contrato, df, df_incentivos, motor)
+
+    if filas_reportes is None:
+        df['paypal_bruto'] = 0
+    else:
+        df = aplicar_paypal_bruto(df, filas_reportes)
+
+    return df
+
+def obtener_datos_red(contrato, periodo):
+    """Datos combinados de la red del contrato (cacheados por versión de datos)"""
+    return _cargar_datos_red(
+        tuple(contratos_descendientes(contrato)),
+        periodo,
+        obtener_version_datos(*TABLAS_DATOS_CONTRATO, 'jerarquia_contratos')
+    )
+
+@cache_acotada('red', max_entradas=100, max_mb=256)
+def _cargar_datos_red(contratos, periodo, version):
+    """Carga de la red (cacheada por versión de datos, vía capa async)"""
+    return ejecutar_async(aobtener_datos_red(list(contratos), periodo))
+
+def resumen_red(df):
+    """Totales por contrato de la red (una fila por contrato_grupo)"""
+    numericas = df[['diamantes', 'incentivo_coins', 'incentivo_paypal', 'paypal_bruto']]\
+        .apply(pd.to_numeric, errors='coerce').fillna(0)
+    numericas['contrato'] = df['contrato_grupo'].to_numpy()
+    numericas['cumple'] = (df['cumple'] == 'SI').to_numpy()
+    return numericas.groupby('contrato', sort=False).agg(
+        jugadores=('cumple', 'size'),
+        cumplen=('cumple', 'sum'),
+        diamantes=('diamantes', 'sum'),
+        incentivo_coins=('incentivo_coins', 'sum'),
+        incentivo_paypal=('incentivo_paypal', 'sum'),
+        paypal_bruto=('paypal_bruto', 'sum'),
+    ).reset_index()
+
+# ============================================================================
+# ÚLTIMA COPIA BUENA (stale-while-revalidate)
+# ============================================================================
+
+ULTIMA_COPIA_DIR = os.getenv("ULTIMA_COPIA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".ultima_copia"))
+ULTIMA_COPIA_MAX_ENTRADAS = int(os.getenv("ULTIMA_COPIA_MAX_ENTRADAS", "500"))  # copias en memoria (LRU)
+ULTIMA_COPIA_HILOS = int(os.getenv("ULTIMA_COPIA_HILOS", "4"))                  # refrescos a la vez
+ULTIMA_COPIA_FRESCA = VERSION_SONDEO_TTL   # segundos sin volver a consultar tras un refresco
+ULTIMA_COPIA_ESPERA = int(os.getenv("ULTIMA_COPIA_ESPERA", "25"))              # tope de espera sin copia previa
+
+@st.cache_resource
+def _ultima_copia():
+    """Copias en memoria por (contrato, periodo) + refrescos en curso (uno por clave, compartido)"""
+    return {
+        'lock': threading.Lock(),
+        'copias': OrderedDict(),
+        'en_curso': {},
+        'ejecutor': ThreadPoolExecutor(max_workers=ULTIMA_COPIA_HILOS, thread_name_prefix='ultima-copia'),
+    }
+
+def _ruta_ultima_copia(contrato, periodo):
+    """Archivo en disco de la copia (nombre seguro para el sistema de archivos)"""
+    nombre = re.sub(r'[^0-9A-Za-z_.-]', '_', f"{contrato}__{periodo}")
+    return os.path.join(ULTIMA_COPIA_DIR, f"{nombre}.pkl")
+
+def _leer_copia_disco(contrato, periodo):
+    """Copia guardada por una ejecución anterior del proceso (None si no hay o está dañada)"""
+    ruta = _ruta_ultima_copia(contrato, periodo)
+    try:
+        df = pd.read_pickle(ruta)
+        actualizado = datetime.fromtimestamp(os.path.getmtime(ruta))
+    except Exception:
+        return None
+    # Viene de disco: se muestra al instante pero se revalida en la primera visita.
+    # Sin versión conocida: las vistas no usan la caché de render con ella
+    return {'df': df, 'actualizado': actualizado, 'verificado': 0.0, 'error': None, 'origen': 'disco',
+            'version': None}
+
+def _escribir_copia_disco(contrato, periodo, df):
+    """Escritura atómica (archivo temporal + replace) para no dejar copias a medias"""
+    try:
+        os.makedirs(ULTIMA_COPIA_DIR, exist_ok=True)
+        ruta = _ruta_ultima_copia(contrato, periodo)
+        temporal = f"{ruta}.{threading.get_ident()}.tmp"
+        df.to_pickle(temporal)
+        os.replace(temporal, ruta)
+    except Exception:
+        pass
+
+def guardar_ultima_copia(contrato, periodo, df, version):
+    """
+    Registra un resultado bueno en memoria y, si trae filas, en disco.
+    `version` es la versión de datos con la que se calculó (clave de render).
+    """
+    estado = _ultima_copia()
+    clave = (str(contrato), str(periodo))
+    with estado['lock']:
+        estado['copias'][clave] = {
+            'df': df, 'actualizado': datetime.now(), 'verificado': time.monotonic(),
+            'error': None, 'origen': 'supabase', 'version': version,
+        }
+        estado['copias'].move_to_end(clave)
+        while len(estado['copias']) > ULTIMA_COPIA_MAX_ENTRADAS:
+            estado['copias'].popitem(last=False)
+    if not df.empty:
+        _escribir_copia_disco(contrato, periodo, df)
+
+def _refrescar_copia(contrato, periodo, prioridad):
+    """Consulta la fuente (caché por versión incluida) y actualiza la copia; registra el error si falla"""
+    estado = _ultima_copia()
+    clave = (str(contrato), str(periodo))
+    try:
+        version = obtener_version_datos(*TABLAS_DATOS_CONTRATO)
+        with prioridad_supabase(prioridad):
+            df = _cargar_datos_contrato(contrato, periodo, version)
+        guardar_ultima_copia(contrato, periodo, df, version)
+        return df
+    except Exception as e:
+        with estado['lock']:
+            copia = estado['copias'].get(clave)
+            if copia is not None:
+                copia['error'] = str(e)
+                # Reintentar tras el mismo intervalo que un refresco exitoso
+                copia['verificado'] = time.monotonic()
+        raise
+    finally:
+        with estado['lock']:
+            estado['en_curso'].pop(clave, None)
+
+def _lanzar_refresco(contrato, periodo, prioridad):
+    """Un solo refresco por clave aunque lo pidan varias sesiones a la vez. Con el lock tomado."""
+    estado = _ultima_copia()
+    clave = (str(contrato), str(periodo))
+    futuro = estado['en_curso'].get(clave)
+    if futuro is None:
+        futuro = estado['ejecutor'].submit(_refrescar_copia, contrato, periodo, prioridad)
+        estado['en_curso'][clave] = futuro
+    return futuro
+
+def obtener_datos_contrato_swr(contrato, fecha_datos):
+    """
+    Stale-while-revalidate sobre obtener_datos_contrato.
+    Con copia previa (memoria o disco) la devuelve al instante y refresca en
+    segundo plano; sin copia, espera el refresco hasta ULTIMA_COPIA_ESPERA.
+    Devuelve (df, frescura) con frescura = {'estado', 'actualizado', 'origen', 'error', 'version'}:
+    estado 'al_dia', 'actualizando', 'desactualizado' (falló la fuente) o 'sin_conexion';
+    version = versión de datos con la que se calculó df (None si no se conoce).
+    """
+    estado = _ultima_copia()
+    clave = (str(contrato), str(fecha_datos))
+
+    with estado['lock']:
+        copia = estado['copias'].get(clave)
+        if copia is None:
+            copia = _leer_copia_disco(contrato, fecha_datos)
+            if copia is not None:
+                estado['copias'][clave] = copia
+        if copia is not None:
+            estado['copias'].move_to_end(clave)
+            vencida = time.monotonic() - copia['verificado'] >= ULTIMA_COPIA_FRESCA
+            if vencida:
+                _lanzar_refresco(contrato, fecha_datos, PRIORIDAD_FONDO)
+            frescura = {
+                'estado': 'desactualizado' if copia['error'] else ('actualizando' if vencida else 'al_dia'),
+                'actualizado': copia['actualizado'],
+                'origen': copia['origen'],
+                'error': copia['error'],
+                'version': copia['version'],
+            }
+            # Copia: las vistas agregan columnas y la copia se comparte entre sesiones
+            return copia['df'].copy(), frescura
+        futuro = _lanzar_refresco(contrato, fecha_datos, _PRIORIDAD_ACTUAL.get())
+
+    # Primera visita sin copia: hay que esperar a la fuente (con tope)
+    try:
+        df = futuro.result(timeout=ULTIMA_COPIA_ESPERA)
+        with estado['lock']:
+            copia = estado['copias'].get(clave)
+        actualizado = copia['actualizado'] if copia is not None else datetime.now()
+        version = copia['version'] if copia is not None else None
+        return df.copy(), {'estado': 'al_dia', 'actualizado': actualizado, 'origen': 'supabase', 'error': None,
+                           'version': version}
+    except Exception as e:
+        error = str(e) or f"Sin respuesta en {ULTIMA_COPIA_ESPERA}s"
+        return pd.DataFrame(), {'estado': 'sin_conexion', 'actualizado': None, 'origen': None, 'error': error,
+                                'version': None}
+
+# ============================================================================
+# PRECARGA DE PERIODOS VECINOS (el siguiente cambio de periodo sale al instante)
+# ============================================================================
+
+PRECARGA_VECINOS = int(os.getenv("PRECARGA_VECINOS", "1"))                  # periodos a cada lado
+PRECARGA_MAX_EN_CURSO = int(os.getenv("PRECARGA_MAX_EN_CURSO", "2"))         # precargas a la vez (proceso)
+PRECARGA_MEMORIA_MAX = float(os.getenv("PRECARGA_MEMORIA_MAX", "0.8"))       # fracción usada de la caché 'contratos'
+
+@st.cache_resource
+def _estado_precarga():
+    """Precargas en curso (compartidas por sesiones) y contadores para el panel admin"""
+    return {
+        'lock': threading.Lock(),
+        'en_curso': set(),
+        'stats': {'lanzadas': 0, 'con_copia': 0, 'sin_cupo': 0, 'sin_memoria': 0, 'errores': 0},
+    }
+
+def estadisticas_precarga():
+    """(contadores, precargas en curso) para el panel admin"""
+    precarga = _estado_precarga()
+    with precarga['lock']:
+        return dict(precarga['stats']), len(precarga['en_curso'])
+
+def periodos_vecinos(periodos, periodo, n=PRECARGA_VECINOS):
+    """Periodos junto al elegido (lista más reciente primero): el anterior va primero"""
+    if periodo not in periodos:
+        return []
+    i = periodos.index(periodo)
+    vecinos = []
+    for paso in range(1, n + 1):
+        for j in (i + paso, i - paso):
+            if 0 <= j < len(periodos):
+                vecinos.append(periodos[j])
+    return vecinos
+
+def _tiene_copia(contrato, periodo):
+    """Ya hay última copia buena (memoria o disco): la vista la mostraría al instante"""
+    estado = _ultima_copia()
+    with estado['lock']:
+        if (str(contrato), str(periodo)) in estado['copias']:
+            return True
+    return os.path.exists(_ruta_ultima_copia(contrato, periodo))
+
+def _fin_precarga(clave, futuro):
+    """Callback del refresco: libera el cupo y cuenta errores"""
+    estado = _estado_precarga()
+    with estado['lock']:
+        estado['en_curso'].discard(clave)
+        if futuro.exception() is not None:
+            estado['stats']['errores'] += 1
+
+def precargar_periodos_vecinos(contrato, periodos, periodo):
+    """
+    Tras pintar un periodo, carga en segundo plano (carril de fondo, mismo
+    ejecutor y deduplicación que los refrescos SWR) los periodos vecinos que
+    aún no tengan copia. Especulativo: se omite sin cupo de concurrencia o si
+    la caché de contratos ya pasa de PRECARGA_MEMORIA_MAX.
+    """
+    estado = _estado_precarga()
+    for vecino in periodos_vecinos(periodos, periodo):
+        clave = (str(contrato), str(vecino))
+        if _tiene_copia(contrato, vecino):
+            with estado['lock']:
+                estado['stats']['con_copia'] += 1
+            continue
+
+        uso = _cargar_datos_contrato.cache().resumen()
+        if uso['max_bytes'] and uso['bytes'] >= PRECARGA_MEMORIA_MAX * uso['max_bytes']:
+            with estado['lock']:
+                estado['stats']['sin_memoria'] += 1
+            return
+
+        with estado['lock']:
+            if clave in estado['en_curso']:
+                continue
+            if len(estado['en_curso']) >= PRECARGA_MAX_EN_CURSO:
+                estado['stats']['sin_cupo'] += 1
+                return
+            estado['en_curso'].add(clave)
+            estado['stats']['lanzadas'] += 1
+
+        with _ultima_copia()['lock']:
+            futuro = _lanzar_refresco(contrato, vecino, PRIORIDAD_FONDO)
+        futuro.add_done_callback(functools.partial(_fin_precarga, clave))
+
+# ============================================================================
+# HISTORIAL DE JUGADOR (periodos cerrados en caché + marca de agua incremental)
+# ============================================================================
+
+COLUMNAS_HISTORIAL = (
+    'id_tiktok, usuario, dias, duracion, diamantes, fecha_datos, contrato, agente, nivel, '
+    'partidas, nuevos_seguidores, nuevos_fans, fans_totales, fans_activos_club, '
+    'fecha_incorporacion, paypal_incentivo, coins_incentivo'
+)
+COLUMNAS_REPORTE_HISTORIAL = 'periodo, usuario, paypal_bruto, paypal_incentivo, coins_bruto, coins_incentivo'
+
+HISTORIAL_MESES_ABIERTOS = int(os.getenv("HISTORIAL_MESES_ABIERTOS", "2"))  # mes en curso + anterior (pagos del 15 al 25)
+HISTORIAL_CERRADO_TTL = int(os.getenv("HISTORIAL_CERRADO_TTL", str(24 * 3600)))  # red de seguridad ante correcciones
+
+def limite_historial_cerrado(hoy=None):
+    """
+    Primer día del mes abierto más antiguo ('YYYY-MM-DD'). Los cortes anteriores
+    son periodos cerrados: sus filas y pagos ya no cambian.
+    """
+    hoy = hoy or datetime.now()
+    indice = hoy.year * 12 + hoy.month - 1 - (HISTORIAL_MESES_ABIERTOS - 1)
+    return f"{indice // 12:04d}-{indice % 12 + 1:02d}-01"
+
+def cruzar_reportes_historial(df):
+    """
+    Cruce por (periodo, usuario) con reportes_contratos como mi-progreso.html:
+    si hay reporte, sus pagos reemplazan a los de usuarios_tiktok. Vertex no usa reportes.
+    """
+    contratos = [c for c in df['contrato'].dropna().astype(str).unique() if not c.upper().startswith('B')]
+    if not contratos:
+        return df
+
+    # Sin try: un fallo no debe dejar en caché el historial sin pagos de reportes
+    supabase = get_supabase()
+    reportes = pd.DataFrame(leer_paginado(lambda: supabase.table('reportes_contratos')
+                                          .select(COLUMNAS_REPORTE_HISTORIAL)
+                                          .in_('contrato', contratos)
+                                          .in_('periodo', sorted(df['fecha_datos'].astype(str).unique()))))
+    if reportes.empty:
+        return df
+
+    reportes = reportes.drop_duplicates(['periodo', 'usuario'], keep='last')\
+        .rename(columns={'periodo': 'fecha_datos'})
+    cruce = df[['fecha_datos', 'usuario']].merge(reportes, on=['fecha_datos', 'usuario'], how='left', indicator=True)
+    con_reporte = (cruce['_merge'] == 'both').to_numpy()
+
+    df = df.copy()
+    for col in ('paypal_bruto', 'paypal_incentivo', 'coins_bruto', 'coins_incentivo'):
+        del_reporte = pd.to_numeric(cruce[col], errors='coerce').fillna(0).to_numpy()
+        previo = df[col].to_numpy() if col in df.columns else np.full(len(df), np.nan)
+        df[col] = np.where(con_reporte, del_reporte, previo)
+    return df
+
+def _consultar_historial(id_tiktok, desde=None, antes_de=None):
+    """Filas del jugador en [desde, antes_de) ya cruzadas con reportes"""
+    supabase = get_supabase()
+
+    def consulta():
+        q = supabase.table('usuarios_tiktok').select(COLUMNAS_HISTORIAL).eq('id_tiktok', id_tiktok)
+        if desde:
+            q = q.gte('fecha_datos', desde)
+        if antes_de:
+            q = q.lt('fecha_datos', antes_de)
+        return q.order('fecha_datos')
+
+    df = pd.DataFrame(leer_paginado(consulta))
+    if df.empty:
+        return df
+    return cruzar_reportes_historial(df)
+
+@cache_acotada('historial_cerrado', max_entradas=5000, max_mb=128, ttl=HISTORIAL_CERRADO_TTL)
+def _cargar_historial_cerrado(id_tiktok, limite):
+    """Periodos cerrados (antes de `limite`): no dependen de la versión de datos"""
+    return _consultar_historial(id_tiktok, antes_de=limite)
+
+@cache_acotada('historial_abierto', max_entradas=1000, max_mb=64)
+def _cargar_historial_abierto(id_tiktok, limite, version):
+    """Periodos abiertos (desde `limite`): se recargan con cada versión de datos"""
+    return _consultar_historial(id_tiktok, desde=limite)
+
+def obtener_historial_jugador(id_tiktok, desde=None):
+    """
+    Historial de un jugador (una fila por corte, orden cronológico), con pagos
+    de reportes_contratos cuando existen (contratos Nexus).
+    `desde`: último corte que ya tiene el cliente; de los periodos cerrados solo
+    se devuelven cortes posteriores (y si es reciente ni se tocan), pero desde
+    limite_historial_cerrado() se devuelve siempre todo.
+    """
+    id_tiktok = str(id_tiktok).strip()
+    limite = limite_historial_cerrado()
+
+    partes = []
+    if not desde or str(desde) < limite:
+        partes.append(_cargar_historial_cerrado(id_tiktok, limite))
+    partes.append(_cargar_historial_abierto(
+        id_tiktok, limite, obtener_version_datos('usuarios_tiktok', 'reportes_contratos')
+    ))
+
+    partes = [p for p in partes if not p.empty]
+    if not partes:
+        return pd.DataFrame()
+    df = pd.concat(partes, ignore_index=True) if len(partes) > 1 else partes[0]
+    if desde:
+        # La ventana abierta va siempre entera: sus pagos llegan en reportes
+        # posteriores al corte y el cliente la reemplaza completa
+        fechas = df['fecha_datos'].astype(str)
+        df = df[(fechas > str(desde)) | (fechas >= limite)]
+    return df.sort_values('fecha_datos', kind='stable').reset_index(drop=True)
+
+def filtrar_cierres_mes(df):
+    """Una fila por mes: el cierre (último día) si existe, si no el corte más reciente"""
+    if df.empty:
+        return df
+    fechas = pd.to_datetime(df['fecha_datos'], errors='coerce')
+    orden = pd.DataFrame({
+        'mes': fechas.dt.to_period('M'),
+        'cierre': fechas.dt.is_month_end,
+        'fecha': fechas,
+    }, index=df.index).dropna(subset=['fecha'])
+    elegidos = orden.sort_values(['mes', 'cierre', 'fecha']).groupby('mes').tail(1).index
+    return df.loc[elegidos].sort_values('fecha_datos', kind='stable').reset_index(drop=True)
+
+# ============================================================================
+# BÚSQUEDA DE JUGADORES (índice de n-gramas: usuario actual + históricos)
+# ============================================================================
+
+BUSQUEDA_NGRAMA = 3          # trigramas
+BUSQUEDA_RESULTADOS = 20     # coincidencias a mostrar
+COLUMNAS_ALIAS = ("usuario_1", "usuario_2", "usuario_3")
+BUSQUEDA_MAX_CORTES = int(os.getenv("BUSQUEDA_MAX_CORTES", "64"))   # índices de corte en memoria (LRU)
+
+def normalizar_alias(texto):
+    """Minúsculas, sin espacios extremos ni '@' inicial"""
+    if texto is None or (isinstance(texto, float) and pd.isna(texto)):
+        return ""
+    return str(texto).strip().lstrip("@").lower()
+
+def _ngramas(texto):
+    """N-gramas con relleno en los bordes (premia coincidencias al inicio / final)"""
+    relleno = f" {texto} "
+    if len(relleno) <= BUSQUEDA_NGRAMA:
+        return {relleno}
+    return {relleno[i:i + BUSQUEDA_NGRAMA] for i in range(len(relleno) - BUSQUEDA_NGRAMA + 1)}
+
+def _agregar_alias(indice, id_tiktok, texto):
+    """Agrega un alias (idempotente) a un índice en construcción"""
+    alias = normalizar_alias(texto)
+    if not alias:
+        return
+    ids = indice['alias'].get(alias)
+    if ids is None:
+        ids = indice['alias'][alias] = set()
+        indice['original'][alias] = str(texto).strip()
+        for ng in _ngramas(alias):
+            indice['ngramas'].setdefault(ng, set()).add(alias)
+    ids.add(id_tiktok)
+
+async def aobtener_alias_historial(ids):
+    """id_tiktok -> [usuario_1..3] de historico_usuarios, lotes de 400 en paralelo (un lote fallido: error)"""
+    asb = await get_supabase_async()
+
+    async def buscar_lote(lote):
+        r = await _aejecutar(asb.table("historico_usuarios")
+                             .select("id_tiktok, " + ", ".join(COLUMNAS_ALIAS))
+                             .in_("id_tiktok", lote))
+        return r.data or []
+
+    lotes = await asyncio.gather(*(
+        buscar_lote(ids[i:i+HISTORIAL_CHUNK]) for i in range(0, len(ids), HISTORIAL_CHUNK)
+    ))
+
+    alias = {}
+    for rows in lotes:
+        for row in rows:
+            nombres = [row.get(c) for c in COLUMNAS_ALIAS if row.get(c)]
+            alias.setdefault(str(row.get("id_tiktok")), []).extend(nombres)
+    return alias
+
+def indexar_corte(contrato, periodo, df):
+    """
+    Índice de búsqueda de un corte ya cargado (usuario actual + históricos).
+    Vive en el espacio 'busqueda' de la caché acotada (LRU, tope de cortes y
+    bytes) con clave por los (id, usuario) del corte y la versión de
+    historico_usuarios: un cambio de nombre rehace el índice con los alias nuevos.
+    Si historico_usuarios falla se devuelve sin guardar, con `error`.
+    Devuelve {'ngramas': n-grama -> alias, 'alias': alias -> ids, 'original', 'error'}.
+    """
+    indice = {'ngramas': {}, 'alias': {}, 'original': {}, 'error': None}
+    if df.empty or 'id_tiktok' not in df.columns:
+        return indice
+
+    ids = df['id_tiktok'].astype(str)
+    usuarios = df['usuario'].fillna('').astype(str) if 'usuario' in df.columns else pd.Series("", index=df.index)
+    huella = hashlib.sha1('\n'.join(ids + '\t' + usuarios).encode('utf-8')).hexdigest()[:16]
+    clave = (str(contrato), str(periodo), huella, obtener_version_tabla('historico_usuarios'))
+
+    cache = obtener_cache_acotada('busqueda', max_entradas=BUSQUEDA_MAX_CORTES, max_mb=64)
+    encontrado, guardado = cache.obtener(clave)
+    if encontrado:
+        return guardado
+
+    for id_tiktok, usuario in zip(ids, usuarios):
+        _agregar_alias(indice, id_tiktok, usuario)
+    try:
+        alias_historial = ejecutar_async(aobtener_alias_historial(list(ids.unique())))
+    except Exception as e:
+        indice['error'] = str(e)
+        return indice
+
+    for id_tiktok, nombres in alias_historial.items():
+        for nombre in nombres:
+            _agregar_alias(indice, id_tiktok, nombre)
+    # Compartido entre sesiones: ya no se modifica
+    cache.guardar(clave, indice)
+    return indice
+
+def buscar_jugadores(consulta, indice, limite=BUSQUEDA_RESULTADOS):
+    """
+    Coincidencias ordenadas por puntaje para `consulta` en un índice de indexar_corte.
+    Puntaje: similitud de n-gramas (Jaccard) con bono si es prefijo o subcadena.
+    Devuelve [(id_tiktok, alias, puntaje)], un resultado por id.
+    """
+    texto = normalizar_alias(consulta)
+    if not texto:
+        return []
+
+    ngramas_consulta = _ngramas(texto)
+
+    # Candidatos: aliases que comparten al menos un n-grama
+    coincidencias = {}
+    for ng in ngramas_consulta:
+        for alias in indice['ngramas'].get(ng, ()):
+            coincidencias[alias] = coincidencias.get(alias, 0) + 1
+
+    mejores = {}
+    for alias, comunes in coincidencias.items():
+        puntaje = comunes / (len(ngramas_consulta) + len(_ngramas(alias)) - comunes)
+        if alias == texto:
+            puntaje += 1.0
+        elif alias.startswith(texto):
+            puntaje += 0.5
+        elif texto in alias:
+            puntaje += 0.25
+
+        for id_tiktok in indice['alias'][alias]:
+            if puntaje > mejores.get(id_tiktok, (None, -1))[1]:
+                mejores[id_tiktok] = (indice['original'][alias], puntaje)
+
+    ranking = sorted(mejores.items(), key=lambda x: (-x[1][1], x[1][0]))[:limite]
+    return [(id_tiktok, alias, round(min(puntaje / 2, 1.0), 3)) for id_tiktok, (alias, puntaje) in ranking]
+
+# ============================================================================
+# PRECALENTADOR DE CACHÉ (subidas nuevas)
+# ============================================================================
+
+PRECALENTADOR_INTERVALO = int(os.getenv("PRECALENTADOR_INTERVALO", "60"))  # segundos entre sondeos
+PRECALENTADOR_HILOS = int(os.getenv("PRECALENTADOR_HILOS", "4"))  # contratos cargando a la vez
+
+def obtener_ultima_fecha_datos():
+    """Fecha de datos más reciente en usuarios_tiktok (sondeo barato: 1 fila)"""
+    supabase = get_supabase()
+    resultado = supabase.table('usuarios_tiktok')\
+        .select('fecha_datos')\
+        .order('fecha_datos', desc=True)\
+        .limit(1)\
+        .execute()
+
+    if resultado.data:
+        return resultado.data[0].get('fecha_datos')
+    return None
+
+def obtener_contratos_activos():
+    """Contratos con token activo de tipo contrato (los que visitan los jugadores)"""
+    supabase = get_supabase()
+    resultado = supabase.table('contratos_tokens')\
+        .select('contrato, tipo')\
+        .eq('activo', True)\
+        .execute()
+
+    contratos = set()
+    for row in resultado.data or []:
+        if row.get('tipo', 'contrato') == 'contrato' and row.get('contrato'):
+            contratos.add(str(row['contrato']).strip())
+    return sorted(contratos)
+
+def _precalentar_contrato(contrato, periodo):
+    """Calienta un contrato en el carril de fondo (cede el paso a cargas de página)"""
+    version = obtener_version_datos(*TABLAS_DATOS_CONTRATO)
+    with prioridad_supabase(PRIORIDAD_FONDO):
+        df = _cargar_datos_contrato(contrato, periodo, version)
+    # Lo recién calentado queda como última copia buena (primeras visitas al instante)
+    guardar_ultima_copia(contrato, periodo, df, version)
+    return df
+
+def precalentar_cache(estado, fecha_nueva=None):
+    """
+    Precalcula periodos y obtener_datos_contrato para todos los contratos activos.
+    Corre con concurrencia acotada (PRECALENTADOR_HILOS) y reporta avance en `estado`.
+    """
+    # Subida nueva: descartar sondeos de versión para que todo vea la versión nueva
+    _leer_versiones_tablas.clear()
+    _sondear_version_tabla.clear()
+    periodos = obtener_periodos_disponibles()
+    if not periodos:
+        return
+
+    periodo = fecha_nueva if fecha_nueva in periodos else periodos[0]
+    contratos = obtener_contratos_activos()
+
+    with estado['lock']:
+        estado.update({
+            'en_curso': True,
+            'periodo': periodo,
+            'total': len(contratos),
+            'completados': 0,
+            'errores': [],
+            'inicio': datetime.now(),
+            'fin': None,
+        })
+
+    with ThreadPoolExecutor(max_workers=PRECALENTADOR_HILOS, thread_name_prefix='precalentar') as ejecutor:
+        futuros = {ejecutor.submit(_precalentar_contrato, c, periodo): c for c in contratos}
+        for futuro in as_completed(futuros):
+            contrato = futuros[futuro]
+            with estado['lock']:
+                try:
+                    futuro.result()
+                except Exception as e:
+                    estado['errores'].append(f"{contrato}: {e}")
+                estado['completados'] += 1
+
+    with estado['lock']:
+        estado['en_curso'] = False
+        estado['fin'] = datetime.now()
+
+def _ciclo_precalentador(estado):
+    """Hilo de fondo: sondea fecha_datos y precalienta cuando aparece una nueva"""
+    while True:
+        forzado = estado['forzar'].wait(timeout=PRECALENTADOR_INTERVALO)
+        estado['forzar'].clear()
+        try:
+            fecha = obtener_ultima_fecha_datos()
+            with estado['lock']:
+                estado['ultimo_sondeo'] = datetime.now()
+                estado['error_sondeo'] = None
+                es_nueva = fecha is not None and fecha != estado['ultima_fecha']
+
+            if es_nueva or forzado:
+                precalentar_cache(estado, fecha)
+                with estado['lock']:
+                    estado['ultima_fecha'] = fecha
+        except Exception as e:
+            with estado['lock']:
+                estado['en_curso'] = False
+                estado['error_sondeo'] = str(e)
+
+@st.cache_resource
+def obtener_precalentador():
+    """Arranca (una vez por proceso) el hilo precalentador y devuelve su estado compartido"""
+    estado = {
+        'lock': threading.Lock(),
+        'forzar': threading.Event(),
+        'ultima_fecha': None,
+        'ultimo_sondeo': None,
+        'error_sondeo': None,
+        'en_curso': False,
+        'periodo': None,
+        'total': 0,
+        'completados': 0,
+        'errores': [],
+        'inicio': None,
+        'fin': None,
+    }
+    # Primer ciclo inmediato: el proceso recién levantado también está en frío
+    estado['forzar'].set()
+    hilo = threading.Thread(target=_ciclo_precalentador, args=(estado,), daemon=True, name='precalentador-cache')
+    hilo.start()
+    return estado
+
+@st.cache_resource
+def iniciar_api_lectura():
+    """
+    Levanta api_lectura.py en un hilo de este proceso si API_LECTURA_PUERTO
+    está definido; comparte cachés con la app (mismas funciones). Una vez por proceso.
+    """
+    puerto = os.getenv("API_LECTURA_PUERTO")
+    if not puerto:
+        return None
+    try:
+        import api_lectura
+        return api_lectura.iniciar_en_hilo(sys.modules[__name__], os.getenv("API_LECTURA_HOST", "0.0.0.0"), int(puerto))
+    except Exception as e:
+        print(f"⚠️ API de lectura no disponible: {e}")
+        return None
+
+# ============================================================================
+# CONCILIACIÓN DE PAGOS (app vs reportes_contratos / resumen_contratos)
+# ============================================================================
+
+TOLERANCIA_COINS = 1       # diferencia aceptada en coins por redondeo
+TOLERANCIA_PAYPAL = 0.01   # diferencia aceptada en PayPal (USD)
+
+# SIN_REGLA: la app no conoce la tabla del contrato (PAGO_DESCONOCIDO, incentivo
+# NaN) y no puede verificar el pago; no cuenta como diferencia
+ESTADOS_SIN_DIFERENCIA = ('OK', 'SIN_REGLA')
+
+def _numerico(df, columna):
+    """Columna numérica con 0 donde falta (o no existe)"""
+    if columna not in df.columns:
+        return pd.Series(0.0, index=df.index)
+    return pd.to_numeric(df[columna], errors='coerce').fillna(0.0)
+
+def _texto_clave(serie):
+    """Normaliza ids / usuarios para usarlos como llave de cruce"""
+    return serie.astype('string').str.strip().str.lower().fillna('')
+
+def _marco_calculado(datos_por_par):
+    """
+    Une los frames calculados por la app en uno solo (contrato, id, usuario, incentivos).
+    obtener_datos_contrato trae también el contrato equivalente: se conserva la
+    fila calculada con la config de su propio contrato.
+    """
+    partes = []
+    for (contrato, _), df in datos_por_par.items():
+        if df is None or df.empty:
+            continue
+        parte = pd.DataFrame({
+            'contrato': df['contrato'].astype(str).str.strip() if 'contrato' in df.columns else contrato,
+            'id_tiktok': df['id_tiktok'].astype(str).str.strip(),
+            'usuario': df['usuario'] if 'usuario' in df.columns else '',
+            'cumple': df['cumple'],
+            # NaN se conserva: es PAGO_DESCONOCIDO, no un incentivo de 0
+            'app_coins': pd.to_numeric(df['incentivo_coins'], errors='coerce') if 'incentivo_coins' in df.columns else 0.0,
+            'app_paypal': pd.to_numeric(df['incentivo_paypal'], errors='coerce') if 'incentivo_paypal' in df.columns else 0.0,
+        })
+        parte['_propio'] = parte['contrato'] == contrato
+        partes.append(parte)
+
+    if not partes:
+        return pd.DataFrame(columns=['contrato', 'id_tiktok', 'usuario', 'cumple', 'app_coins', 'app_paypal'])
+
+    calculado = pd.concat(partes, ignore_index=True)\
+        .sort_values('_propio', ascending=False, kind='stable')\
+        .drop_duplicates(['contrato', 'id_tiktok'])\
+        .drop(columns='_propio')
+    return calculado.reset_index(drop=True)
+
+def conciliar_filas(calculado, reportes):
+    """
+    Cruce vectorizado por usuario: primero por (contrato, usuario_id) y, para las
+    filas del reporte sin id que cruce, por (contrato, usuario).
+    Devuelve una fila por usuario con estado OK / DIFERENCIA / SOLO_APP / SOLO_REPORTE /
+    SIN_REGLA (incentivo de la app NaN: se conserva y no se compara).
+    """
+    app_df = calculado.copy()
+    app_df['_fila_app'] = np.arange(len(app_df))
+    app_df['_id'] = _texto_clave(app_df['id_tiktok'])
+    app_df['_usuario'] = _texto_clave(app_df['usuario'])
+
+    rep = pd.DataFrame({
+        'contrato': reportes['contrato'].astype(str).str.strip() if 'contrato' in reportes.columns else pd.Series(dtype=str),
+        'usuario_reporte': reportes['usuario'] if 'usuario' in reportes.columns else '',
+        'usuario_id': reportes['usuario_id'] if 'usuario_id' in reportes.columns else '',
+        'rep_coins': _numerico(reportes, 'coins_incentivo'),
+        'rep_paypal': _numerico(reportes, 'paypal_incentivo'),
+    })
+    rep['_fila_rep'] = np.arange(len(rep))
+    rep['_id'] = _texto_clave(rep['usuario_id'])
+    rep['_usuario'] = _texto_clave(rep['usuario_reporte'])
+
+    # Paso 1: por id
+    por_id = app_df[app_df['_id'] != ''].merge(
+        rep[rep['_id'] != ''], on=['contrato', '_id'], how='inner', suffixes=('', '_r')
+    )[['_fila_app', '_fila_rep']]
+
+    # Paso 2: por nombre de usuario, solo con lo que quedó suelto en ambos lados
+    app_libre = app_df[~app_df['_fila_app'].isin(por_id['_fila_app']) & (app_df['_usuario'] != '')]
+    rep_libre = rep[~rep['_fila_rep'].isin(por_id['_fila_rep']) & (rep['_usuario'] != '')]
+    por_usuario = app_libre.drop_duplicates(['contrato', '_usuario']).merge(
+        rep_libre.drop_duplicates(['contrato', '_usuario']), on=['contrato', '_usuario'], how='inner'
+    )[['_fila_app', '_fila_rep']]
+
+    cruces = pd.concat([por_id.assign(cruce='id'), por_usuario.assign(cruce='usuario')], ignore_index=True)
+    cruces = cruces.drop_duplicates('_fila_app').drop_duplicates('_fila_rep')
+
+    columnas_app = ['contrato', 'id_tiktok', 'usuario', 'cumple', 'app_coins', 'app_paypal']
+    columnas_rep = ['contrato', 'usuario_id', 'usuario_reporte', 'rep_coins', 'rep_paypal']
+
+    emparejadas = cruces\
+        .merge(app_df[['_fila_app'] + columnas_app], on='_fila_app')\
+        .merge(rep[['_fila_rep'] + columnas_rep[1:]], on='_fila_rep')
+    solo_app = app_df.loc[~app_df['_fila_app'].isin(cruces['_fila_app']), columnas_app].assign(cruce='', en_reporte=False)
+    solo_rep = rep.loc[~rep['_fila_rep'].isin(cruces['_fila_rep']), columnas_rep].assign(cruce='', en_app=False)
+
+    filas = pd.concat([emparejadas.drop(columns=['_fila_app', '_fila_rep']), solo_app, solo_rep], ignore_index=True)
+    filas['en_app'] = filas['en_app'].fillna(True).astype(bool)
+    filas['en_reporte'] = filas['en_reporte'].fillna(True).astype(bool)
+    for col in ('app_coins', 'app_paypal', 'rep_coins', 'rep_paypal'):
+        filas[col] = pd.to_numeric(filas[col], errors='coerce')
+    # Solo las filas sin app reciben 0 de la app; el NaN de PAGO_DESCONOCIDO queda
+    for col in ('app_coins', 'app_paypal'):
+        filas[col] = filas[col].where(filas['en_app'], 0.0)
+    for col in ('rep_coins', 'rep_paypal'):
+        filas[col] = filas[col].fillna(0.0)
+    sin_regla = filas['en_app'] & (filas['app_coins'].isna() | filas['app_paypal'].isna())
+
+    filas['dif_coins'] = filas['app_coins'] - filas['rep_coins']
+    filas['dif_paypal'] = (filas['app_paypal'] - filas['rep_paypal']).round(2)
+
+    fuera_tolerancia = (filas['dif_coins'].abs() > TOLERANCIA_COINS) | (filas['dif_paypal'].abs() > TOLERANCIA_PAYPAL)
+    # Sin fila en el reporte solo es problema si la app sí calcula incentivo
+    filas['estado'] = np.select(
+        [~filas['en_app'], sin_regla, ~filas['en_reporte'] & fuera_tolerancia, fuera_tolerancia],
+        ['SOLO_REPORTE', 'SIN_REGLA', 'SOLO_APP', 'DIFERENCIA'],
+        default='OK'
+    )
+    return filas[['contrato', 'id_tiktok', 'usuario', 'usuario_id', 'usuario_reporte', 'cumple',
+                  'app_coins', 'rep_coins', 'dif_coins', 'app_paypal', 'rep_paypal', 'dif_paypal',
+                  'cruce', 'en_app', 'en_reporte', 'estado']]
+
+def conciliar_totales(filas, resumen):
+    """
+    Totales por contrato: suma de la app y de reportes_contratos contra
+    total_coins / total_paypal / usuarios_validos de resumen_contratos.
+    Las filas SIN_REGLA quedan fuera de los totales de la app y de la
+    comparación app vs nota (su parte del reporte se descuenta de la nota).
+    """
+    sin_regla = filas['estado'].eq('SIN_REGLA')
+    por_contrato = filas.assign(
+        cumple_app=filas['cumple'].eq('SI').astype(int),
+        filas_reporte=filas['en_reporte'].astype(int),
+        sin_regla=sin_regla.astype(int),
+        rep_coins_sin_regla=filas['rep_coins'].where(sin_regla, 0.0),
+        rep_paypal_sin_regla=filas['rep_paypal'].where(sin_regla, 0.0),
+    ).groupby('contrato', as_index=False).agg(
+        app_coins=('app_coins', 'sum'),
+        app_paypal=('app_paypal', 'sum'),
+        rep_coins=('rep_coins', 'sum'),
+        rep_paypal=('rep_paypal', 'sum'),
+        rep_coins_sin_regla=('rep_coins_sin_regla', 'sum'),
+        rep_paypal_sin_regla=('rep_paypal_sin_regla', 'sum'),
+        app_cumplen=('cumple_app', 'sum'),
+        filas_reporte=('filas_reporte', 'sum'),
+        sin_regla=('sin_regla', 'sum'),
+        diferencias=('estado', lambda s: int((~s.isin(ESTADOS_SIN_DIFERENCIA)).sum())),
+    )
+
+    res = pd.DataFrame({
+        'contrato': resumen['contrato'].astype(str).str.strip() if 'contrato' in resumen.columns else pd.Series(dtype=str),
+        'res_coins': _numerico(resumen, 'total_coins'),
+        'res_paypal': _numerico(resumen, 'total_paypal'),
+        'res_usuarios': _numerico(resumen, 'usuarios_validos'),
+    })
+    totales = por_contrato.merge(res, on='contrato', how='outer', indicator=True)
+    for col in ('app_coins', 'app_paypal', 'rep_coins', 'rep_paypal', 'rep_coins_sin_regla', 'rep_paypal_sin_regla',
+                'app_cumplen', 'filas_reporte', 'sin_regla', 'diferencias'):
+        totales[col] = totales[col].fillna(0)
+
+    sin_resumen = totales['_merge'] == 'left_only'
+    totales['dif_coins_app'] = (totales['app_coins'] - (totales['res_coins'] - totales['rep_coins_sin_regla']))\
+        .where(~sin_resumen)
+    totales['dif_paypal_app'] = (totales['app_paypal'] - (totales['res_paypal'] - totales['rep_paypal_sin_regla']))\
+        .round(2).where(~sin_resumen)
+    totales['dif_coins_reporte'] = (totales['rep_coins'] - totales['res_coins']).where(~sin_resumen)
+    totales['dif_paypal_reporte'] = (totales['rep_paypal'] - totales['res_paypal']).round(2).where(~sin_resumen)
+    totales['dif_usuarios'] = (totales['app_cumplen'] - totales['res_usuarios']).where(~sin_resumen)
+
+    descuadre = (
+        (totales[['dif_coins_app', 'dif_coins_reporte']].abs() > TOLERANCIA_COINS).any(axis=1)
+        | (totales[['dif_paypal_app', 'dif_paypal_reporte']].abs() > TOLERANCIA_PAYPAL).any(axis=1)
+        | totales['dif_usuarios'].fillna(0).ne(0)
+        | totales['diferencias'].gt(0)
+    )
+    totales['estado'] = np.select(
+        [sin_resumen & totales['filas_reporte'].gt(0), sin_resumen, descuadre, totales['sin_regla'].gt(0)],
+        ['SIN_RESUMEN', 'SIN_NOTA', 'DIFERENCIA', 'SIN_REGLA'],
+        default='OK'
+    )
+    return totales.drop(columns=['_merge', 'rep_coins_sin_regla', 'rep_paypal_sin_regla']).sort_values(['estado', 'contrato']).reset_index(drop=True)
+
+def conciliar_periodo(periodo, contratos=None):
+    """
+    Concilia todos los contratos de un periodo. Devuelve {'filas', 'contratos'}:
+    detalle por usuario y totales por contrato con su estado.
+    """
+    with prioridad_supabase(PRIORIDAD_EXPORTACION):
+        return _cargar_conciliacion(
+            periodo,
+            tuple(sorted(contratos)) if contratos else None,
+            obtener_version_datos(*TABLAS_DATOS_CONTRATO, 'resumen_contratos')
+        )
+
+@cache_acotada('conciliacion', max_entradas=12, max_mb=128)
+def _cargar_conciliacion(periodo, contratos, version):
+    """Lectura en bloque (reportes + resumen del periodo) y cruce vectorizado"""
+    supabase = get_supabase()
+
+    reportes = pd.DataFrame(leer_paginado(lambda: supabase.table('reportes_contratos')
+                                          .select('contrato, usuario, usuario_id, coins_incentivo, paypal_incentivo')
+                                          .eq('periodo', periodo)
+                                          .order('contrato')
+                                          .order('id')))
+    resumen = pd.DataFrame(supabase.table('resumen_contratos')
+                           .select('contrato, total_coins, total_paypal, total_final, usuarios_validos')
+                           .eq('periodo', periodo)
+                           .execute().data or [])
+
+    if contratos is None:
+        filtrar = False
+        en_periodo = set()
+        for df in (reportes, resumen):
+            if 'contrato' in df.columns:
+                en_periodo.update(df['contrato'].dropna().astype(str).str.strip())
+        contratos = sorted(en_periodo | set(obtener_contratos_activos()))
+    else:
+        filtrar = True
+        reportes = reportes[reportes['contrato'].astype(str).str.strip().isin(contratos)] if not reportes.empty else reportes
+        resumen = resumen[resumen['contrato'].astype(str).str.strip().isin(contratos)] if not resumen.empty else resumen
+
+    # Los equivalentes (A↔B) llegan junto a su contrato y también se concilian
+    calculado = _marco_calculado(obtener_datos_contratos([(c, periodo) for c in contratos]))
+    if filtrar:
+        calculado = calculado[calculado['contrato'].isin(contratos)]
+
+    filas = conciliar_filas(calculado, reportes)
+    totales = conciliar_totales(filas, resumen)
+    return {'filas': filas, 'contratos': totales}
+
+# ============================================================================
+# ALMACÉN ANALÍTICO (copia DuckDB local del historial, ver almacen_analitico.py)
+# ============================================================================
+
+ALMACEN_MESES = [3, 6, 12, 24]
+
+@st.cache_resource
+def obtener_almacen():
+    """
+    Almacén DuckDB del proceso + estado de su sincronización en segundo plano.
+    'almacen' es None si duckdb no está instalado o el archivo no abre.
+    """
+    estado = {'lock': threading.Lock(), 'almacen': None, 'error': None,
+              'en_curso': False, 'ultima': None, 'resultados': []}
+    try:
+        import almacen_analitico
+        if almacen_analitico.disponible():
+            estado['almacen'] = almacen_analitico.AlmacenAnalitico()
+        else:
+            estado['error'] = "duckdb no está instalado (pip install duckdb)"
+    except Exception as e:
+        estado['error'] = str(e)
+    return estado
+
+def _sincronizar_almacen(estado, completo):
+    """Hilo de sincronización (carril de fondo: cede el paso a cargas de página)"""
+    try:
+        with prioridad_supabase(PRIORIDAD_FONDO):
+            resultados = estado['almacen'].sincronizar(sys.modules[__name__], completo=completo)
+    except Exception as e:
+        resultados = [{'tabla': '—', 'estado': 'error', 'error': str(e)}]
+    with estado['lock']:
+        estado['en_curso'] = False
+        estado['ultima'] = datetime.now()
+        estado['resultados'] = resultados
+
+def sincronizar_almacen_en_fondo(completo=False):
+    """Lanza una sincronización incremental si no hay otra en curso (True si se lanzó)"""
+    estado = obtener_almacen()
+    if estado['almacen'] is None:
+        return False
+    with estado['lock']:
+        if estado['en_curso']:
+            return False
+        estado['en_curso'] = True
+    threading.Thread(target=_sincronizar_almacen, args=(estado, completo),
+                     daemon=True, name='almacen-sync').start()
+    return True
+
+# ============================================================================
+# PROYECCIÓN DE PROGRESO (faltantes al siguiente nivel / tramo y cierre de mes)
+# ============================================================================
+
+def calcular_progreso(df, df_incentivos, periodo, df_previo=None, fecha_previa=None, motor=None):
+    """
+    Progreso de todos los jugadores de un corte, en una sola pasada vectorizada:
+    - faltan_dias / faltan_horas al siguiente nivel
+    - faltan_diamantes al siguiente tramo de incentivos_horizontales
+    - proyección a fin de mes con el ritmo entre cortes (o desde el día 1)
+    - avance_proximo_pago (0-1): qué tan cerca está el siguiente pago
+    Mínimos y forma de pago de cada fila salen del MotorReglas del periodo.
+    """
+    n = len(df)
+    resultado = pd.DataFrame(index=df.index)
+    if n == 0:
+        return resultado
+
+    dias = _numerico(df, 'dias').to_numpy(dtype=float)
+    horas = _numerico(df, 'horas').to_numpy(dtype=float)
+    diamantes = _numerico(df, 'diamantes').to_numpy(dtype=float)
+
+    reglas = (motor or MotorReglas()).resolver(df)
+    dias_req, horas_req = reglas.dias, reglas.horas
+    # Sin regalo / tabla desconocida: sin progreso que mostrar; % de diamantes: sin tramos
+    sin_regla = np.isin(reglas.pago, (PAGO_SIN_REGALO, PAGO_DESCONOCIDO))
+    sin_tramos = reglas.pago == PAGO_PORCENTAJE
+    filas = np.arange(n)
+
+    # --- Siguiente nivel
+    nivel = _nivel_por_minimos(dias, horas, dias_req, horas_req)
+    hay_siguiente = (nivel < 3) & ~sin_regla
+    idx = np.minimum(nivel, 2)
+    dias_sig = dias_req[filas, idx]
+    horas_sig = horas_req[filas, idx]
+    faltan_dias = np.where(hay_siguiente, np.maximum(dias_sig - dias, 0), np.nan)
+    faltan_horas = np.where(hay_siguiente, np.maximum(horas_sig - horas, 0), np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avance_nivel = np.where(
+            hay_siguiente,
+            np.clip(np.minimum(dias / dias_sig, horas / horas_sig), 0, 1),
+            np.nan
+        )
+
+    # --- Siguiente tramo de diamantes
+    if not df_incentivos.empty and 'acumulado' in df_incentivos.columns:
+        acumulado = pd.to_numeric(df_incentivos['acumulado'], errors='coerce').dropna().to_numpy(dtype=float)
+    else:
+        acumulado = np.array([], dtype=float)
+    tramo = np.searchsorted(acumulado, diamantes, side='right')  # tramos alcanzados
+    hay_tramo = (tramo < len(acumulado)) & ~sin_tramos & ~sin_regla
+    if len(acumulado):
+        siguiente_tramo = np.where(hay_tramo, acumulado[np.minimum(tramo, len(acumulado) - 1)], np.nan)
+    else:
+        siguiente_tramo = np.full(n, np.nan)
+    faltan_diamantes = np.where(hay_tramo, siguiente_tramo - diamantes, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avance_tramo = np.where(hay_tramo, np.clip(diamantes / siguiente_tramo, 0, 1), np.nan)
+
+    # Sin nivel: cobrar exige nivel 1 y (con tabla) el primer tramo -> manda el más lejano.
+    # Con nivel: cualquiera de los dos pasos sube el pago -> manda el más cercano.
+    # Con nivel1_tabla3 subir de nivel no cambia el pago: solo cuenta el tramo.
+    avance_con_nivel = np.where(reglas.tabla3, avance_tramo, np.fmax(avance_nivel, avance_tramo))
+    avance_sin_nivel = np.where(tramo == 0, np.fmin(avance_nivel, avance_tramo), avance_nivel)
+    avance = np.where(nivel == 0, avance_sin_nivel, avance_con_nivel)
+    avance = np.where(sin_regla, np.nan, avance)
+
+    # --- Proyección a fin de mes
+    fecha = pd.Timestamp(periodo)
+    dias_mes = calendar.monthrange(fecha.year, fecha.month)[1]
+    restantes = dias_mes - fecha.day
+
+    ritmo_dias = dias / fecha.day
+    ritmo_horas = horas / fecha.day
+    ritmo_diamantes = diamantes / fecha.day
+
+    if df_previo is not None and not df_previo.empty and fecha_previa is not None and 'id_tiktok' in df.columns:
+        intervalo = (fecha - pd.Timestamp(fecha_previa)).days
+        if intervalo > 0:
+            previo = df_previo.assign(id_tiktok=df_previo['id_tiktok'].astype(str))\
+                .drop_duplicates('id_tiktok').set_index('id_tiktok')
+            ids = df['id_tiktok'].astype(str)
+            for actual, columna, ritmo in ((dias, 'dias', ritmo_dias), (horas, 'horas', ritmo_horas),
+                                           (diamantes, 'diamantes', ritmo_diamantes)):
+                if columna not in previo.columns:
+                    continue
+                antes = pd.to_numeric(ids.map(previo[columna]), errors='coerce').to_numpy(dtype=float)
+                tiene = ~np.isnan(antes) & (antes <= actual)
+                ritmo[tiene] = (actual[tiene] - antes[tiene]) / intervalo
+
+    proy_dias = np.minimum(dias + np.minimum(ritmo_dias, 1) * restantes, dias_mes)
+    proy_horas = horas + ritmo_horas * restantes
+    proy_diamantes = diamantes + ritmo_diamantes * restantes
+    proy_nivel = _nivel_por_minimos(proy_dias, proy_horas, dias_req, horas_req)
+    proy_coins, proy_paypal, _ = MotorReglas.pagar(reglas, df_incentivos, proy_diamantes, proy_nivel)
+
+    resultado['nivel_siguiente'] = np.where(hay_siguiente, nivel + 1, np.nan)
+    resultado['faltan_dias'] = faltan_dias
+    resultado['faltan_horas'] = np.round(faltan_horas, 1)
+    resultado['faltan_diamantes'] = faltan_diamantes
+    resultado['avance_proximo_pago'] = np.round(avance, 3)
+    resultado['proy_dias'] = np.round(proy_dias)
+    resultado['proy_horas'] = np.round(proy_horas, 1)
+    resultado['proy_diamantes'] = np.round(proy_diamantes)
+    resultado['proy_nivel'] = proy_nivel
+    resultado['proy_incentivo_coins'] = proy_coins
+    resultado['proy_incentivo_paypal'] = proy_paypal
+    return resultado
+
+def obtener_corte_previo(contrato, periodo):
+    """Corte anterior del mismo mes para el contrato (None si es el primero)"""
+    inicio_mes = str(periodo)[:8] + '01'
+    supabase = get_supabase()
+    resultado = supabase.table('usuarios_tiktok')\
+        .select('fecha_datos')\
+        .eq('contrato', contrato)\
+        .gte('fecha_datos', inicio_mes)\
+        .lt('fecha_datos', str(periodo))\
+        .order('fecha_datos', desc=True)\
+        .limit(1)\
+        .execute()
+    if resultado.data:
+        return resultado.data[0].get('fecha_datos')
+    return None
+
+def obtener_progreso_contrato(contrato, periodo):
+    """
+    Frame del contrato con las columnas de progreso y proyección agregadas.
+    Se recalcula solo cuando cambia la versión de los datos.
+    """
+    return _cargar_progreso_contrato(
+        contrato, periodo,
+        obtener_version_datos(*TABLAS_DATOS_CONTRATO)
+    )
+
+@cache_acotada('progreso', max_entradas=100, max_mb=256)
+def _cargar_progreso_contrato(contrato, periodo, version):
+    """Carga el corte actual y el anterior del mes y corre calcular_progreso"""
+    df = obtener_datos_contrato(contrato, periodo)
+    if df.empty:
+        return df
+
+    fecha_previa = obtener_corte_previo(contrato, periodo)
+    df_previo = obtener_datos_contrato(contrato, fecha_previa) if fecha_previa else None
+
+    progreso = calcular_progreso(
+        df, obtener_incentivos(), periodo,
+        df_previo=df_previo,
+        fecha_previa=fecha_previa,
+        motor=obtener_motor_reglas(periodo),
+    )
+    return pd.concat([df, progreso], axis=1)
+
+# ============================================================================
+# CAMBIOS ENTRE CORTES (8, 15, 22, 25... del mismo contrato)
+# ============================================================================
+
+COLUMNAS_CAMBIOS = ['dias', 'horas', 'diamantes', 'nivel']
+
+def obtener_cortes_contrato(contrato):
+    """
+    Todas las fechas_datos del contrato (más reciente primero), incluidas las
+    intermedias que filtrar_fechas_inteligente oculta en el selector.
+    """
+    return _cargar_cortes_contrato(contrato, obtener_version_tabla('usuarios_tiktok'))
+
+@cache_acotada('cortes', max_entradas=200, max_mb=2)
+def _cargar_cortes_contrato(contrato, version):
+    """RPC obtener_fechas_disponibles(p_contrato) o lectura paginada de fecha_datos"""
+    supabase = get_supabase()
+    try:
+        resultado = supabase.rpc('obtener_fechas_disponibles', {'p_contrato': contrato}).execute()
+        if resultado.data:
+            return sorted({str(r['fecha_datos']) for r in resultado.data}, reverse=True)
+    except Exception:
+        pass  # RPC sin aplicar (migraciones/): lectura paginada
+
+    filas = leer_paginado(lambda: supabase.table('usuarios_tiktok')
+                          .select('fecha_datos')
+                          .eq('contrato', contrato)
+                          .order('fecha_datos', desc=True))
+    return sorted({str(r['fecha_datos']) for r in filas if r.get('fecha_datos')}, reverse=True)
+
+def corte_anterior(cortes, periodo):
+    """Corte inmediatamente anterior a `periodo` en la lista (None si no hay)"""
+    previos = [c for c in cortes if c < str(periodo)]
+    return max(previos) if previos else None
+
+def comparar_cortes(df_antes, df_despues):
+    """
+    Un merge vectorizado por id_tiktok entre dos cortes: valores antes / después
+    y delta de días, horas, diamantes y nivel, estado del jugador (sigue, nuevo,
+    salió) y cruce de umbral de nivel (+1 subió, -1 bajó, 0 igual).
+    """
+    def preparar(df):
+        base = pd.DataFrame({'id_tiktok': _texto_clave(df['id_tiktok']).to_numpy(),
+                             'usuario': df['usuario'].to_numpy() if 'usuario' in df.columns else ''})
+        for columna in COLUMNAS_CAMBIOS:
+            base[columna] = _numerico(df, columna).to_numpy(dtype=float)
+        return base[base['id_tiktok'] != ''].drop_duplicates('id_tiktok', keep='last')
+
+    cambios = preparar(df_antes).merge(
+        preparar(df_despues), on='id_tiktok', how='outer', suffixes=('_antes', '_despues'), indicator=True
+    )
+
+    cambios['usuario'] = cambios['usuario_despues'].fillna(cambios['usuario_antes'])
+    cambios['estado'] = cambios['_merge'].map({'both': 'sigue', 'right_only': 'nuevo', 'left_only': 'salió'}).astype(str)
+
+    for columna in COLUMNAS_CAMBIOS:
+        antes = cambios[f'{columna}_antes'].fillna(0.0).to_numpy()
+        despues = cambios[f'{columna}_despues'].fillna(0.0).to_numpy()
+        cambios[f'delta_{columna}'] = np.round(despues - antes, 2)
+
+    cambios['cruce_nivel'] = np.sign(cambios['delta_nivel'].to_numpy()).astype(int)
+    return cambios.drop(columns=['_merge', 'usuario_antes', 'usuario_despues']).reset_index(drop=True)
+
+def obtener_cambios_contrato(contrato, antes, despues):
+    """Diferencias entre dos cortes del contrato (caché por versión de datos)"""
+    return _cargar_cambios_contrato(contrato, str(antes), str(despues), obtener_version_datos(*TABLAS_DATOS_CONTRATO))
+
+@cache_acotada('cambios', max_entradas=100, max_mb=64)
+def _cargar_cambios_contrato(contrato, antes, despues, version):
+    """Ambos cortes salen de la caché de contratos (solo se piden los que falten)"""
+    datos = obtener_datos_contratos([(contrato, antes), (contrato, despues)])
+    return comparar_cortes(datos[(contrato, antes)], datos[(contrato, despues)])
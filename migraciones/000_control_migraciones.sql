@@ -0,0 +1,29 @@
+-- ============================================================================
+-- 000_control_migraciones.sql
+-- Registro de migraciones aplicadas. La app lo lee al arrancar para avisar
+-- de migraciones pendientes (ver verificar_rutas_rapidas en app.py).
+-- ============================================================================
+
+begin;
+
+create table if not exists migraciones_aplicadas (
+    version   text primary key,
+    aplicada  timestamptz not null default now()
+);
+
+-- Solo lectura para los roles de PostgREST (si existen: en Postgres local no)
+do $$
+declare
+    rol text;
+begin
+    foreach rol in array array['anon', 'authenticated', 'service_role'] loop
+        if exists (select 1 from pg_roles where rolname = rol) then
+            execute format('grant select on migraciones_aplicadas to %I', rol);
+        end if;
+    end loop;
+end $$;
+
+insert into migraciones_aplicadas (version) values ('000_control_migraciones')
+on conflict (version) do nothing;
+
+commit;
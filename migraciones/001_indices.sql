@@ -0,0 +1,39 @@
+-- ============================================================================
+-- 001_indices.sql
+-- Índices compuestos para las consultas calientes de la app:
+--   usuarios_tiktok     contrato + fecha_datos   (tabla de un contrato en un corte)
+--                       fecha_datos               (periodos globales y sondeo de versión)
+--                       id_tiktok + fecha_datos   (historial de un jugador)
+--   reportes_contratos  contrato + periodo        (pagos reales del corte)
+--   historico_usuarios  id_tiktok + visto_ultima_vez desc (último username conocido)
+--
+-- En tablas grandes en producción conviene crearlos a mano con
+-- CREATE INDEX CONCURRENTLY (no admite transacción) y luego correr este
+-- archivo, que ya no hará nada.
+-- ============================================================================
+
+begin;
+
+create index if not exists usuarios_tiktok_contrato_fecha_idx
+    on usuarios_tiktok (contrato, fecha_datos);
+
+create index if not exists usuarios_tiktok_fecha_idx
+    on usuarios_tiktok (fecha_datos);
+
+create index if not exists usuarios_tiktok_id_fecha_idx
+    on usuarios_tiktok (id_tiktok, fecha_datos);
+
+create index if not exists reportes_contratos_contrato_periodo_idx
+    on reportes_contratos (contrato, periodo);
+
+create index if not exists historico_usuarios_id_visto_idx
+    on historico_usuarios (id_tiktok, visto_ultima_vez desc);
+
+analyze usuarios_tiktok;
+analyze reportes_contratos;
+analyze historico_usuarios;
+
+insert into migraciones_aplicadas (version) values ('001_indices')
+on conflict (version) do nothing;
+
+commit;
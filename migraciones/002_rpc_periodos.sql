@@ -0,0 +1,73 @@
+-- ============================================================================
+-- 002_rpc_periodos.sql
+-- obtener_fechas_disponibles(p_contrato): fechas_datos distintas de
+-- usuarios_tiktok, globales (sin argumento) o de un contrato.
+--
+-- Recorre el índice saltando de fecha en fecha (CTE recursiva), así que
+-- cuesta una búsqueda por corte en vez de leer toda la tabla. Es la ruta
+-- rápida de obtener_periodos_disponibles; sin ella la app recorre la tabla
+-- en páginas de 1.000 filas ordenadas por fecha (al menos un corte por página).
+-- ============================================================================
+
+begin;
+
+-- Versiones creadas a mano sin parámetro: con el nuevo default serían ambiguas
+drop function if exists obtener_fechas_disponibles();
+
+create or replace function obtener_fechas_disponibles(p_contrato text default null)
+returns table (fecha_datos date)
+language plpgsql
+stable
+as $$
+begin
+    -- Dos ramas separadas: cada una con su índice (fecha_datos / contrato + fecha_datos)
+    if p_contrato is null then
+        return query
+        with recursive fechas(f) as (
+            (select u.fecha_datos from usuarios_tiktok u
+              where u.fecha_datos is not null
+              order by u.fecha_datos desc limit 1)
+            union all
+            select (select u.fecha_datos from usuarios_tiktok u
+                     where u.fecha_datos < fechas.f
+                     order by u.fecha_datos desc limit 1)
+              from fechas
+             where fechas.f is not null
+        )
+        select fechas.f from fechas where fechas.f is not null;
+    else
+        return query
+        with recursive fechas(f) as (
+            (select u.fecha_datos from usuarios_tiktok u
+              where u.contrato = p_contrato and u.fecha_datos is not null
+              order by u.fecha_datos desc limit 1)
+            union all
+            select (select u.fecha_datos from usuarios_tiktok u
+                     where u.contrato = p_contrato and u.fecha_datos < fechas.f
+                     order by u.fecha_datos desc limit 1)
+              from fechas
+             where fechas.f is not null
+        )
+        select fechas.f from fechas where fechas.f is not null;
+    end if;
+end;
+$$;
+
+comment on function obtener_fechas_disponibles(text) is
+    'Fechas de corte distintas de usuarios_tiktok (más reciente primero), globales o de un contrato';
+
+do $$
+declare
+    rol text;
+begin
+    foreach rol in array array['anon', 'authenticated', 'service_role'] loop
+        if exists (select 1 from pg_roles where rolname = rol) then
+            execute format('grant execute on function obtener_fechas_disponibles(text) to %I', rol);
+        end if;
+    end loop;
+end $$;
+
+insert into migraciones_aplicadas (version) values ('002_rpc_periodos')
+on conflict (version) do nothing;
+
+commit;
@@ -0,0 +1,55 @@
+-- ============================================================================
+-- 003_rpc_resumen.sql
+-- resumen_metricas_periodo(p_fecha_datos, p_contratos): totales por contrato
+-- de un corte calculados en la base (una fila por contrato en vez de todas
+-- las filas de jugadores). Lo usa el Dashboard del panel admin.
+--
+-- "cumple" no se agrega aquí: depende de la lógica de niveles de la app.
+-- ============================================================================
+
+begin;
+
+create or replace function resumen_metricas_periodo(
+    p_fecha_datos date,
+    p_contratos text[] default null
+)
+returns table (
+    contrato       text,
+    jugadores      bigint,
+    con_actividad  bigint,
+    diamantes      numeric,
+    dias_promedio  numeric
+)
+language sql
+stable
+as $$
+    select u.contrato::text,
+           count(*)                                             as jugadores,
+           count(*) filter (where coalesce(u.dias::numeric, 0) > 0) as con_actividad,
+           coalesce(sum(u.diamantes::numeric), 0)               as diamantes,
+           round(coalesce(avg(u.dias::numeric), 0), 1)          as dias_promedio
+      from usuarios_tiktok u
+     where u.fecha_datos = p_fecha_datos
+       and (p_contratos is null or u.contrato = any (p_contratos))
+     group by u.contrato
+     order by u.contrato;
+$$;
+
+comment on function resumen_metricas_periodo(date, text[]) is
+    'Jugadores, jugadores con actividad, diamantes y días promedio por contrato en un corte';
+
+do $$
+declare
+    rol text;
+begin
+    foreach rol in array array['authenticated', 'service_role'] loop
+        if exists (select 1 from pg_roles where rolname = rol) then
+            execute format('grant execute on function resumen_metricas_periodo(date, text[]) to %I', rol);
+        end if;
+    end loop;
+end $$;
+
+insert into migraciones_aplicadas (version) values ('003_rpc_resumen')
+on conflict (version) do nothing;
+
+commit;
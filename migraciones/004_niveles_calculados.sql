@@ -0,0 +1,31 @@
+-- ============================================================================
+-- 004_niveles_calculados.sql
+-- Tabla destino de backfill_niveles.py (upsert por contrato + fecha_datos +
+-- id_tiktok). La clave primaria es la que usa on_conflict.
+-- ============================================================================
+
+begin;
+
+create table if not exists niveles_calculados (
+    contrato          text    not null,
+    fecha_datos       date    not null,
+    id_tiktok         text    not null,
+    dias              integer,
+    horas             numeric,
+    diamantes         bigint,
+    nivel_original    integer,
+    nivel             integer,
+    cumple            text,
+    incentivo_coins   numeric,
+    incentivo_paypal  numeric,
+    calculado         timestamptz not null default now(),
+    primary key (contrato, fecha_datos, id_tiktok)
+);
+
+create index if not exists niveles_calculados_id_fecha_idx
+    on niveles_calculados (id_tiktok, fecha_datos);
+
+insert into migraciones_aplicadas (version) values ('004_niveles_calculados')
+on conflict (version) do nothing;
+
+commit;
@@ -0,0 +1,78 @@
+-- ============================================================================
+-- 005_version_tablas.sql
+-- Contador de versión por tabla, mantenido por triggers de sentencia en cada
+-- INSERT / UPDATE / DELETE / TRUNCATE. Es la marca que sondea la app cada
+-- 30 s (obtener_version_tabla): una fila por tabla en vez de un count(*)
+-- exacto, y ve los UPDATE en sitio que conteo + fecha máxima no ven.
+-- ============================================================================
+
+begin;
+
+create table if not exists version_tablas (
+    tabla        text primary key,
+    version      bigint not null default 1,
+    actualizada  timestamptz not null default now()
+);
+
+-- security definer: quien sube datos no necesita permiso de escritura sobre
+-- version_tablas; el search_path queda fijado al del esquema de la migración
+create or replace function marcar_version_tabla()
+returns trigger
+language plpgsql
+security definer
+set search_path from current
+as $$
+begin
+    insert into version_tablas as v (tabla) values (tg_table_name)
+    on conflict (tabla) do update set version = v.version + 1, actualizada = now();
+    return null;
+end;
+$$;
+
+create or replace function obtener_versiones_tablas(p_tablas text[] default null)
+returns table (tabla text, version bigint)
+language sql
+stable
+as $$
+    select v.tabla, v.version from version_tablas v
+     where p_tablas is null or v.tabla = any(p_tablas);
+$$;
+
+comment on function obtener_versiones_tablas(text[]) is
+    'Versión (contador de cambios) de las tablas pedidas, o de todas sin argumento';
+
+-- Tablas de las que depende la caché de la app (TABLAS_DATOS_CONTRATO y otras
+-- sondeadas); las que no existan en esta base se saltan
+do $$
+declare
+    t text;
+begin
+    foreach t in array array['usuarios_tiktok', 'reportes_contratos', 'resumen_contratos',
+                             'historico_usuarios', 'contratos', 'contratos_equivalencias', 'jerarquia_contratos',
+                             'incentivos_horizontales', 'incentivos_custom_vertex',
+                             'excepciones_calculo_jugador', 'config_columnas_ocultas'] loop
+        if to_regclass(t) is not null then
+            execute format('drop trigger if exists version_tabla on %I', t);
+            execute format('create trigger version_tabla after insert or update or delete or truncate '
+                           'on %I for each statement execute function marcar_version_tabla()', t);
+            insert into version_tablas (tabla) values (t) on conflict (tabla) do nothing;
+        end if;
+    end loop;
+end $$;
+
+do $$
+declare
+    rol text;
+begin
+    foreach rol in array array['anon', 'authenticated', 'service_role'] loop
+        if exists (select 1 from pg_roles where rolname = rol) then
+            execute format('grant select on version_tablas to %I', rol);
+            execute format('grant execute on function obtener_versiones_tablas(text[]) to %I', rol);
+        end if;
+    end loop;
+end $$;
+
+insert into migraciones_aplicadas (version) values ('005_version_tablas')
+on conflict (version) do nothing;
+
+commit;
@@ -0,0 +1,205 @@
+# ============================================================================
+# pages/2_🎯_Mi_Progreso.py
+# Progreso individual del jugador (token de tokens_jugadores), equivalente a
+# mi-progreso.html: historial por mes, nivel, regalos y gráfica de diamantes
+# ============================================================================
+
+import streamlit as st
+import pandas as pd
+import plotly.graph_objects as go
+
+# Capa de datos compartida con la app principal: misma instancia del módulo
+# (planificador y cachés), no una segunda copia de capa_datos.py
+import capa_datos
+
+# ============================================================================
+# CONFIGURACIÓN
+# ============================================================================
+
+st.set_page_config(
+    page_title="Mi Progreso",
+    page_icon="🎯",
+    layout="wide"
+)
+
+st.markdown("""
+<style>
+    .stApp {
+        background-color: #0a0a0a;
+        color: #F5F5F5;
+    }
+
+    .info-card {
+        background: linear-gradient(135deg, #2C3E50 0%, #34495E 100%);
+        padding: 15px;
+        border-radius: 10px;
+        margin: 10px 0;
+        border-left: 4px solid #fe2c55;
+    }
+</style>
+""", unsafe_allow_html=True)
+
+# ============================================================================
+# DATOS
+# ============================================================================
+
+def calcular_historial(historial):
+    """
+    Nivel, cumple e incentivo por corte con la lógica de la app: cada corte con
+    el motor de reglas de su periodo (tipo_logica, Vertex, excepciones vigentes).
+    Conserva el orden cronológico.
+    """
+    df_incentivos = capa_datos.obtener_incentivos()
+    partes = []
+    for fecha, grupo in historial.groupby(historial['fecha_datos'].astype(str), sort=False):
+        partes.append(capa_datos.calcular_niveles_contrato(grupo.copy(), df_incentivos, capa_datos.obtener_motor_reglas(fecha)))
+    return pd.concat(partes).sort_values('fecha_datos', kind='stable')
+
+def cargar_progreso(id_tiktok):
+    """
+    Historial del jugador (una consulta paginada y proyectada + un solo `in_`
+    a reportes_contratos, caché por id_tiktok) filtrado a un corte por mes.
+    """
+    historial = capa_datos.obtener_historial_jugador(id_tiktok)
+    if historial.empty:
+        return historial
+
+    fechas = capa_datos.filtrar_fechas_inteligente(historial['fecha_datos'].astype(str).unique().tolist())
+    historial = historial[historial['fecha_datos'].astype(str).isin(fechas)]
+    return calcular_historial(historial)
+
+def _regalo(fila):
+    """Texto del regalo del mes: pago real de reportes si existe, si no el calculado"""
+    coins = fila.get('coins_incentivo')
+    paypal = fila.get('paypal_incentivo')
+    if pd.isna(coins) and pd.isna(paypal):
+        coins, paypal = fila.get('incentivo_coins', 0), fila.get('incentivo_paypal', 0)
+
+    partes = []
+    if pd.notna(coins) and float(coins) > 0:
+        partes.append(f"{float(coins):,.0f} coins")
+    if pd.notna(paypal) and float(paypal) > 0:
+        partes.append(f"${float(paypal):,.2f}")
+    return " + ".join(partes) if partes else "—"
+
+# ============================================================================
+# INTERFAZ PRINCIPAL
+# ============================================================================
+
+def main():
+    # Token individual por URL (?token=) o escrito a mano
+    token = st.query_params.get("token", None)
+
+    if not token:
+        st.title("🎯 Mi Progreso")
+        token_input = st.text_input("🔑 Tu token personal", type="password", key="token_mi_progreso")
+        if st.button("Entrar", key="btn_mi_progreso"):
+            if token_input.strip():
+                st.query_params["token"] = token_input.strip()
+                st.rerun()
+        st.stop()
+
+    token_data = capa_datos.verificar_token_jugador(token)
+
+    if not token_data:
+        st.error("❌ Token inválido o inactivo.")
+        if st.button("← Volver"):
+            st.query_params.clear()
+            st.rerun()
+        st.stop()
+
+    id_tiktok = token_data['id_tiktok']
+
+    with st.spinner('📄 Cargando tu historial...'):
+        try:
+            df = cargar_progreso(id_tiktok)
+        except Exception as e:
+            st.error(f"❌ No se pudo cargar tu historial: {e}")
+            st.stop()
+
+    if df.empty:
+        st.info("ℹ️ Todavía no hay datos de tu cuenta.")
+        st.stop()
+
+    ultimo = df.iloc[-1]
+    con_incorporacion = df['fecha_incorporacion'].dropna() if 'fecha_incorporacion' in df.columns else pd.Series(dtype=object)
+
+    # Header
+    col1, col2 = st.columns([1, 4])
+
+    with col1:
+        st.image("https://img.icons8.com/color/96/000000/tiktok--v1.png", width=80)
+
+    with col2:
+        st.title(f"🎯 @{ultimo.get('usuario', '')}")
+        caption = f"{ultimo.get('contrato', '')} · Agente: {ultimo.get('agente') or '—'}"
+        if not con_incorporacion.empty:
+            caption += f" · Desde {capa_datos.formatear_fecha_español(str(con_incorporacion.iloc[0]))}"
+        st.caption(caption)
+
+    st.divider()
+
+    # Último corte
+    st.markdown(f"### 📆 {capa_datos.obtener_mes_español(str(ultimo['fecha_datos']))} "
+                f"(corte {capa_datos.formatear_fecha_español(str(ultimo['fecha_datos']))})")
+
+    col1, col2, col3, col4 = st.columns(4)
+
+    with col1:
+        st.metric("📅 Días", int(pd.to_numeric(ultimo.get('dias'), errors='coerce') or 0))
+
+    with col2:
+        st.metric("⏱️ Horas", f"{float(ultimo.get('horas') or 0):.1f}")
+
+    with col3:
+        st.metric("💎 Diamantes", f"{int(pd.to_numeric(ultimo.get('diamantes'), errors='coerce') or 0):,}")
+
+    with col4:
+        st.metric("🏆 Nivel", int(ultimo.get('nivel') or 0))
+
+    if ultimo.get('cumple') == 'SI':
+        st.success(f"✅ ¡Cumples este mes! Regalo: {_regalo(ultimo)}")
+    else:
+        st.warning("⚠️ Aún no alcanzas el mínimo de días y horas de este mes.")
+
+    st.divider()
+
+    tab1, tab2 = st.tabs(["📈 Diamantes", "📋 Historial"])
+
+    with tab1:
+        fig = go.Figure(go.Bar(
+            x=[capa_datos.obtener_mes_español(str(f)) for f in df['fecha_datos']],
+            y=pd.to_numeric(df['diamantes'], errors='coerce').fillna(0),
+            marker_color=['#00f2ea' if c == 'SI' else '#fe2c55' for c in df['cumple']],
+        ))
+        fig.update_layout(
+            title="💎 Diamantes por mes (turquesa = cumplió)",
+            template="plotly_dark",
+            height=400,
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+    with tab2:
+        tabla = pd.DataFrame({
+            'Mes': [capa_datos.obtener_mes_español(str(f)) for f in df['fecha_datos']],
+            'Usuario': df['usuario'],
+            'Días': pd.to_numeric(df['dias'], errors='coerce').fillna(0).astype(int),
+            'Horas': df['horas'].round(1),
+            'Diamantes': pd.to_numeric(df['diamantes'], errors='coerce').fillna(0).astype(int),
+            'Nivel': df['nivel'],
+            'Cumple': df['cumple'],
+            'Regalo': [_regalo(fila) for _, fila in df.iterrows()],
+        }).iloc[::-1]
+
+        st.dataframe(
+            tabla,
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                'Diamantes': st.column_config.NumberColumn('Diamantes', format="%d"),
+            }
+        )
+        st.caption("📌 Un corte por mes: el cierre si ya existe, si no el más reciente.")
+
+if __name__ == "__main__":
+    main()
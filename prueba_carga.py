@@ -0,0 +1,322 @@
+# ============================================================================
+# prueba_carga.py - Sesiones concurrentes contra una réplica de Streamlit
+# Simula N sesiones a la vez (AppTest) recorriendo los flujos de jugador con
+# token, login de agente y página de eventos, sobre supabase_falso.py.
+#
+# Uso:
+#   python prueba_carga.py                                # 1, 5, 10, 20 sesiones
+#   python prueba_carga.py --sesiones 1 10 50 --latencia-ms 40
+#   python prueba_carga.py --flujos jugador agente --reruns 5 --en-frio
+#   python prueba_carga.py --migrado                      # con las RPC de migraciones/
+# ============================================================================
+
+import argparse
+import os
+import resource
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import supabase_falso
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+APP = os.path.join(RAIZ, "app.py")
+PAGINA_EVENTOS = next(
+    (f"pages/{f}" for f in sorted(os.listdir(os.path.join(RAIZ, "pages"))) if "Registro_Eventos" in f),
+    None
+)
+FLUJOS = ("jugador", "agente", "eventos")
+
+# ============================================================================
+# MEMORIA
+# ============================================================================
+
+def rss_actual_mb():
+    """RSS actual del proceso (Linux: /proc; otros: pico histórico)"""
+    try:
+        with open("/proc/self/statm") as f:
+            paginas = int(f.read().split()[1])
+        return paginas * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class MuestreoRSS:
+    """Hilo que registra el pico de RSS mientras dura un nivel de concurrencia"""
+
+    def __init__(self, intervalo=0.05):
+        self.intervalo = intervalo
+        self.pico = rss_actual_mb()
+        self._parar = threading.Event()
+        self._hilo = threading.Thread(target=self._ciclo, daemon=True)
+
+    def _ciclo(self):
+        while not self._parar.wait(self.intervalo):
+            self.pico = max(self.pico, rss_actual_mb())
+
+    def __enter__(self):
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._hilo.join()
+        self.pico = max(self.pico, rss_actual_mb())
+
+# ============================================================================
+# ENTORNO DE STREAMLIT
+# ============================================================================
+
+def compartir_cache_de_scripts():
+    """
+    Cada AppTest crea su propia ScriptCache y recompila el script en cada run;
+    un servidor real compila una vez para todas las sesiones. Se comparte el
+    bytecode entre sesiones (compilar en paralelo además falla en Python 3.11).
+    """
+    from streamlit.runtime.scriptrunner import script_cache
+
+    original = script_cache.ScriptCache.get_bytecode
+    compartido = {}
+    lock = threading.Lock()
+
+    def get_bytecode(self, script_path):
+        ruta = os.path.abspath(script_path)
+        with lock:
+            if ruta not in compartido:
+                compartido[ruta] = original(self, ruta)
+            return compartido[ruta]
+
+    script_cache.ScriptCache.get_bytecode = get_bytecode
+
+def compartir_runtime():
+    """
+    AppTest instala un Runtime simulado al inicio de cada run y lo borra al
+    terminar; con varias sesiones en hilos, una deja a las demás sin Runtime.
+    Como en un servidor real, todas las sesiones ven uno solo: el último instalado.
+    """
+    from streamlit.runtime import Runtime
+
+    ultimo = {}
+
+    def instance(cls):
+        if cls._instance is not None:
+            ultimo['runtime'] = cls._instance
+        if 'runtime' not in ultimo:
+            raise RuntimeError("Runtime hasn't been created!")
+        return ultimo['runtime']
+
+    def exists(cls):
+        return cls._instance is not None or 'runtime' in ultimo
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(exists)
+
+def fijar_modo_paginas():
+    """
+    AppTest pone PagesManager.uses_pages_directory en None al iniciar cada run;
+    si otra sesión arranca su script en ese instante lo ejecuta sin el envoltorio
+    multipágina y sus widgets cambian de id (clics perdidos). En un servidor el
+    valor se fija una vez: aquí se congela con un descriptor de metaclase.
+    """
+    import importlib
+    from streamlit.runtime.pages_manager import PagesManager
+
+    usa_pages = os.path.isdir(os.path.join(RAIZ, "pages"))
+
+    class _ModoFijo(type):
+        uses_pages_directory = property(lambda cls: usa_pages, lambda cls, valor: None)
+
+    fijo = _ModoFijo("PagesManager", (PagesManager,), {})
+
+    for nombre in ("streamlit.testing.v1.app_test",
+                   "streamlit.runtime.scriptrunner.script_runner",
+                   "streamlit.elements.widgets.button",
+                   "streamlit.commands.execution_control"):
+        modulo = importlib.import_module(nombre)
+        if getattr(modulo, "PagesManager", None) is PagesManager:
+            modulo.PagesManager = fijo
+
+def fijar_modo_prueba():
+    """
+    AppTest activa la opción global.appTest solo mientras dura cada run y al
+    salir restaura el valor previo; la primera sesión que termina la apaga para
+    las demás y sus selectbox quedan sin format_func registrado (KeyError).
+    Activada de antemano, cada run restaura True.
+    """
+    from streamlit import config
+
+    config.set_option("global.appTest", True)
+
+# ============================================================================
+# FLUJOS (una sesión = un AppTest)
+# ============================================================================
+
+def _correr(at, tiempos):
+    """Un rerun cronometrado; falla si la app lanzó excepción"""
+    inicio = time.perf_counter()
+    at.run()
+    tiempos.append(time.perf_counter() - inicio)
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+
+def flujo_jugador(contrato, reruns, timeout):
+    """Jugador con token grupal: carga la vista y navega páginas de la tabla"""
+    from streamlit.testing.v1 import AppTest
+
+    tiempos = []
+    at = AppTest.from_file(APP, default_timeout=timeout)
+    at.query_params["token"] = f"tok-{contrato}"
+    _correr(at, tiempos)
+    for i in range(reruns):
+        at.number_input(key="jug_todos_pagina").set_value(i % 3 + 1)
+        _correr(at, tiempos)
+    return tiempos
+
+def flujo_agente(contrato, reruns, timeout):
+    """Agente: login desde la pantalla pública, luego cambia de página y orden"""
+    from streamlit.testing.v1 import AppTest
+
+    tiempos = []
+    at = AppTest.from_file(APP, default_timeout=timeout)
+    _correr(at, tiempos)
+    at.text_input(key="usuario_agente_input").input(f"agente_{contrato}")
+    at.text_input(key="password_agente_input").input("demo")
+    at.button(key="btn_agente").click()
+    _correr(at, tiempos)
+    # El login hace st.rerun(): el siguiente run ya es la vista del agente
+    _correr(at, tiempos)
+    ordenes = ["💎 Diamantes", "📅 Días", "🏆 Nivel"]
+    for i in range(reruns):
+        at.selectbox(key="agente_todos_orden").set_value(ordenes[i % len(ordenes)])
+        _correr(at, tiempos)
+    return tiempos
+
+def flujo_eventos(contrato, reruns, timeout):
+    """Página de eventos: valida un usuario del contrato (ilike + histórico)"""
+    from streamlit.testing.v1 import AppTest
+
+    tiempos = []
+    # Como en el servidor: la página se sirve dentro de la app multipágina de app.py
+    at = AppTest.from_file(APP, default_timeout=timeout)
+    at.query_params["token"] = f"tok-{contrato}"
+    at.switch_page(PAGINA_EVENTOS)
+    _correr(at, tiempos)
+    for i in range(max(reruns, 1)):
+        at.text_input[0].input(f"user_{contrato}_{i + 1}")
+        at.button[0].click()
+        _correr(at, tiempos)
+        if at.session_state["usuario_validado"]:
+            at.session_state["usuario_validado"] = False
+    return tiempos
+
+FUNCIONES_FLUJO = {
+    "jugador": flujo_jugador,
+    "agente": flujo_agente,
+    "eventos": flujo_eventos,
+}
+
+# ============================================================================
+# ORQUESTACIÓN
+# ============================================================================
+
+def limpiar_caches():
+    """Arranque en frío: vacía las cachés de datos del proceso (Streamlit y la caché acotada)"""
+    import streamlit as st
+    st.cache_data.clear()
+    # La caché acotada de capa_datos.py, la última copia buena y el planificador viven en cache_resource
+    st.cache_resource.clear()
+
+def correr_nivel(db, sesiones, flujos, contratos, reruns, timeout):
+    """Lanza `sesiones` sesiones a la vez repartidas entre flujos y contratos"""
+    tareas = [(flujos[i % len(flujos)], contratos[i % len(contratos)]) for i in range(sesiones)]
+    tiempos, errores = [], []
+    consultas_antes = db.consultas
+
+    def ejecutar(tarea):
+        flujo, contrato = tarea
+        try:
+            return FUNCIONES_FLUJO[flujo](contrato, reruns, timeout)
+        except Exception as e:
+            errores.append(f"{flujo}/{contrato}: {e}")
+            return []
+
+    with MuestreoRSS() as rss:
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=sesiones) as pool:
+            for resultado in pool.map(ejecutar, tareas):
+                tiempos.extend(resultado)
+        duracion = time.perf_counter() - inicio
+
+    return {
+        "sesiones": sesiones,
+        "reruns": len(tiempos),
+        "tiempos": np.array(tiempos) * 1000,
+        "consultas": db.consultas - consultas_antes,
+        "rss_pico": rss.pico,
+        "duracion": duracion,
+        "errores": errores,
+    }
+
+def imprimir_reporte(niveles, latencia_ms):
+    """Tabla de p50/p95/p99 por nivel de concurrencia"""
+    print("\n" + "=" * 92)
+    print(f"📊 Prueba de carga | latencia Supabase simulada: {latencia_ms} ms")
+    print("=" * 92)
+    print(f"{'Sesiones':>8} {'Reruns':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'máx ms':>9} "
+          f"{'Consultas':>10} {'Cons/rerun':>10} {'RSS pico MB':>12} {'Errores':>8}")
+    for n in niveles:
+        t = n["tiempos"]
+        if len(t):
+            p50, p95, p99 = np.percentile(t, [50, 95, 99])
+            maximo = t.max()
+        else:
+            p50 = p95 = p99 = maximo = float("nan")
+        por_rerun = n["consultas"] / len(t) if len(t) else 0
+        print(f"{n['sesiones']:>8} {n['reruns']:>7} {p50:>9.0f} {p95:>9.0f} {p99:>9.0f} {maximo:>9.0f} "
+              f"{n['consultas']:>10,} {por_rerun:>10.1f} {n['rss_pico']:>12.0f} {len(n['errores']):>8}")
+    for n in niveles:
+        for error in n["errores"][:5]:
+            print(f"  ❌ [{n['sesiones']} sesiones] {error}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Sesiones concurrentes simuladas contra app.py")
+    parser.add_argument("--sesiones", type=int, nargs="+", default=[1, 5, 10, 20],
+                        help="Niveles de concurrencia a probar")
+    parser.add_argument("--flujos", nargs="+", choices=FLUJOS, default=list(FLUJOS))
+    parser.add_argument("--reruns", type=int, default=3, help="Interacciones extra por sesión")
+    parser.add_argument("--latencia-ms", type=float, default=30, help="Latencia por consulta a Supabase")
+    parser.add_argument("--jugadores", type=int, default=300, help="Jugadores por contrato en los datos falsos")
+    parser.add_argument("--timeout", type=float, default=120, help="Tope en segundos por rerun")
+    parser.add_argument("--migrado", action="store_true",
+                        help="Simular una base con migraciones/ aplicado (RPC de periodos y resumen)")
+    parser.add_argument("--en-frio", action="store_true", help="Vaciar las cachés del proceso antes de cada nivel")
+    args = parser.parse_args()
+
+    if "eventos" in args.flujos and not PAGINA_EVENTOS:
+        parser.error("No se encontró la página de Registro de Eventos en pages/")
+
+    # Los precalentadores y sondeos de fondo no deben competir con la medición
+    os.environ.setdefault("PRECALENTADOR_INTERVALO", "3600")
+
+    db = supabase_falso.instalar(latencia_ms=args.latencia_ms, jugadores=args.jugadores, migrado=args.migrado)
+    contratos = sorted({t["contrato"] for t in db.tablas["contratos_tokens"] if t.get("contrato")})
+
+    from streamlit import logger as st_logger
+    st_logger.set_log_level("error")
+    compartir_cache_de_scripts()
+    compartir_runtime()
+    fijar_modo_paginas()
+    fijar_modo_prueba()
+
+    niveles = []
+    for sesiones in args.sesiones:
+        if args.en_frio:
+            limpiar_caches()
+        print(f"▶️  {sesiones} sesiones...", flush=True)
+        niveles.append(correr_nivel(db, sesiones, args.flujos, contratos, args.reruns, args.timeout))
+
+    imprimir_reporte(niveles, args.latencia_ms)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,448 @@
+# ============================================================================
+# supabase_falso.py - Supabase en memoria para pruebas sin conexión
+# Imita el subconjunto del cliente (sync y async) que usan capa_datos.py, pages/ y
+# backfill_niveles.py, con latencia configurable y conteo de consultas.
+#
+# Uso:
+#   import supabase_falso
+#   db = supabase_falso.instalar(latencia_ms=30, jugadores=300)
+#   ...  # create_client / acreate_client ya devuelven el cliente falso
+#   print(db.consultas)
+# ============================================================================
+
+import asyncio
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+FECHAS_DEMO = ['2026-07-31', '2026-08-15', '2026-08-31', '2026-09-08', '2026-09-15']
+CONTRATOS_DEMO = ['A001', 'A002', 'B003']
+
+# Columnas reales que los datos sintéticos no llenan (las lee mi-progreso.html):
+# existen para el chequeo de columnas de select() aunque ninguna fila las tenga
+COLUMNAS_EXTRA = {
+    'usuarios_tiktok': ('nivel', 'partidas', 'nuevos_seguidores', 'nuevos_fans', 'fans_totales',
+                        'fans_activos_club', 'fecha_incorporacion', 'paypal_incentivo', 'coins_incentivo'),
+}
+
+# ============================================================================
+# CONSULTAS
+# ============================================================================
+
+def _patron_ilike(patron):
+    """Convierte un patrón ILIKE (%) a regex sin distinguir mayúsculas"""
+    return re.compile('^' + re.escape(patron).replace('%', '.*') + '$', re.IGNORECASE)
+
+class _FiltroNot:
+    """Soporte mínimo de .not_.is_(columna, 'null')"""
+    def __init__(self, consulta):
+        self.consulta = consulta
+
+    def is_(self, columna, valor):
+        self.consulta._filtros.append(lambda r: r.get(columna) is not None)
+        return self.consulta
+
+class ErrorPostgrestFalso(Exception):
+    """Error con la forma de postgrest.APIError (code, status_code)"""
+
+    def __init__(self, estado, codigo, mensaje):
+        super().__init__(mensaje)
+        self.status_code = estado
+        self.code = codigo
+        self.message = mensaje
+
+class ConsultaFalsa:
+    """Query builder encadenable: filtros, orden, rango y escrituras básicas"""
+
+    def __init__(self, db, tabla):
+        self.db = db
+        self.tabla = tabla
+        self._filtros = []
+        self._orden = []
+        self._limite = None
+        self._rango = None
+        self._columnas = '*'
+        self._contar = False
+        self._solo_conteo = False
+        self._operacion = 'select'
+        self._carga = None
+
+    # --- lectura
+    def select(self, *columnas, count=None, head=None):
+        self._columnas = ','.join(columnas) or '*'
+        self._contar = bool(count)
+        self._solo_conteo = bool(head)
+        return self
+
+    def eq(self, columna, valor):
+        if isinstance(valor, bool):
+            self._filtros.append(lambda r: r.get(columna) == valor)
+        else:
+            self._filtros.append(lambda r: str(r.get(columna)) == str(valor))
+        return self
+
+    def neq(self, columna, valor):
+        self._filtros.append(lambda r: str(r.get(columna)) != str(valor))
+        return self
+
+    def gt(self, columna, valor):
+        self._filtros.append(lambda r: r.get(columna) is not None and r.get(columna) > valor)
+        return self
+
+    def gte(self, columna, valor):
+        self._filtros.append(lambda r: r.get(columna) is not None and r.get(columna) >= valor)
+        return self
+
+    def lt(self, columna, valor):
+        self._filtros.append(lambda r: r.get(columna) is not None and r.get(columna) < valor)
+        return self
+
+    def lte(self, columna, valor):
+        self._filtros.append(lambda r: r.get(columna) is not None and r.get(columna) <= valor)
+        return self
+
+    def in_(self, columna, valores):
+        valores = set(map(str, valores))
+        self._filtros.append(lambda r: str(r.get(columna)) in valores)
+        return self
+
+    def ilike(self, columna, patron):
+        regex = _patron_ilike(patron)
+        self._filtros.append(lambda r: bool(regex.match(str(r.get(columna) or ''))))
+        return self
+
+    def or_(self, expresion):
+        condiciones = []
+        for parte in expresion.split(','):
+            columna, operador, valor = parte.split('.', 2)
+            condiciones.append((columna, operador, _patron_ilike(valor) if operador == 'ilike' else valor))
+
+        def cumple(r):
+            for columna, operador, valor in condiciones:
+                if operador == 'eq' and str(r.get(columna)) == valor:
+                    return True
+                if operador == 'ilike' and valor.match(str(r.get(columna) or '')):
+                    return True
+            return False
+
+        self._filtros.append(cumple)
+        return self
+
+    @property
+    def not_(self):
+        return _FiltroNot(self)
+
+    def order(self, columna, desc=False):
+        self._orden.append((columna, desc))
+        return self
+
+    def limit(self, n):
+        self._limite = n
+        return self
+
+    def range(self, inicio, fin):
+        self._rango = (inicio, fin)
+        return self
+
+    def maybe_single(self):
+        self._limite = 1
+        return self
+
+    # --- escritura
+    def insert(self, carga):
+        self._operacion, self._carga = 'insert', carga
+        return self
+
+    def upsert(self, carga, on_conflict=None):
+        self._operacion, self._carga = 'insert', carga
+        return self
+
+    def update(self, carga):
+        self._operacion, self._carga = 'update', carga
+        return self
+
+    def delete(self):
+        self._operacion = 'delete'
+        return self
+
+    def _resolver(self):
+        """Ejecuta la consulta contra las tablas en memoria (sin latencia)"""
+        self.db._contar_consulta(self.tabla)
+
+        with self.db.lock:
+            filas = self.db.tablas.setdefault(self.tabla, [])
+            if self._operacion != 'select':
+                # Como el trigger de 005_version_tablas
+                self.db.versiones[self.tabla] = self.db.versiones.get(self.tabla, 1) + 1
+
+            if self._operacion == 'insert':
+                nuevas = self._carga if isinstance(self._carga, list) else [self._carga]
+                filas.extend(dict(f) for f in nuevas)
+                return SimpleNamespace(data=list(nuevas), count=None)
+
+            seleccion = [r for r in filas if all(f(r) for f in self._filtros)]
+
+            if self._operacion == 'update':
+                for r in seleccion:
+                    r.update(self._carga)
+                return SimpleNamespace(data=[dict(r) for r in seleccion], count=None)
+
+            if self._operacion == 'delete':
+                self.db.tablas[self.tabla] = [r for r in filas if r not in seleccion]
+                return SimpleNamespace(data=seleccion, count=None)
+
+        for columna, desc in reversed(self._orden):
+            seleccion.sort(key=lambda r: (r.get(columna) is None, r.get(columna)), reverse=desc)
+
+        total = len(seleccion)
+        if self._rango:
+            seleccion = seleccion[self._rango[0]:self._rango[1] + 1]
+        if self._limite is not None:
+            seleccion = seleccion[:self._limite]
+
+        if self._columnas == '*':
+            seleccion = [dict(r) for r in seleccion]
+        else:
+            columnas = [c.strip() for c in self._columnas.split(',')]
+            # Como PostgREST: una columna que no existe es un 400, no un null
+            conocidas = set(COLUMNAS_EXTRA.get(self.tabla, ())).union(*filas) if filas else set(columnas)
+            desconocidas = [c for c in columnas if c not in conocidas]
+            if desconocidas:
+                raise ErrorPostgrestFalso(400, '42703', f"column {self.tabla}.{desconocidas[0]} does not exist")
+            seleccion = [{c: r.get(c) for c in columnas} for r in seleccion]
+
+        return SimpleNamespace(data=[] if self._solo_conteo else seleccion,
+                               count=total if self._contar else None)
+
+    def execute(self):
+        self.db._esperar()
+        return self._resolver()
+
+class ConsultaFalsaAsync(ConsultaFalsa):
+    """Misma consulta con execute() awaitable (cliente async)"""
+
+    async def execute(self):
+        await asyncio.sleep(self.db.latencia)
+        return self._resolver()
+
+class RpcFalso:
+    """Llamada RPC: solo existen las funciones registradas en db.rpcs"""
+
+    def __init__(self, db, nombre, parametros):
+        self.db = db
+        self.nombre = nombre
+        self.parametros = parametros or {}
+
+    def _resolver(self):
+        self.db._contar_consulta(f"rpc:{self.nombre}")
+        funcion = self.db.rpcs.get(self.nombre)
+        if funcion is None:
+            raise Exception(f"Could not find the function public.{self.nombre}")
+        return SimpleNamespace(data=funcion(self.db, self.parametros), count=None)
+
+    def execute(self):
+        self.db._esperar()
+        return self._resolver()
+
+class RpcFalsoAsync(RpcFalso):
+    async def execute(self):
+        await asyncio.sleep(self.db.latencia)
+        return self._resolver()
+
+# ============================================================================
+# BASE Y CLIENTES
+# ============================================================================
+
+class SupabaseFalso:
+    """Tablas en memoria compartidas por los clientes sync y async"""
+
+    def __init__(self, tablas, latencia_ms=0, rpcs=None):
+        self.tablas = tablas
+        self.latencia = latencia_ms / 1000
+        self.rpcs = rpcs or {}
+        self.versiones = {}   # tabla -> contador de cambios (version_tablas)
+        self.lock = threading.Lock()
+        self.consultas = 0
+        self.consultas_por_tabla = {}
+
+    def _esperar(self):
+        if self.latencia:
+            time.sleep(self.latencia)
+
+    def _contar_consulta(self, tabla):
+        with self.lock:
+            self.consultas += 1
+            self.consultas_por_tabla[tabla] = self.consultas_por_tabla.get(tabla, 0) + 1
+
+    # Interfaz del cliente sync
+    def table(self, tabla):
+        return ConsultaFalsa(self, tabla)
+
+    def from_(self, tabla):
+        return ConsultaFalsa(self, tabla)
+
+    def rpc(self, nombre, params=None):
+        return RpcFalso(self, nombre, params)
+
+class ClienteAsyncFalso:
+    """Interfaz del cliente async sobre la misma base"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def table(self, tabla):
+        return ConsultaFalsaAsync(self.db, tabla)
+
+    def from_(self, tabla):
+        return ConsultaFalsaAsync(self.db, tabla)
+
+    def rpc(self, nombre, params=None):
+        return RpcFalsoAsync(self.db, nombre, params)
+
+# ============================================================================
+# DATOS DE DEMOSTRACIÓN
+# ============================================================================
+
+def generar_datos(jugadores=300, contratos=None, fechas=None, semilla=1):
+    """Dataset sintético con la forma de las tablas reales"""
+    rnd = random.Random(semilla)
+    contratos = contratos or CONTRATOS_DEMO
+    fechas = fechas or FECHAS_DEMO
+
+    usuarios = []
+    for contrato in contratos:
+        for i in range(jugadores):
+            for fecha in fechas:
+                usuarios.append({
+                    'id_tiktok': f'{contrato}{i}',
+                    'usuario': f'user_{contrato}_{i}' if i % 7 else '',
+                    'contrato': contrato,
+                    'fecha_datos': fecha,
+                    'dias': rnd.randint(0, 30),
+                    'duracion': f'{rnd.randint(0, 60)}h {rnd.randint(0, 59)}min {rnd.randint(0, 59)}s',
+                    'diamantes': rnd.randint(0, 300000),
+                    'agencia': 'AG',
+                    'agente': 'agente_demo',
+                })
+    for i, u in enumerate(usuarios, 1):
+        u['id'] = i
+
+    incentivos = [{
+        'acumulado': a,
+        'nivel_1_monedas': a // 100, 'nivel_1_paypal': a / 1000,
+        'nivel_2_monedas': a // 80, 'nivel_2_paypal': a / 800,
+        'nivel_3_monedas': a // 50, 'nivel_3_paypal': a / 500,
+    } for a in [5000, 10000, 50000, 100000, 200000]]
+
+    reportes = [{
+        'contrato': u['contrato'], 'periodo': u['fecha_datos'],
+        'usuario_id': u['id_tiktok'], 'usuario': u['usuario'],
+        'paypal_bruto': 10.0, 'paypal_incentivo': 1.0, 'coins_incentivo': 100, 'coins_bruto': 0,
+    } for u in usuarios if not u['contrato'].startswith('B')]
+    for i, r in enumerate(reportes, 1):
+        r['id'] = i
+
+    # Totales de la nota por contrato y corte (lo que escriben los scripts 09-20)
+    resumen = {}
+    for r in reportes:
+        total = resumen.setdefault((r['contrato'], r['periodo']), {
+            'contrato': r['contrato'], 'periodo': r['periodo'], 'usuarios_validos': 0,
+            'total_coins': 0, 'total_paypal': 0.0, 'total_final': 0.0,
+        })
+        total['usuarios_validos'] += 1
+        total['total_coins'] += r['coins_incentivo']
+        total['total_paypal'] += r['paypal_incentivo']
+        total['total_final'] += r['paypal_bruto'] + r['paypal_incentivo']
+
+    tokens = [{'token': 'admin-demo', 'tipo': 'admin', 'activo': True, 'nombre': 'Admin', 'contrato': None}]
+    tokens += [{'token': f'tok-{c}', 'tipo': 'contrato', 'activo': True, 'contrato': c, 'nombre': f'Contrato {c}'}
+               for c in contratos]
+
+    return {
+        'usuarios_tiktok': usuarios,
+        'contratos_tokens': tokens,
+        'agentes_login': [{'usuario': f'agente_{c}', 'password': 'demo', 'activo': True, 'contrato': c,
+                           'cambio_password': True, 'email': f'{c.lower()}@demo'} for c in contratos],
+        'contratos': [{'codigo': c, 'nivel1_tabla3': 'NO', 'tipo_logica': 'EMPLEADO_ESTANDAR'} for c in contratos],
+        'contratos_equivalencias': [],
+        'jerarquia_contratos': [],
+        'incentivos_horizontales': incentivos,
+        'reportes_contratos': reportes,
+        'resumen_contratos': list(resumen.values()),
+        'historico_usuarios': [{'id_tiktok': f'{c}{i}', 'usuario_1': f'antes_{c}_{i}', 'usuario_2': None,
+                                'usuario_3': None, 'visto_ultima_vez': fechas[0]}
+                               for c in contratos for i in range(0, jugadores, 7)],
+        'config_columnas_ocultas': [],
+        'incentivos_custom_vertex': [],
+        'excepciones_calculo_jugador': [],
+        'tokens_jugadores': [],
+        'agenda_eventos': [],
+    }
+
+# ============================================================================
+# RPC DE migraciones/ (mismo resultado que las funciones SQL)
+# ============================================================================
+
+def _rpc_fechas_disponibles(db, parametros):
+    contrato = parametros.get('p_contrato')
+    fechas = {r['fecha_datos'] for r in db.tablas.get('usuarios_tiktok', [])
+              if r.get('fecha_datos') and (contrato is None or r.get('contrato') == contrato)}
+    return [{'fecha_datos': f} for f in sorted(fechas, reverse=True)]
+
+def _rpc_versiones_tablas(db, parametros):
+    tablas = parametros.get('p_tablas')
+    return [{'tabla': t, 'version': db.versiones.get(t, 1)} for t in sorted(db.tablas)
+            if tablas is None or t in tablas]
+
+def _rpc_resumen_metricas_periodo(db, parametros):
+    contratos = parametros.get('p_contratos')
+    grupos = {}
+    for r in db.tablas.get('usuarios_tiktok', []):
+        if r.get('fecha_datos') != parametros.get('p_fecha_datos'):
+            continue
+        if contratos is not None and r.get('contrato') not in contratos:
+            continue
+        grupos.setdefault(r['contrato'], []).append(r)
+    return [{
+        'contrato': contrato,
+        'jugadores': len(filas),
+        'con_actividad': sum(1 for r in filas if (r.get('dias') or 0) > 0),
+        'diamantes': sum(r.get('diamantes') or 0 for r in filas),
+        'dias_promedio': round(sum(r.get('dias') or 0 for r in filas) / len(filas), 1),
+    } for contrato, filas in sorted(grupos.items())]
+
+RPCS_MIGRACIONES = {
+    'obtener_fechas_disponibles': _rpc_fechas_disponibles,
+    'resumen_metricas_periodo': _rpc_resumen_metricas_periodo,
+    'obtener_versiones_tablas': _rpc_versiones_tablas,
+}
+
+def instalar(latencia_ms=0, jugadores=300, tablas=None, rpcs=None, migrado=False):
+    """
+    Reemplaza supabase.create_client / acreate_client por el cliente falso
+    y define credenciales de ejemplo. Devuelve la base para leer contadores.
+    Debe llamarse antes de importar (o ejecutar con AppTest) capa_datos.py / app.py.
+    `migrado=True` simula una base con migraciones/ aplicado (RPC y registro).
+    """
+    import os
+    import supabase
+
+    tablas = tablas if tablas is not None else generar_datos(jugadores)
+    if migrado:
+        rpcs = {**RPCS_MIGRACIONES, **(rpcs or {})}
+        carpeta = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migraciones')
+        tablas['migraciones_aplicadas'] = [{'version': f[:-4]} for f in sorted(os.listdir(carpeta))
+                                           if f.endswith('.sql')]
+
+    db = SupabaseFalso(tablas, latencia_ms, rpcs)
+
+    async def crear_cliente_async(url, key, *args, **kwargs):
+        return ClienteAsyncFalso(db)
+
+    supabase.create_client = lambda url, key, *args, **kwargs: db
+    supabase.acreate_client = crear_cliente_async
+    os.environ.setdefault('SUPABASE_URL', 'http://supabase-falso.local')
+    os.environ.setdefault('SUPABASE_SERVICE_KEY', 'clave-falsa')
+    return db
@@ -0,0 +1,33 @@
+# ============================================================================
+# conftest.py - capa_datos.py importado contra supabase_falso (sin conexión)
+# ============================================================================
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Copias en disco y almacén propios: los de la app (otra base, otros datos)
+# se servirían como última copia buena y el refresco cambiaría la respuesta
+_TEMPORAL = tempfile.mkdtemp(prefix='pruebas_capa_datos_')
+os.environ['ULTIMA_COPIA_DIR'] = os.path.join(_TEMPORAL, 'ultima_copia')
+os.environ['ALMACEN_ANALITICO'] = os.path.join(_TEMPORAL, 'analitico.duckdb')
+
+import supabase_falso
+
+DB = supabase_falso.instalar(jugadores=20)
+
+import capa_datos
+
+
+@pytest.fixture(scope='session')
+def datos():
+    return capa_datos
+
+
+@pytest.fixture
+def db():
+    return DB
@@ -0,0 +1,92 @@
+# ============================================================================
+# test_api_lectura.py - ETag / 304, gzip, proyección y errores de api_lectura
+# ============================================================================
+
+import gzip
+import http.client
+import json
+
+import pytest
+
+import api_lectura
+
+@pytest.fixture(scope='module')
+def servidor(datos):
+    servidor = api_lectura.iniciar_en_hilo(datos, '127.0.0.1', 0)
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+@pytest.fixture
+def pedir(servidor):
+    def pedir(ruta, **cabeceras):
+        conexion = http.client.HTTPConnection('127.0.0.1', servidor.server_address[1], timeout=30)
+        conexion.request('GET', ruta, headers=cabeceras)
+        respuesta = conexion.getresponse()
+        cuerpo = respuesta.read()
+        conexion.close()
+        return respuesta, cuerpo
+    return pedir
+
+def _json(respuesta, cuerpo):
+    if respuesta.getheader('Content-Encoding') == 'gzip':
+        cuerpo = gzip.decompress(cuerpo)
+    return json.loads(cuerpo)
+
+def test_sin_token_o_token_invalido_es_401(pedir):
+    assert pedir('/api/periodos')[0].status == 401
+    assert pedir('/api/periodos?token=nada')[0].status == 401
+
+def test_token_de_jugador_no_ve_el_contrato(pedir, db):
+    db.tablas['tokens_jugadores'] = [{'token': 'jug-1', 'id_tiktok': 'A0011', 'activo': True}]
+    respuesta, cuerpo = pedir('/api/contrato?token=jug-1')
+    assert respuesta.status == 403
+    assert 'error' in _json(respuesta, cuerpo)
+
+def test_etag_estable_entre_refrescos_y_304(pedir, datos):
+    ruta = '/api/contrato?token=admin-demo&contrato=A001&periodo=2026-09-15'
+    respuesta, cuerpo = pedir(ruta)
+    assert respuesta.status == 200
+    etag = respuesta.getheader('ETag')
+    assert respuesta.getheader('X-Frescura-Estado')
+    assert 'frescura' not in _json(respuesta, cuerpo)
+
+    # Un refresco SWR sin cambios en los datos solo mueve `actualizado`
+    df, frescura = datos.obtener_datos_contrato_swr('A001', '2026-09-15')
+    datos.guardar_ultima_copia('A001', '2026-09-15', df, frescura['version'])
+
+    respuesta, cuerpo = pedir(ruta, **{'If-None-Match': etag})
+    assert respuesta.status == 304
+    assert cuerpo == b''
+    assert respuesta.getheader('ETag') == etag
+
+def test_gzip_si_el_cliente_lo_acepta(pedir):
+    ruta = '/api/contrato?token=admin-demo&contrato=A001&periodo=2026-09-15'
+    respuesta, cuerpo = pedir(ruta, **{'Accept-Encoding': 'gzip'})
+    assert respuesta.status == 200
+    assert respuesta.getheader('Content-Encoding') == 'gzip'
+    payload = _json(respuesta, cuerpo)
+
+    respuesta, cuerpo = pedir(ruta)
+    assert respuesta.getheader('Content-Encoding') is None
+    assert _json(respuesta, cuerpo) == payload
+
+def test_proyeccion_de_columnas(pedir):
+    ruta = '/api/contrato?token=admin-demo&contrato=A001&periodo=2026-09-15&columnas=usuario,dias,no_existe'
+    respuesta, cuerpo = pedir(ruta)
+    payload = _json(respuesta, cuerpo)
+    assert payload['total'] == len(payload['filas']) > 0
+    assert set(payload['filas'][0]) == {'usuario', 'dias'}
+
+def test_token_de_contrato_solo_ve_columnas_de_jugadores(pedir):
+    respuesta, cuerpo = pedir('/api/contrato?token=tok-A001&periodo=2026-09-15&columnas=usuario,agente')
+    assert respuesta.status == 200
+    assert set(_json(respuesta, cuerpo)['filas'][0]) == {'usuario'}
+
+def test_error_interno_no_expone_el_detalle(pedir, datos, monkeypatch):
+    def fallar():
+        raise RuntimeError('password=secreta en la cadena de conexión')
+    monkeypatch.setattr(datos, 'obtener_periodos_disponibles', fallar)
+    respuesta, cuerpo = pedir('/api/periodos?token=admin-demo')
+    assert respuesta.status == 500
+    assert 'secreta' not in cuerpo.decode('utf-8')
@@ -0,0 +1,34 @@
+# ============================================================================
+# test_backfill_niveles.py - lectura por par y checkpoint ligado a las reglas
+# ============================================================================
+
+import pytest
+
+import backfill_niveles
+
+@pytest.fixture
+def entradas(datos):
+    metadatos = datos.obtener_metadatos_contratos()
+    return metadatos['config'], datos.leer_reglas_calculo(), datos.obtener_incentivos().to_dict('records')
+
+def test_procesar_par_lee_solo_columnas_reales(entradas):
+    backfill_niveles._inicializar_worker(*entradas, solo_calcular=True)
+    resultado = backfill_niveles.procesar_par('A001', '2026-09-15')
+    assert resultado['filas'] == resultado['escritas'] > 0
+
+def test_checkpoint_de_otras_reglas_no_cuenta(entradas, tmp_path):
+    config, reglas, incentivos = entradas
+    ruta = str(tmp_path / 'checkpoint.jsonl')
+    huella = backfill_niveles.huella_reglas(config, reglas, incentivos)
+    backfill_niveles.registrar_checkpoint(ruta, {'contrato': 'A001', 'periodo': '2026-09-15'}, huella)
+
+    assert backfill_niveles.leer_checkpoint(ruta, huella) == {('A001', '2026-09-15')}
+
+    nuevas = {**reglas, 'incentivos_custom_vertex': [{'codigo': 'A001', 'sin_regalo': True}]}
+    assert backfill_niveles.leer_checkpoint(ruta, backfill_niveles.huella_reglas(config, nuevas, incentivos)) == set()
+
+def test_huella_no_depende_del_orden_de_las_filas(entradas):
+    config, reglas, incentivos = entradas
+    invertidas = {tabla: filas[::-1] for tabla, filas in reglas.items()}
+    assert backfill_niveles.huella_reglas(config, reglas, incentivos) == \
+        backfill_niveles.huella_reglas(config, invertidas, incentivos[::-1])
@@ -0,0 +1,59 @@
+# ============================================================================
+# test_busqueda.py - índice de búsqueda por corte (usuario actual + históricos)
+# ============================================================================
+
+import pandas as pd
+import pytest
+
+import supabase_falso
+
+@pytest.fixture
+def versiones_por_trigger(datos, db, monkeypatch):
+    """Base con 005_version_tablas: un UPDATE en historico_usuarios cambia su versión"""
+    monkeypatch.setitem(db.rpcs, 'obtener_versiones_tablas', supabase_falso.RPCS_MIGRACIONES['obtener_versiones_tablas'])
+    monkeypatch.setattr(datos, 'verificar_rutas_rapidas', lambda: {'faltan_rpc': [], 'pendientes': []})
+
+    def nuevo_sondeo():
+        datos._leer_versiones_tablas.clear()
+        datos._sondear_version_tabla.clear()
+
+    nuevo_sondeo()
+    yield nuevo_sondeo
+    nuevo_sondeo()
+
+def corte(db, contrato='A001', periodo='2026-09-15'):
+    filas = [r for r in db.tablas['usuarios_tiktok'] if r['contrato'] == contrato and r['fecha_datos'] == periodo]
+    return pd.DataFrame(filas)
+
+def test_busca_por_usuario_actual_y_nombre_anterior(datos, db, versiones_por_trigger):
+    indice = datos.indexar_corte('A001', '2026-09-15', corte(db))
+    assert indice['error'] is None
+    fila = corte(db).iloc[1]
+    assert datos.buscar_jugadores(fila['usuario'], indice)[0][:2] == (fila['id_tiktok'], fila['usuario'])
+    assert datos.buscar_jugadores('antes_A001_7', indice)[0][:2] == ('A0017', 'antes_A001_7')
+    assert datos.indexar_corte('A001', '2026-09-15', corte(db)) is indice
+
+def test_cambio_de_nombre_rehace_el_indice(datos, db, versiones_por_trigger):
+    indice = datos.indexar_corte('A001', '2026-09-15', corte(db))
+    assert not datos.buscar_jugadores('renombrado_siete', indice)
+
+    db.table('historico_usuarios').update({'usuario_2': 'renombrado_siete'}).eq('id_tiktok', 'A0017').execute()
+    versiones_por_trigger()
+
+    indice = datos.indexar_corte('A001', '2026-09-15', corte(db))
+    assert datos.buscar_jugadores('renombrado_siete', indice)[0][:2] == ('A0017', 'renombrado_siete')
+
+def test_indices_acotados_y_fallo_no_se_guarda(datos, db, monkeypatch, versiones_por_trigger):
+    cache = datos.obtener_cache_acotada('busqueda')
+    assert cache.max_entradas == datos.BUSQUEDA_MAX_CORTES
+
+    async def historial_caido(ids):
+        raise ConnectionError('historico_usuarios caído')
+
+    with monkeypatch.context() as m:
+        m.setattr(datos, 'aobtener_alias_historial', historial_caido)
+        df = corte(db, 'B003')
+        indice = datos.indexar_corte('B003', '2026-09-15', df)
+    assert indice['error'] and datos.buscar_jugadores(df['usuario'].iloc[1], indice)
+
+    assert datos.indexar_corte('B003', '2026-09-15', df)['error'] is None
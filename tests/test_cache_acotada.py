@@ -0,0 +1,94 @@
+# ============================================================================
+# test_cache_acotada.py - CacheAcotada (LRU, TTL, bytes) y su decorador
+# ============================================================================
+
+import pandas as pd
+import pytest
+
+def frame(filas):
+    return pd.DataFrame({'x': range(filas)})
+
+def test_lru_desaloja_la_menos_usada(datos):
+    cache = datos.CacheAcotada('prueba_lru', max_entradas=2, max_mb=64)
+    cache.guardar('a', 1)
+    cache.guardar('b', 2)
+    assert cache.obtener('a') == (True, 1)   # 'a' pasa a ser la más reciente
+    cache.guardar('c', 3)
+    assert cache.obtener('b') == (False, None)
+    assert cache.obtener('a') == (True, 1)
+    assert cache.obtener('c') == (True, 3)
+    assert cache.resumen()['desalojos'] == 1
+
+def test_ttl_expira_la_entrada(datos, monkeypatch):
+    reloj = [1000.0]
+    monkeypatch.setattr(datos.time, 'monotonic', lambda: reloj[0])
+    cache = datos.CacheAcotada('prueba_ttl', max_entradas=8, max_mb=64, ttl=30)
+    cache.guardar('a', 1)
+    reloj[0] += 29
+    assert cache.obtener('a') == (True, 1)
+    reloj[0] += 1
+    assert cache.obtener('a') == (False, None)
+    resumen = cache.resumen()
+    assert resumen['expirados'] == 1 and resumen['entradas'] == 0 and resumen['bytes'] == 0
+
+def test_tope_de_bytes(datos):
+    grande = frame(20000)
+    tamano = datos.tamano_aproximado(grande)
+    cache = datos.CacheAcotada('prueba_bytes', max_entradas=100, max_mb=(2.5 * tamano) / (1024 * 1024))
+    for clave in 'abc':
+        cache.guardar(clave, frame(20000))
+    resumen = cache.resumen()
+    assert resumen['entradas'] == 2 and resumen['desalojos'] == 1
+    assert resumen['bytes'] <= resumen['max_bytes']
+    assert cache.obtener('a') == (False, None)
+
+    cache.guardar('enorme', frame(100000))
+    assert cache.obtener('enorme') == (False, None)
+    assert cache.resumen()['demasiado_grandes'] == 1
+
+def test_tamano_explicito_manda(datos):
+    cache = datos.CacheAcotada('prueba_tamano', max_entradas=100, max_mb=1)
+    cache.guardar('figura', object(), tamano=2 * 1024 * 1024)
+    assert cache.obtener('figura') == (False, None)
+
+def test_decorador_copia_o_comparte_y_no_guarda_errores(datos):
+    llamadas = []
+
+    @datos.cache_acotada('prueba_decorador', max_entradas=4, max_mb=1)
+    def copiado(n):
+        llamadas.append(n)
+        if n < 0:
+            raise ValueError('negativo')
+        return {'n': n}
+
+    @datos.cache_acotada('prueba_compartido', max_entradas=4, max_mb=1, copiar=False)
+    def compartido(n):
+        return {'n': n}
+
+    assert copiado(1) == copiado(1) and copiado(1) is not copiado(1)
+    assert compartido(1) is compartido(1)
+    with pytest.raises(ValueError):
+        copiado(-1)
+    with pytest.raises(ValueError):
+        copiado(-1)
+    assert llamadas == [1, -1, -1]
+
+def test_motor_y_metadatos_en_la_cache_acotada(datos):
+    motor = datos.obtener_motor_reglas('2026-09-15')
+    assert datos.obtener_motor_reglas('2026-09-15') is motor
+    espacios = {r['espacio'] for r in datos.resumen_caches_acotadas()}
+    assert {'motores', 'metadatos'} <= espacios
+
+def test_render_en_el_espacio_render(datos):
+    import app
+    construidos = []
+
+    def construir():
+        construidos.append(1)
+        return app.crear_grafico_pastel(pd.Series({3: 2, 1: 5}))
+
+    clave = ('A001', '2026-09-15', ('v1',), 'prueba', ())
+    assert app.obtener_render(clave, construir) is app.obtener_render(clave, construir)
+    assert construidos == [1]
+    render = next(r for r in datos.resumen_caches_acotadas() if r['espacio'] == 'render')
+    assert render['entradas'] >= 1 and render['bytes'] >= len(app.obtener_render(clave, construir).to_json())
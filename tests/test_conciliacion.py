@@ -0,0 +1,58 @@
+# ============================================================================
+# test_conciliacion.py - cruce app vs reportes_contratos y totales por contrato
+# ============================================================================
+
+import numpy as np
+import pandas as pd
+import pytest
+
+def calculado(datos, filas):
+    """Frame de la app pasado por _marco_calculado, como en _cargar_conciliacion"""
+    df = pd.DataFrame(filas)
+    return datos._marco_calculado({(c, '2026-09-15'): g for c, g in df.groupby('contrato')})
+
+def test_pago_desconocido_es_sin_regla_y_no_diferencia(datos):
+    # V2 usa tabla propia: el motor deja el incentivo en NaN (PAGO_DESCONOCIDO)
+    motor = datos.MotorReglas(None, {'vertex': {}, 'sin_regalo': set(), 'tabla_propia': {'V2'}, 'excepciones': {}})
+    incentivos = pd.DataFrame([{'acumulado': 10000, 'nivel_1_monedas': 100, 'nivel_1_paypal': 10.0,
+                                'nivel_2_monedas': 200, 'nivel_2_paypal': 20.0,
+                                'nivel_3_monedas': 300, 'nivel_3_paypal': 30.0}])
+    evaluado = motor.evaluar(pd.DataFrame([
+        {'contrato': 'V2', 'id_tiktok': '1', 'usuario': 'uno', 'dias': 7, 'horas': 15, 'diamantes': 12000},
+        {'contrato': 'A001', 'id_tiktok': '2', 'usuario': 'dos', 'dias': 7, 'horas': 15, 'diamantes': 12000},
+        {'contrato': 'A001', 'id_tiktok': '3', 'usuario': 'tres', 'dias': 7, 'horas': 15, 'diamantes': 12000},
+    ]), incentivos)
+    assert np.isnan(evaluado['incentivo_coins'].iloc[0])
+
+    reportes = pd.DataFrame([
+        {'contrato': 'V2', 'usuario': 'uno', 'usuario_id': '1', 'coins_incentivo': 250, 'paypal_incentivo': 25.0},
+        {'contrato': 'A001', 'usuario': 'dos', 'usuario_id': '2', 'coins_incentivo': 100, 'paypal_incentivo': 10.0},
+        {'contrato': 'A001', 'usuario': 'tres', 'usuario_id': '3', 'coins_incentivo': 90, 'paypal_incentivo': 10.0},
+    ])
+    filas = datos.conciliar_filas(calculado(datos, evaluado.to_dict('records')), reportes)
+    estados = dict(zip(filas['id_tiktok'], filas['estado']))
+    assert estados == {'1': 'SIN_REGLA', '2': 'OK', '3': 'DIFERENCIA'}
+    fila_v2 = filas[filas['id_tiktok'] == '1'].iloc[0]
+    assert np.isnan(fila_v2['app_coins']) and np.isnan(fila_v2['dif_coins'])
+
+    resumen = pd.DataFrame([
+        {'contrato': 'V2', 'total_coins': 250, 'total_paypal': 25.0, 'usuarios_validos': 1},
+        {'contrato': 'A001', 'total_coins': 190, 'total_paypal': 20.0, 'usuarios_validos': 2},
+    ])
+    totales = datos.conciliar_totales(filas, resumen).set_index('contrato')
+    assert totales.loc['V2', 'app_coins'] == 0
+    assert totales.loc['V2', 'diferencias'] == 0
+    assert totales.loc['V2', 'sin_regla'] == 1
+    assert totales.loc['V2', 'dif_coins_app'] == 0
+    assert totales.loc['V2', 'estado'] == 'SIN_REGLA'
+    assert totales.loc['A001', 'diferencias'] == 1
+    assert totales.loc['A001', 'app_coins'] == 200
+
+def test_solo_reporte_sigue_comparando_contra_cero(datos):
+    reportes = pd.DataFrame([{'contrato': 'A001', 'usuario': 'x', 'usuario_id': '9',
+                              'coins_incentivo': 100, 'paypal_incentivo': 0}])
+    vacio = datos._marco_calculado({})
+    filas = datos.conciliar_filas(vacio, reportes)
+    assert filas['estado'].tolist() == ['SOLO_REPORTE']
+    assert filas['app_coins'].tolist() == [0.0]
+    assert filas['dif_coins'].tolist() == pytest.approx([-100.0])
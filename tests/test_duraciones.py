@@ -0,0 +1,30 @@
+# ============================================================================
+# test_duraciones.py - parsear_duracion_horas y su caché compartida
+# ============================================================================
+
+import pandas as pd
+import pytest
+
+class CacheQueSeVacia(dict):
+    """Caché que otro hilo vacía justo después de cada consulta"""
+
+    def get(self, clave, defecto=None):
+        valor = super().get(clave, defecto)
+        self.clear()
+        return valor
+
+    def __contains__(self, clave):
+        presente = super().__contains__(clave)
+        self.clear()
+        return presente
+
+def test_convierte_textos_a_horas(datos):
+    serie = pd.Series(['12h 30min', '45min 36s', '', None, '2H'])
+    horas = datos.parsear_duracion_horas(serie)
+    assert horas.tolist() == pytest.approx([12.5, 0.76, 0.0, 0.0, 2.0])
+
+def test_cache_vaciada_por_otro_hilo_no_deja_nan(datos, monkeypatch):
+    cache = CacheQueSeVacia({'1h': 1.0, '2h': 2.0})
+    monkeypatch.setattr(datos, '_cache_duraciones', lambda: cache)
+    horas = datos.parsear_duracion_horas(pd.Series(['1h', '2h', '3h', '1h']))
+    assert horas.tolist() == [1.0, 2.0, 3.0, 1.0]
@@ -0,0 +1,155 @@
+# ============================================================================
+# test_motor_reglas.py - MotorReglas.evaluar / pagar y lectura de reglas
+# ============================================================================
+
+import numpy as np
+import pandas as pd
+import pytest
+
+INCENTIVOS = pd.DataFrame([
+    {'acumulado': 5000, 'nivel_1_monedas': 10, 'nivel_1_paypal': 1.0, 'nivel_2_monedas': 20,
+     'nivel_2_paypal': 2.0, 'nivel_3_monedas': 30, 'nivel_3_paypal': 3.0},
+    {'acumulado': 10000, 'nivel_1_monedas': 100, 'nivel_1_paypal': 10.0, 'nivel_2_monedas': 200,
+     'nivel_2_paypal': 20.0, 'nivel_3_monedas': 300, 'nivel_3_paypal': 30.0},
+])
+
+def reglas(vertex=None, sin_regalo=(), tabla_propia=(), excepciones=None):
+    return {'vertex': vertex or {}, 'sin_regalo': set(sin_regalo),
+            'tabla_propia': set(tabla_propia), 'excepciones': excepciones or {}}
+
+def excepcion(moneda='ambos', porcentaje=False, pct=None, descuento=False, dias=None, horas=None):
+    return {'dias': dias, 'horas': horas, 'porcentaje': porcentaje, 'regalo_pct': pct,
+            'moneda': moneda, 'descuento': descuento}
+
+def fila(contrato='A001', id_tiktok='1', dias=7, horas=15, diamantes=12000):
+    return {'contrato': contrato, 'id_tiktok': id_tiktok, 'dias': dias, 'horas': horas, 'diamantes': diamantes}
+
+def evaluar(datos, filas, config=None, **kw):
+    motor = datos.MotorReglas(config, reglas(**kw))
+    return motor.evaluar(pd.DataFrame(filas), INCENTIVOS)
+
+# ============================================================================
+# CONTRATOS
+# ============================================================================
+
+def test_reglas_estandar_por_nivel(datos):
+    df = evaluar(datos, [fila(dias=6), fila(dias=7, horas=15), fila(dias=14, horas=30), fila(dias=20, horas=40)])
+    assert df['nivel'].tolist() == [0, 1, 2, 3]
+    assert df['cumple'].tolist() == ['NO', 'SI', 'SI', 'SI']
+    assert df['incentivo_coins'].tolist() == [0, 100, 200, 300]
+    assert df['incentivo_paypal'].tolist() == [0, 10.0, 20.0, 30.0]
+
+def test_nivel1_tabla3_paga_con_columna_de_nivel_3(datos):
+    df = evaluar(datos, [fila(), fila(dias=3)], config={'A001': {'nivel1_tabla3': True}})
+    assert df['nivel_original'].tolist() == [1, 0]
+    assert df['nivel'].tolist() == [3, 0]
+    assert df['incentivo_coins'].tolist() == [300, 0]
+    assert df['incentivo_paypal'].tolist() == [30.0, 0]
+
+def test_sin_regalo_cumple_pero_no_cobra(datos):
+    df = evaluar(datos, [fila(contrato='V1', dias=20, horas=40)], sin_regalo={'V1'})
+    assert df['cumple'].tolist() == ['SI']
+    assert df['incentivo_coins'].tolist() == [0]
+    assert df['incentivo_paypal'].tolist() == [0]
+
+def test_tabla_propia_no_se_adivina(datos):
+    df = evaluar(datos, [fila(contrato='V2'), fila(contrato='V2', dias=1)], tabla_propia={'V2'})
+    assert df['cumple'].tolist() == ['SI', 'NO']
+    assert np.isnan(df['incentivo_coins'].iloc[0]) and np.isnan(df['incentivo_paypal'].iloc[0])
+    assert df['incentivo_coins'].iloc[1] == 0
+
+def test_minimo_vertex_arrastra_niveles_superiores(datos):
+    df = evaluar(datos, [fila(contrato='V3', dias=7, horas=15), fila(contrato='V3', dias=16, horas=32)],
+                 vertex={'V3': (16, 32)})
+    assert df['nivel_original'].tolist() == [0, 2]
+
+def test_tipo_logica_sin_tabla_es_desconocido(datos):
+    df = evaluar(datos, [fila()], config={'A001': {'tipo_logica': 'OTRA_LOGICA'}})
+    assert np.isnan(df['incentivo_coins'].iloc[0])
+
+# ============================================================================
+# EXCEPCIONES DE JUGADOR
+# ============================================================================
+
+@pytest.mark.parametrize('descuento, coins, paypal', [(False, 600, 6.0), (True, 480, 4.8)])
+def test_excepcion_porcentaje_con_descuento_paypal(datos, descuento, coins, paypal):
+    exc = {'1': excepcion(porcentaje=True, pct=5, descuento=descuento)}
+    df = evaluar(datos, [fila(diamantes=12000), fila(id_tiktok='2', diamantes=12000)], excepciones=exc)
+    assert df['incentivo_coins'].tolist() == [coins, 100]
+    assert df['incentivo_paypal'].tolist() == pytest.approx([paypal, 10.0])
+    assert datos.FACTOR_DESCUENTO_PAYPAL == 0.8
+
+def test_excepcion_porcentaje_sin_nivel_no_cobra(datos):
+    exc = {'1': excepcion(porcentaje=True, pct=5, dias=10, horas=20)}
+    df = evaluar(datos, [fila(dias=9, horas=20)], excepciones=exc)
+    assert df['cumple'].tolist() == ['NO']
+    assert df['incentivo_coins'].tolist() == [0]
+    assert df['incentivo_paypal'].tolist() == [0]
+
+@pytest.mark.parametrize('moneda, coins, paypal', [('coins', 100, 0), ('paypal', 0, 10.0), ('ambos', 100, 10.0)])
+def test_excepcion_restringe_moneda(datos, moneda, coins, paypal):
+    df = evaluar(datos, [fila()], excepciones={'1': excepcion(moneda=moneda)})
+    assert df['incentivo_coins'].tolist() == [coins]
+    assert df['incentivo_paypal'].tolist() == [paypal]
+
+def test_excepcion_porcentaje_restringe_moneda(datos):
+    exc = {'1': excepcion(moneda='paypal', porcentaje=True, pct=5, descuento=True)}
+    df = evaluar(datos, [fila(diamantes=12000)], excepciones=exc)
+    assert df['incentivo_coins'].tolist() == [0]
+    assert df['incentivo_paypal'].tolist() == pytest.approx([4.8])
+
+def test_pagar_directo_con_reglas_resueltas(datos):
+    motor = datos.MotorReglas({'A001': {'nivel1_tabla3': True}}, reglas())
+    r = motor.resolver(pd.DataFrame([fila(), fila(contrato='Z999')]))
+    coins, paypal, nivel_pago = datos.MotorReglas.pagar(r, INCENTIVOS, [12000, 12000], np.array([1, 1]))
+    assert nivel_pago.tolist() == [3, 1]
+    assert coins.tolist() == [300, 100]
+    assert paypal.tolist() == [30.0, 10.0]
+
+# ============================================================================
+# LECTURA Y COMPILACIÓN DE REGLAS
+# ============================================================================
+
+def test_compilar_reglas_filtra_excepciones_no_vigentes(datos):
+    filas = {
+        'incentivos_custom_vertex': [
+            {'codigo': 'v1', 'sin_regalo': True},
+            {'codigo': 'V2', 'usa_tabla_propia': True},
+            {'codigo': 'V3', 'dias_min': 10, 'horas_min': 20},
+        ],
+        'excepciones_calculo_jugador': [
+            {'id_tiktok': '1', 'moneda_regalo': 'Coins', 'tipo_pago': 'porcentaje', 'regalo_pct': 5,
+             'aplica_descuento_paypal': True},
+            {'id_tiktok': '2', 'moneda_regalo': 'paypal', 'activo_desde': '2026-10-01'},
+            {'id_tiktok': '3', 'moneda_regalo': None},
+        ],
+    }
+    compiladas = datos.compilar_reglas_calculo(filas, '2026-09-15')
+    assert compiladas['sin_regalo'] == {'V1'}
+    assert compiladas['tabla_propia'] == {'V2'}
+    assert compiladas['vertex'] == {'V3': (10, 20)}
+    assert list(compiladas['excepciones']) == ['1']
+    assert compiladas['excepciones']['1']['moneda'] == 'coins'
+    assert compiladas['excepciones']['1']['descuento'] is True
+
+def test_error_de_lectura_se_propaga_y_no_queda_en_cache(datos, db, monkeypatch):
+    db.tablas['excepciones_calculo_jugador'] = [
+        {'id_tiktok': '1', 'moneda_regalo': 'paypal', 'tipo_pago': 'porcentaje', 'regalo_pct': 5},
+    ]
+    tabla_original = db.table
+
+    def tabla_con_fallo(nombre):
+        if nombre == 'excepciones_calculo_jugador':
+            raise ConnectionError('supabase caído')
+        return tabla_original(nombre)
+
+    # Periodo propio: otros tests ya compilaron los motores de los cortes demo
+    monkeypatch.setattr(db, 'table', tabla_con_fallo)
+    with pytest.raises(ConnectionError):
+        datos.leer_reglas_calculo()
+    with pytest.raises(ConnectionError):
+        datos.obtener_motor_reglas('2026-09-30')
+
+    monkeypatch.setattr(db, 'table', tabla_original)
+    motor = datos.obtener_motor_reglas('2026-09-30')
+    assert list(motor.excepciones) == ['1']
@@ -0,0 +1,34 @@
+# ============================================================================
+# test_periodos.py - periodos disponibles: RPC o respaldo por páginas
+# ============================================================================
+
+import supabase_falso
+
+def cargar(datos):
+    return datos.ejecutar_async(datos.aobtener_periodos_disponibles())
+
+def esperado(datos, db):
+    return datos.filtrar_fechas_inteligente(list({r['fecha_datos'] for r in db.tablas['usuarios_tiktok']}))
+
+def consultas(db, tabla):
+    return db.consultas_por_tabla.get(tabla, 0)
+
+def test_respaldo_ve_todos_los_cortes_y_para_en_la_pagina_corta(datos, db, monkeypatch):
+    # Páginas más chicas que un corte: el respaldo anterior (10 lotes fijos) perdía los más viejos
+    monkeypatch.setattr(datos, 'PERIODOS_LOTE', 7)
+    antes = consultas(db, 'usuarios_tiktok')
+    assert cargar(datos) == esperado(datos, db)
+    # Una página por corte (cada corte tiene más de 7 filas) y la corta del final
+    assert consultas(db, 'usuarios_tiktok') - antes == len(supabase_falso.FECHAS_DEMO) + 1
+
+def test_una_sola_pagina_si_cabe(datos, db):
+    antes = consultas(db, 'usuarios_tiktok')
+    assert cargar(datos) == esperado(datos, db)
+    assert consultas(db, 'usuarios_tiktok') - antes == 1
+
+def test_prefiere_la_rpc(datos, db, monkeypatch):
+    monkeypatch.setitem(db.rpcs, 'obtener_fechas_disponibles',
+                        supabase_falso.RPCS_MIGRACIONES['obtener_fechas_disponibles'])
+    antes = consultas(db, 'usuarios_tiktok')
+    assert cargar(datos) == esperado(datos, db)
+    assert consultas(db, 'usuarios_tiktok') == antes
@@ -0,0 +1,46 @@
+# ============================================================================
+# test_versiones.py - sondeo de versión de tablas (invalidación de caché)
+# ============================================================================
+
+import pytest
+
+@pytest.fixture
+def sondeo_limpio(datos):
+    datos._leer_versiones_tablas.clear()
+    datos._sondear_version_tabla.clear()
+    yield
+    datos._leer_versiones_tablas.clear()
+    datos._sondear_version_tabla.clear()
+
+def test_respaldo_por_error_no_queda_en_cache(datos, db, monkeypatch, sondeo_limpio):
+    tabla_original = db.table
+
+    def tabla_con_fallo(nombre):
+        if nombre == 'usuarios_tiktok':
+            raise ConnectionError('supabase caído')
+        return tabla_original(nombre)
+
+    monkeypatch.setattr(db, 'table', tabla_con_fallo)
+    assert datos.obtener_version_tabla('usuarios_tiktok').startswith('ttl-')
+
+    monkeypatch.setattr(db, 'table', tabla_original)
+    version = datos.obtener_version_tabla('usuarios_tiktok')
+    assert not version.startswith('ttl-')
+    assert version.endswith(max(f['fecha_datos'] for f in db.tablas['usuarios_tiktok']))
+
+def test_version_tablas_ve_un_update_en_sitio(datos, db, monkeypatch, sondeo_limpio):
+    import supabase_falso
+    monkeypatch.setitem(db.rpcs, 'obtener_versiones_tablas', supabase_falso.RPCS_MIGRACIONES['obtener_versiones_tablas'])
+    monkeypatch.setattr(datos, 'verificar_rutas_rapidas', lambda: {'faltan_rpc': [], 'pendientes': []})
+
+    antes = datos.obtener_version_tabla('usuarios_tiktok')
+    assert antes.startswith('v')
+
+    # Mismo conteo y misma fecha máxima: solo cambia el contenido
+    fila = db.tablas['usuarios_tiktok'][0]
+    db.table('usuarios_tiktok').update({'diamantes': fila['diamantes']}).eq('id', fila['id']).execute()
+    assert datos.obtener_version_tabla('usuarios_tiktok') == antes   # sondeo reutilizado 30 s
+
+    datos._leer_versiones_tablas.clear()
+    datos._sondear_version_tabla.clear()
+    assert datos.obtener_version_tabla('usuarios_tiktok') != antes
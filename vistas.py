@@ -0,0 +1,418 @@
+# ============================================================================
+# vistas.py - Paneles de Streamlit sobre la capa de datos
+# Estado del planificador, cachés, migraciones y precalentador (panel admin),
+# frescura de la última copia, búsqueda, conciliación e histórico. La lógica
+# está en capa_datos.py; aquí solo se dibuja.
+# ============================================================================
+
+import streamlit as st
+import pandas as pd
+import time
+from datetime import datetime
+import plotly.graph_objects as go
+
+from capa_datos import (
+    SUPABASE_TASA_MAX, SUPABASE_RAFAGA, SUPABASE_MAX_EN_VUELO, NOMBRES_PRIORIDAD, obtener_planificador,
+    resumen_caches_acotadas, VERSION_SONDEO_TTL, verificar_rutas_rapidas, migraciones_locales,
+    obtener_mes_español, formatear_fecha_español, obtener_periodos_disponibles,
+    indexar_corte, buscar_jugadores, obtener_precalentador, PRECALENTADOR_INTERVALO, estadisticas_precarga,
+    conciliar_periodo, ESTADOS_SIN_DIFERENCIA, obtener_almacen, sincronizar_almacen_en_fondo, ALMACEN_MESES,
+)
+
+# ============================================================================
+# PANEL ADMIN: PLANIFICADOR, CACHÉS Y MIGRACIONES
+# ============================================================================
+
+def mostrar_estado_planificador():
+    """Bloque de estado del planificador para el panel admin"""
+    estado = obtener_planificador().resumen()
+    stats = estado['stats']
+
+    st.markdown("### 🚦 Planificador de Consultas")
+    st.caption(f"{SUPABASE_TASA_MAX:g} consultas/s | ráfaga {SUPABASE_RAFAGA} | máx. {SUPABASE_MAX_EN_VUELO} en vuelo")
+
+    col1, col2, col3, col4 = st.columns(4)
+
+    with col1:
+        st.metric("✈️ En vuelo", estado['en_vuelo'])
+
+    with col2:
+        st.metric("⏳ En cola", estado['en_cola'])
+
+    with col3:
+        st.metric("🪙 Fichas", f"{estado['fichas']:.0f}/{SUPABASE_RAFAGA}")
+
+    with col4:
+        st.metric("🛑 Límites 429/503", stats['limitadas'])
+
+    filas = []
+    for prioridad, nombre in NOMBRES_PRIORIDAD.items():
+        concedidas = stats['concedidas'][prioridad]
+        filas.append({
+            'Carril': nombre,
+            'Consultas': concedidas,
+            'Espera media (ms)': round(stats['espera_total'][prioridad] / concedidas * 1000, 1) if concedidas else 0.0,
+            'Espera máx (ms)': round(stats['espera_max'][prioridad] * 1000, 1),
+        })
+    st.dataframe(pd.DataFrame(filas), use_container_width=True, hide_index=True)
+
+    if estado['pausa'] > 0:
+        st.warning(f"⏸️ En pausa por límite de tasa: {estado['pausa']:.1f}s")
+    if stats['ultimo_limite']:
+        st.caption(f"Último límite: {stats['ultimo_limite']:%Y-%m-%d %H:%M:%S} | Reintentos: {stats['reintentos']}")
+
+def mostrar_estado_caches_datos():
+    """Bloque de contadores por espacio de la caché de datos para el panel admin"""
+    resumenes = resumen_caches_acotadas()
+
+    st.markdown("### 🗄️ Caché de Datos")
+
+    if not resumenes:
+        st.caption("Sin entradas todavía")
+        return
+
+    aciertos = sum(r['aciertos'] for r in resumenes)
+    fallos = sum(r['fallos'] for r in resumenes)
+
+    col1, col2, col3 = st.columns(3)
+
+    with col1:
+        st.metric("📦 Entradas", f"{sum(r['entradas'] for r in resumenes):,}")
+
+    with col2:
+        st.metric("💾 Memoria", f"{sum(r['bytes'] for r in resumenes) / (1024 * 1024):.1f} MB")
+
+    with col3:
+        st.metric("🎯 Aciertos", f"{aciertos / (aciertos + fallos):.0%}" if aciertos + fallos else "—")
+
+    filas = []
+    for r in resumenes:
+        total = r['aciertos'] + r['fallos']
+        filas.append({
+            'Espacio': r['espacio'],
+            'Entradas': f"{r['entradas']}/{r['max_entradas']}",
+            'MB': f"{r['bytes'] / (1024 * 1024):.1f}/{r['max_bytes'] / (1024 * 1024):.0f}",
+            'Aciertos': r['aciertos'],
+            'Fallos': r['fallos'],
+            '% Acierto': f"{r['aciertos'] / total:.0%}" if total else "—",
+            'Desalojos': r['desalojos'],
+            'Expirados': r['expirados'],
+            'TTL (s)': f"{r['ttl']:.0f}" if r['ttl'] else '—',
+        })
+    st.dataframe(pd.DataFrame(filas), use_container_width=True, hide_index=True)
+    st.caption("Límites por espacio con CACHE_<ESPACIO>_ENTRADAS / CACHE_<ESPACIO>_MB")
+
+def mostrar_estado_rutas_rapidas():
+    """Bloque del panel admin: RPC y migraciones que faltan en la base"""
+    estado = verificar_rutas_rapidas()
+
+    st.markdown("### 🗃️ Migraciones de la Base")
+
+    if not estado['faltan_rpc'] and not estado['pendientes']:
+        st.success(f"✅ Todas las migraciones aplicadas ({len(migraciones_locales())})")
+    else:
+        if estado['faltan_rpc']:
+            st.warning(f"⚠️ RPC ausentes: {', '.join(estado['faltan_rpc'])}. "
+                       f"La app usa los respaldos paginados (más lentos).")
+        if estado['pendientes']:
+            st.warning(f"⚠️ Migraciones pendientes: {', '.join(estado['pendientes'])}")
+        st.caption("Aplica los archivos de migraciones/ en orden (SQL Editor de Supabase o "
+                   "`python verificar_migraciones.py --aplicar`)")
+
+    st.caption(f"Revisado: {estado['revisado'].strftime('%Y-%m-%d %H:%M:%S')}")
+    if st.button("🔄 Revisar de nuevo", key="revisar_migraciones"):
+        verificar_rutas_rapidas.clear()
+        st.rerun()
+
+# ============================================================================
+# FRESCURA DE LA ÚLTIMA COPIA (stale-while-revalidate)
+# ============================================================================
+
+def _hace(momento):
+    """'hace 5 s' / 'hace 3 min' / 'hace 2 h' / 'hace 1 d'"""
+    segundos = max(0, int((datetime.now() - momento).total_seconds()))
+    for unidad, tamano in (('d', 86400), ('h', 3600), ('min', 60)):
+        if segundos >= tamano:
+            return f"hace {segundos // tamano} {unidad}"
+    return f"hace {segundos} s"
+
+def mostrar_frescura(frescura):
+    """Insignia de frescura de los datos mostrados (y aviso si la fuente falló)"""
+    if frescura['estado'] == 'sin_conexion':
+        st.error(f"❌ No se pudo conectar con la base de datos: {frescura['error']}")
+        if st.button("🔄 Reintentar", key="reintentar_datos"):
+            st.rerun()
+        st.stop()
+
+    actualizado = frescura['actualizado']
+    if frescura['estado'] == 'desactualizado':
+        st.warning(
+            f"⚠️ La base de datos no responde. Mostrando la última copia buena "
+            f"({actualizado:%d/%m/%Y %H:%M}, {_hace(actualizado)})."
+        )
+    elif frescura['estado'] == 'actualizando':
+        st.caption(f"🔄 Datos de {_hace(actualizado)} · actualizando en segundo plano")
+    else:
+        st.caption(f"🟢 Datos al día · consultados {_hace(actualizado)}")
+
+# ============================================================================
+# BÚSQUEDA DE JUGADORES
+# ============================================================================
+
+def mostrar_busqueda_jugadores(contrato, periodo, df):
+    """Caja de búsqueda del panel agente (usuario actual o nombres anteriores)"""
+    indice = indexar_corte(contrato, periodo, df)
+    if indice['error']:
+        st.caption(f"⚠️ Búsqueda sin nombres históricos: {indice['error']}")
+
+    consulta = st.text_input(
+        "🔎 Buscar jugador",
+        placeholder="Usuario actual o anterior",
+        key="busqueda_agente"
+    )
+
+    if not consulta.strip():
+        return
+
+    resultados = buscar_jugadores(consulta, indice)
+    if not resultados:
+        st.info(f"ℹ️ Sin coincidencias para '{consulta}'")
+        return
+
+    df_res = pd.DataFrame(resultados, columns=['id_tiktok', 'Coincide con', 'Similitud'])
+    columnas = [c for c in ['id_tiktok', 'usuario', 'dias', 'diamantes', 'nivel', 'cumple'] if c in df.columns]
+    df_res = df_res.merge(
+        df[columnas].assign(id_tiktok=df['id_tiktok'].astype(str)).drop_duplicates('id_tiktok'),
+        on='id_tiktok', how='left'
+    ).rename(columns={'usuario': 'Usuario', 'dias': 'Días', 'diamantes': 'Diamantes', 'nivel': 'Nivel', 'cumple': 'Cumple'})
+
+    st.caption(f"🔎 {len(df_res)} coincidencias")
+    st.dataframe(
+        df_res[['Usuario', 'Coincide con', 'Similitud'] + [c for c in ['Días', 'Diamantes', 'Nivel', 'Cumple'] if c in df_res.columns]],
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            'Similitud': st.column_config.ProgressColumn('Similitud', min_value=0, max_value=1, format="%.2f"),
+            'Diamantes': st.column_config.NumberColumn('Diamantes', format="%d"),
+        }
+    )
+
+# ============================================================================
+# PRECALENTADOR DE CACHÉ
+# ============================================================================
+
+def mostrar_estado_precalentador():
+    """Bloque de estado del precalentador para el panel admin"""
+    estado = obtener_precalentador()
+
+    with estado['lock']:
+        copia = {k: v for k, v in estado.items() if k not in ('lock', 'forzar')}
+        copia['errores'] = list(estado['errores'])
+
+    st.markdown("### 🔥 Precalentamiento de Caché")
+
+    col1, col2, col3 = st.columns(3)
+
+    with col1:
+        st.metric("📅 Última fecha detectada", copia['ultima_fecha'] or "—")
+
+    with col2:
+        st.metric("🏢 Contratos", f"{copia['completados']}/{copia['total']}")
+
+    with col3:
+        st.metric("⚙️ Estado", "Precalentando" if copia['en_curso'] else "En espera")
+
+    if copia['en_curso'] and copia['total']:
+        st.progress(copia['completados'] / copia['total'], text=f"Periodo {copia['periodo']}")
+
+    if copia['fin'] and copia['inicio']:
+        duracion = (copia['fin'] - copia['inicio']).total_seconds()
+        st.caption(f"✅ Última corrida: periodo {copia['periodo']} | {copia['fin']:%Y-%m-%d %H:%M:%S} | {duracion:.1f}s")
+
+    if copia['ultimo_sondeo']:
+        st.caption(f"🔎 Último sondeo: {copia['ultimo_sondeo']:%Y-%m-%d %H:%M:%S} (cada {PRECALENTADOR_INTERVALO}s)")
+
+    if copia['error_sondeo']:
+        st.error(f"❌ Error en sondeo: {copia['error_sondeo']}")
+
+    if copia['errores']:
+        with st.expander(f"⚠️ {len(copia['errores'])} contratos con error"):
+            for err in copia['errores']:
+                st.text(err)
+
+    stats, en_curso = estadisticas_precarga()
+    st.caption(
+        f"🔮 Precarga de periodos vecinos: {stats['lanzadas']} lanzadas ({en_curso} en curso) · "
+        f"{stats['con_copia']} ya con copia · omitidas {stats['sin_cupo']} sin cupo / "
+        f"{stats['sin_memoria']} sin memoria · {stats['errores']} errores"
+    )
+
+    if st.button("🔥 Precalentar ahora", disabled=copia['en_curso']):
+        estado['forzar'].set()
+        st.success("✅ Precalentamiento solicitado")
+
+# ============================================================================
+# CONCILIACIÓN DE PAGOS
+# ============================================================================
+
+def mostrar_conciliacion():
+    """Reporte de conciliación para el panel admin"""
+    st.markdown("### 🧮 Conciliación de Pagos")
+    st.caption("Compara los incentivos calculados por la app contra reportes_contratos y resumen_contratos")
+
+    periodos = obtener_periodos_disponibles()
+    if not periodos:
+        st.warning("⚠️ No hay periodos disponibles")
+        return
+
+    periodo = st.selectbox(
+        "📅 Periodo",
+        periodos,
+        format_func=formatear_fecha_español,
+        key="conciliacion_periodo"
+    )
+
+    # El periodo conciliado vive en la sesión: las descargas CSV provocan un
+    # rerun y sin esto el reporte desaparecía (el resultado sale de caché)
+    if st.button("🧮 Conciliar periodo", type="primary"):
+        st.session_state['conciliacion_conciliado'] = periodo
+    if st.session_state.get('conciliacion_conciliado') != periodo:
+        return
+
+    try:
+        with st.spinner("Conciliando contratos..."):
+            resultado = conciliar_periodo(periodo)
+    except Exception as e:
+        st.error(f"❌ Error al conciliar: {str(e)}")
+        return
+
+    filas = resultado['filas']
+    totales = resultado['contratos']
+    con_diferencia = filas[~filas['estado'].isin(ESTADOS_SIN_DIFERENCIA)]
+    sin_regla = int(filas['estado'].eq('SIN_REGLA').sum())
+
+    col1, col2, col3, col4 = st.columns(4)
+
+    with col1:
+        st.metric("🏢 Contratos", len(totales))
+
+    with col2:
+        st.metric("⚠️ Contratos con diferencia", int((~totales['estado'].isin(ESTADOS_SIN_DIFERENCIA)).sum()))
+
+    with col3:
+        st.metric("👥 Usuarios revisados", f"{len(filas):,}")
+
+    with col4:
+        st.metric("❌ Usuarios con diferencia", f"{len(con_diferencia):,}")
+
+    if con_diferencia.empty and totales['estado'].isin(ESTADOS_SIN_DIFERENCIA).all():
+        st.success("✅ Todo cuadra para este periodo")
+    if sin_regla:
+        st.info(f"ℹ️ {sin_regla:,} usuarios sin regla de pago conocida en la app (tabla propia Vertex o "
+                f"tipo_logica sin tabla): no se comparan y quedan fuera de los totales")
+
+    st.markdown("#### 🏢 Totales por contrato")
+    st.dataframe(totales, use_container_width=True, hide_index=True)
+
+    st.markdown("#### 👤 Usuarios con diferencia")
+    st.dataframe(con_diferencia, use_container_width=True, hide_index=True, height=400)
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.download_button(
+            label="📥 Descargar Totales CSV",
+            data=totales.to_csv(index=False).encode('utf-8'),
+            file_name=f"conciliacion_contratos_{periodo}.csv",
+            mime="text/csv"
+        )
+
+    with col2:
+        st.download_button(
+            label="📥 Descargar Diferencias CSV",
+            data=con_diferencia.to_csv(index=False).encode('utf-8'),
+            file_name=f"conciliacion_usuarios_{periodo}.csv",
+            mime="text/csv"
+        )
+
+# ============================================================================
+# ALMACÉN ANALÍTICO
+# ============================================================================
+
+def mostrar_historico_almacen():
+    """Bloque del Dashboard admin: agregados de todo el historial sobre la copia local"""
+    st.markdown("### 📈 Histórico (almacén local)")
+    
+    estado = obtener_almacen()
+    almacen = estado['almacen']
+    if almacen is None:
+        st.info(f"ℹ️ Almacén analítico no disponible: {estado['error']}")
+        return
+    
+    # Cada visita revisa versiones (sondeo barato); solo se copian tablas con cambios
+    if estado['ultima'] is None or (datetime.now() - estado['ultima']).total_seconds() >= VERSION_SONDEO_TTL:
+        sincronizar_almacen_en_fondo()
+    
+    with estado['lock']:
+        en_curso, resultados = estado['en_curso'], list(estado['resultados'])
+    
+    for r in resultados:
+        if r['estado'] == 'error':
+            st.warning(f"⚠️ No se pudo sincronizar {r['tabla']}: {r['error']}")
+    
+    presentes = almacen.tablas_presentes()
+    if 'usuarios_tiktok' not in presentes:
+        st.info("🔄 Copiando el historial desde Supabase (primera sincronización)..." if en_curso
+                else "ℹ️ El almacén aún no tiene datos")
+        return
+    
+    control = almacen.estado()
+    hasta = control.set_index('tabla')['marca'].get('usuarios_tiktok')
+    st.caption(
+        f"🦆 {int(control['filas'].sum()):,} filas hasta {hasta:%d/%m/%Y}"
+        f"{' · 🔄 sincronizando' if en_curso else ''}"
+    )
+    
+    meses = st.selectbox("🗓️ Meses", ALMACEN_MESES, index=1, key="almacen_meses")
+    
+    inicio = time.perf_counter()
+    agencias = almacen.top_agencias(meses)
+    tendencia = almacen.tendencia_cumplimiento(meses) if 'resumen_contratos' in presentes else pd.DataFrame()
+    ms = (time.perf_counter() - inicio) * 1000
+    
+    st.markdown(f"#### 🏢 Top agencias ({meses} meses)")
+    st.dataframe(
+        agencias.rename(columns={
+            'agencia': 'Agencia', 'contratos': 'Contratos', 'jugadores': 'Jugadores', 'meses': 'Meses',
+            'diamantes': 'Diamantes', 'diamantes_mes': 'Diamantes / mes',
+        }),
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            'Diamantes': st.column_config.NumberColumn('Diamantes', format="%d"),
+            'Diamantes / mes': st.column_config.NumberColumn('Diamantes / mes', format="%d"),
+        }
+    )
+    
+    if not tendencia.empty:
+        st.markdown("#### ✅ Tendencia de cumplimiento")
+        meses_txt = [obtener_mes_español(str(m)[:10]) for m in tendencia['mes']]
+        
+        fig = go.Figure()
+        fig.add_trace(go.Bar(x=meses_txt, y=tendencia['cumplen'], name='Cumplen', marker_color='#00f2ea'))
+        fig.add_trace(go.Scatter(x=meses_txt, y=tendencia['tasa_cumple'] * 100, name='% cumple',
+                                 yaxis='y2', mode='lines+markers', line=dict(color='#fe2c55')))
+        fig.update_layout(
+            template="plotly_dark",
+            height=380,
+            yaxis=dict(title='Usuarios'),
+            yaxis2=dict(title='% cumple', overlaying='y', side='right', rangemode='tozero'),
+            legend=dict(orientation='h'),
+        )
+        st.plotly_chart(fig, use_container_width=True)
+    
+    st.caption(f"⚡ Consultas locales en {ms:.0f} ms")
+    
+    if st.button("🔄 Reconstruir almacén", disabled=en_curso, key="almacen_reconstruir"):
+        sincronizar_almacen_en_fondo(completo=True)
+        st.success("✅ Reconstrucción en segundo plano")